@@ -0,0 +1,279 @@
+# array_state.py
+import numpy as np
+from environment import Taxi, Request, State
+
+# taxi status codes
+IDLE = 0
+EN_ROUTE = 1
+OCCUPIED = 2
+STATUS_NAMES = ("idle", "en_route_to_pickup", "occupied")
+STATUS_CODES = {name: code for code, name in enumerate(STATUS_NAMES)}
+
+# action codes
+ACT_IDLE = 0
+ACT_ASSIGN = 1
+ACT_MOVE = 2
+ACTION_CODES = {"idle": ACT_IDLE, "assign": ACT_ASSIGN, "move": ACT_MOVE}
+
+
+class ArrayState:
+    # structure-of-arrays version of State
+    # taxis are indexed by taxi id, requests live in a table whose rows are
+    # either still queued (req_active) or referenced by a taxi (taxi_request)
+    def __init__(self, num_taxis, num_requests=0, time=0, traffic_level=1.0):
+        self.taxi_pos = np.zeros((num_taxis, 2), dtype=np.int64)
+        self.taxi_status = np.zeros(num_taxis, dtype=np.int8)
+        self.taxi_remaining = np.zeros(num_taxis, dtype=np.int64)
+        self.taxi_dest = np.full((num_taxis, 2), -1, dtype=np.int64)  # -1 = no destination
+        self.taxi_request = np.full(num_taxis, -1, dtype=np.int64)  # row in request table
+
+        self.req_id = np.zeros(num_requests, dtype=np.int64)
+        self.req_origin = np.zeros((num_requests, 2), dtype=np.int64)
+        self.req_dest = np.zeros((num_requests, 2), dtype=np.int64)
+        self.req_arrival = np.zeros(num_requests, dtype=np.int64)
+        self.req_wait = np.zeros(num_requests, dtype=np.int64)
+        self.req_cancelled = np.zeros(num_requests, dtype=bool)
+        self.req_active = np.zeros(num_requests, dtype=bool)
+
+        self.time = time
+        self.traffic_level = traffic_level
+
+    @property
+    def num_taxis(self):
+        return len(self.taxi_status)
+
+    @property
+    def num_rows(self):
+        return len(self.req_id)
+
+    def queued_rows(self):
+        # rows of active requests in queue order
+        return np.flatnonzero(self.req_active)
+
+    def copy(self):
+        new = ArrayState.__new__(ArrayState)
+        for name, value in self.__dict__.items():
+            setattr(new, name, value.copy() if isinstance(value, np.ndarray) else value)
+        return new
+
+    def append_requests(self, ids, origins, destinations, arrival, active=True):
+        n = len(ids)
+        if n == 0:
+            return
+        self.req_id = np.concatenate([self.req_id, np.asarray(ids, dtype=np.int64)])
+        self.req_origin = np.concatenate([self.req_origin, np.asarray(origins, dtype=np.int64).reshape(n, 2)])
+        self.req_dest = np.concatenate([self.req_dest, np.asarray(destinations, dtype=np.int64).reshape(n, 2)])
+        self.req_arrival = np.concatenate([self.req_arrival, np.broadcast_to(np.asarray(arrival, dtype=np.int64), (n,))])
+        self.req_wait = np.concatenate([self.req_wait, np.zeros(n, dtype=np.int64)])
+        self.req_cancelled = np.concatenate([self.req_cancelled, np.zeros(n, dtype=bool)])
+        self.req_active = np.concatenate([self.req_active, np.full(n, active, dtype=bool)])
+
+    def compact(self):
+        # drop rows that are neither queued nor referenced by a taxi
+        keep = self.req_active.copy()
+        assigned = self.taxi_request >= 0
+        keep[self.taxi_request[assigned]] = True
+        if keep.all():
+            return
+        new_index = np.cumsum(keep) - 1
+        self.taxi_request[assigned] = new_index[self.taxi_request[assigned]]
+        for name in ("req_id", "req_origin", "req_dest", "req_arrival", "req_wait", "req_cancelled", "req_active"):
+            setattr(self, name, getattr(self, name)[keep])
+
+    def __repr__(self):
+        return f"ArrayState(time={self.time}, taxis={self.num_taxis}, requests={int(self.req_active.sum())})"
+
+
+def from_state(state):
+    # State -> ArrayState, taxis are expected to be indexed by id like Environment.step assumes
+    arr = ArrayState(len(state.taxis), time=state.time, traffic_level=state.traffic_level)
+
+    rows = {}
+    requests = list(state.requests)
+    extra = []
+    for req in requests:
+        rows[req.id] = len(rows)
+    for taxi in state.taxis:
+        req = taxi.assigned_request
+        if req is not None and req.id not in rows:
+            rows[req.id] = len(rows)
+            extra.append(req)
+
+    table = requests + extra
+    arr.append_requests([r.id for r in table], [r.origin for r in table],
+                        [r.destination for r in table], [r.arrival_time for r in table])
+    if table:
+        arr.req_wait[:] = [r.waiting_time for r in table]
+        arr.req_cancelled[:] = [r.is_cancelled for r in table]
+        arr.req_active[len(requests):] = False
+
+    for taxi in state.taxis:
+        i = taxi.id
+        arr.taxi_pos[i] = taxi.position
+        arr.taxi_status[i] = STATUS_CODES[taxi.status]
+        arr.taxi_remaining[i] = taxi.remaining_travel_time
+        if taxi.destination is not None:
+            arr.taxi_dest[i] = taxi.destination
+        if taxi.assigned_request is not None:
+            arr.taxi_request[i] = rows[taxi.assigned_request.id]
+    return arr
+
+
+def to_state(arr):
+    # ArrayState -> State, taxis and the queue share the same Request objects
+    objects = []
+    for row in range(arr.num_rows):
+        req = Request(int(arr.req_id[row]), tuple(arr.req_origin[row].tolist()),
+                      tuple(arr.req_dest[row].tolist()), int(arr.req_arrival[row]))
+        req.waiting_time = int(arr.req_wait[row])
+        req.is_cancelled = bool(arr.req_cancelled[row])
+        objects.append(req)
+
+    taxis = []
+    for i in range(arr.num_taxis):
+        taxi = Taxi(i, tuple(arr.taxi_pos[i].tolist()))
+        taxi.status = STATUS_NAMES[arr.taxi_status[i]]
+        taxi.remaining_travel_time = int(arr.taxi_remaining[i])
+        if arr.taxi_dest[i, 0] >= 0:
+            taxi.destination = tuple(arr.taxi_dest[i].tolist())
+        if arr.taxi_request[i] >= 0:
+            taxi.assigned_request = objects[arr.taxi_request[i]]
+        taxis.append(taxi)
+
+    requests = [objects[row] for row in arr.queued_rows()]
+    return State(taxis, requests, arr.time, arr.traffic_level)
+
+
+def encode_actions(arr, actions):
+    # list of Action -> (action type, request row, move target) arrays
+    # assign targets missing from the table are appended as inactive rows
+    n = arr.num_taxis
+    act_type = np.zeros(n, dtype=np.int8)
+    act_row = np.full(n, -1, dtype=np.int64)
+    act_target = np.full((n, 2), -1, dtype=np.int64)
+
+    rows = None
+    for action in actions:
+        code = ACTION_CODES.get(action.action_type, ACT_IDLE)
+        act_type[action.taxi_id] = code
+        if code == ACT_ASSIGN and action.target is not None:
+            if rows is None:
+                rows = {rid: row for row, rid in enumerate(arr.req_id.tolist())}
+            req = action.target
+            if req.id not in rows:
+                rows[req.id] = arr.num_rows
+                arr.append_requests([req.id], [req.origin], [req.destination], req.arrival_time, active=False)
+                arr.req_wait[-1] = req.waiting_time
+                arr.req_cancelled[-1] = req.is_cancelled
+            act_row[action.taxi_id] = rows[req.id]
+        elif code == ACT_MOVE and action.target:
+            act_target[action.taxi_id] = action.target
+    return act_type, act_row, act_target
+
+
+def advance(env, arr, act_type, act_row, act_target):
+    # in-place vectorized version of Environment.step
+    # returns (completed, cancelled, picked up) request ids
+    rng = env.np_rng
+    network = env.road_network
+    status = arr.taxi_status
+
+    # process actions
+    idle = status == IDLE
+    assign = idle & (act_type == ACT_ASSIGN) & (act_row >= 0)
+    assign[assign] = ~arr.req_cancelled[act_row[assign]]
+    if assign.any():
+        rows = act_row[assign]
+        status[assign] = EN_ROUTE
+        arr.taxi_request[assign] = rows
+        arr.taxi_dest[assign] = arr.req_origin[rows]
+        arr.taxi_remaining[assign] = network.distances(arr.taxi_pos[assign], arr.req_origin[rows])
+
+    move = idle & (act_type == ACT_MOVE) & (act_target[:, 0] >= 0)
+    if move.any():
+        arr.taxi_dest[move] = act_target[move]
+        arr.taxi_remaining[move] = network.distances(arr.taxi_pos[move], act_target[move])
+
+    # update taxi positions
+    busy = status != IDLE
+    arrived = busy & (arr.taxi_remaining <= 0)
+    driving = busy & ~arrived
+
+    pickup = arrived & (status == EN_ROUTE)
+    dropoff = arrived & (status == OCCUPIED)
+
+    picked_ids = arr.req_id[arr.taxi_request[pickup]]
+    if pickup.any():
+        rows = arr.taxi_request[pickup]
+        arr.taxi_pos[pickup] = arr.req_origin[rows]
+        status[pickup] = OCCUPIED
+        arr.taxi_dest[pickup] = arr.req_dest[rows]
+        arr.taxi_remaining[pickup] = network.distances(arr.req_origin[rows], arr.req_dest[rows])
+        arr.req_active[rows] = False
+
+    completed_ids = arr.req_id[arr.taxi_request[dropoff]]
+    if dropoff.any():
+        arr.taxi_pos[dropoff] = arr.taxi_dest[dropoff]
+        status[dropoff] = IDLE
+        arr.taxi_request[dropoff] = -1
+        arr.taxi_dest[dropoff] = -1
+        arr.taxi_remaining[dropoff] = 0
+
+    if driving.any():
+        arr.taxi_pos[driving] = network.next_positions(arr.taxi_pos[driving], arr.taxi_dest[driving])
+        delayed = rng.random(int(driving.sum())) < arr.traffic_level * 0.1
+        arr.taxi_remaining[driving] += delayed.astype(np.int64) - 1
+
+    # generate new requests
+    count = rng.poisson(env.request_rate * env._demand_multiplier(arr.time))
+    if count > 0:
+        origins = rng.integers(0, env.grid_size, size=(count, 2))
+        destinations = rng.integers(0, env.grid_size, size=(count, 2))
+        same = (origins == destinations).all(axis=1)
+        while same.any():
+            destinations[same] = rng.integers(0, env.grid_size, size=(int(same.sum()), 2))
+            same = (origins == destinations).all(axis=1)
+        ids = np.arange(env.request_counter, env.request_counter + count)
+        env.request_counter += count
+        arr.append_requests(ids, origins, destinations, arr.time)
+
+    # update requests
+    queued = arr.queued_rows()
+    arr.req_wait[queued] += 1
+    cancel_prob = np.minimum(env.cancellation_prob + arr.req_wait[queued] * 0.01, 0.5)
+    cancelled = queued[rng.random(len(queued)) < cancel_prob]
+    arr.req_cancelled[cancelled] = True
+    arr.req_active[cancelled] = False
+    cancelled_ids = arr.req_id[cancelled]
+
+    # update traffic
+    change = rng.uniform(-0.1, 0.1)
+    arr.traffic_level = max(0.8, min(2.0, env._base_traffic(arr.time) + change))
+
+    arr.time += 1
+    arr.compact()
+
+    return completed_ids, cancelled_ids, picked_ids
+
+
+def step_arrays(env, arr, actions):
+    # same contract as Environment.step but on an ArrayState
+    # actions are a list of Action or an encoded (type, row, target) tuple
+    new_arr = arr.copy()
+    if not isinstance(actions, tuple):
+        actions = encode_actions(new_arr, actions)
+
+    completed, cancelled, picked = advance(env, new_arr, *actions)
+
+    env.last_completed_rides = completed.tolist()
+    env.last_cancelled_requests = cancelled.tolist()
+    env.last_picked_up_requests = picked.tolist()
+    idle = new_arr.taxi_status == IDLE
+    env._last_step_info = {
+        "completed_rides": env.last_completed_rides,
+        "cancelled_requests": env.last_cancelled_requests,
+        "picked_up_requests": env.last_picked_up_requests,
+        "moving_taxis": np.flatnonzero(~idle).tolist(),
+        "idle_taxis": np.flatnonzero(idle).tolist()
+    }
+    return new_arr
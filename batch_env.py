@@ -0,0 +1,215 @@
+# batch_env.py
+# N independent episodes advanced in lock-step on (episodes, taxis) and
+# (episodes, max_requests) arrays, with the transition rules of
+# Environment.step and the bookkeeping of experiments.runEpisode
+
+import numpy as np
+from reward import RewardConfiguration
+from environment import Environment
+
+IDLE = 0
+EN_ROUTE = 1
+OCCUPIED = 2
+
+
+class BatchEnvironment:
+    # requests live in max_requests slots per episode, a slot is in use while
+    # the request is queued or a taxi is still serving it; arrivals beyond the
+    # free slots are dropped and counted in overflow
+    def __init__(self, episodes, grid_size=10, num_taxis=3, request_rate=0.3, cancellation_prob=0.05,
+                 max_requests=256, seed=None, road_network=None):
+        self.episodes = episodes
+        self.grid_size = grid_size
+        self.num_taxis = num_taxis
+        self.request_rate = request_rate
+        self.cancellation_prob = cancellation_prob
+        self.max_requests = max_requests
+        self.rng = np.random.default_rng(seed)
+        self.reward_config = RewardConfiguration()
+        # time-of-day schedules and the road network are shared with the object environment
+        self._schedule = Environment(grid_size, num_taxis, request_rate, cancellation_prob,
+                                     road_network=road_network)
+        self.network = self._schedule.road_network
+        self.reset()
+
+    def reset(self):
+        E, T, R = self.episodes, self.num_taxis, self.max_requests
+        self.time = 0
+        self.traffic = np.ones(E)
+
+        self.taxi_pos = self.rng.integers(0, self.grid_size, (E, T, 2))
+        self.taxi_status = np.zeros((E, T), dtype=np.int8)
+        self.taxi_remaining = np.zeros((E, T), dtype=np.int64)
+        self.taxi_dest = np.zeros((E, T, 2), dtype=np.int64)
+        self.taxi_slot = np.full((E, T), -1, dtype=np.int64)
+
+        self.req_origin = np.zeros((E, R, 2), dtype=np.int64)
+        self.req_dest = np.zeros((E, R, 2), dtype=np.int64)
+        self.req_arrival = np.zeros((E, R), dtype=np.int64)
+        self.req_seq = np.zeros((E, R), dtype=np.int64)  # arrival order within the episode
+        self.req_wait = np.zeros((E, R), dtype=np.int64)
+        self.req_active = np.zeros((E, R), dtype=bool)  # in the queue
+        self.req_used = np.zeros((E, R), dtype=bool)  # queued or served by a taxi
+        self.req_seen = np.zeros((E, R), dtype=bool)  # survived its arrival step
+        self.next_seq = np.zeros(E, dtype=np.int64)
+        self.overflow = np.zeros(E, dtype=np.int64)
+
+        # runEpisode / EpisodeHistory accumulators
+        self.wait_sum = np.zeros(E)
+        self.wait_count = np.zeros(E, dtype=np.int64)
+        self.completed = np.zeros(E, dtype=np.int64)
+        self.revenue = np.zeros(E)
+        self.idle_steps = np.zeros((E, T), dtype=np.int64)
+
+    def queue_order(self):
+        # (episodes, max_requests) slot indices, queued slots first in arrival order
+        key = np.where(self.req_active, self.req_seq, np.iinfo(np.int64).max)
+        return np.argsort(key, axis=1, kind="stable"), self.req_active.sum(axis=1)
+
+    def step(self, assign):
+        # assign: (episodes, taxis) request slot per taxi, -1 = idle
+        # returns the (episodes,) step rewards computeStepReward would give
+        E = self.episodes
+        rows = np.arange(E)[:, None]
+        status = self.taxi_status
+        old_pos = self.taxi_pos.copy()
+
+        # process actions
+        assign = np.asarray(assign)
+        valid = (assign >= 0) & (status == IDLE)
+        slot = np.where(valid, assign, 0)
+        valid &= self.req_active[rows, slot]
+        e, t = np.nonzero(valid)
+        s = slot[e, t]
+        status[e, t] = EN_ROUTE
+        self.taxi_slot[e, t] = s
+        self.taxi_dest[e, t] = self.req_origin[e, s]
+        self.taxi_remaining[e, t] = self.network.distances(self.taxi_pos[e, t], self.req_origin[e, s])
+
+        # update taxi positions
+        busy = status != IDLE
+        arrived = busy & (self.taxi_remaining <= 0)
+        driving = busy & ~arrived
+
+        e, t = np.nonzero(arrived & (status == EN_ROUTE))
+        s = self.taxi_slot[e, t]
+        removed = np.zeros((E, self.max_requests), dtype=bool)
+        removed[e, s] = self.req_active[e, s]
+        self.taxi_pos[e, t] = self.req_origin[e, s]
+        status[e, t] = OCCUPIED
+        self.taxi_dest[e, t] = self.req_dest[e, s]
+        self.taxi_remaining[e, t] = self.network.distances(self.req_origin[e, s], self.req_dest[e, s])
+        self.req_active[e, s] = False
+
+        dropoff = arrived & (status == OCCUPIED)
+        dropoff[e, t] = False  # taxis that just picked up
+        completed = dropoff.sum(axis=1)
+        e, t = np.nonzero(dropoff)
+        self.taxi_pos[e, t] = self.taxi_dest[e, t]
+        status[e, t] = IDLE
+        self.taxi_slot[e, t] = -1
+        self.taxi_remaining[e, t] = 0
+
+        e, t = np.nonzero(driving)
+        self.taxi_pos[e, t] = self.network.next_positions(self.taxi_pos[e, t], self.taxi_dest[e, t])
+        delayed = self.rng.random(len(e)) < self.traffic[e] * 0.1
+        self.taxi_remaining[e, t] += delayed.astype(np.int64) - 1
+
+        # generate new requests into free slots
+        rate = self.request_rate * self._schedule._demand_multiplier(self.time)
+        counts = self.rng.poisson(rate, E)
+        free = ~self.req_used
+        rank = np.cumsum(free, axis=1) - 1
+        new = free & (rank < counts[:, None])
+        self.overflow += np.maximum(counts - free.sum(axis=1), 0)
+        e, s = np.nonzero(new)
+        origins = self.rng.integers(0, self.grid_size, (len(e), 2))
+        dests = self.rng.integers(0, self.grid_size, (len(e), 2))
+        same = (origins == dests).all(axis=1)
+        while same.any():
+            dests[same] = self.rng.integers(0, self.grid_size, (int(same.sum()), 2))
+            same = (origins == dests).all(axis=1)
+        self.req_origin[e, s] = origins
+        self.req_dest[e, s] = dests
+        self.req_arrival[e, s] = self.time
+        self.req_seq[e, s] = self.next_seq[e] + rank[e, s]
+        self.next_seq += np.minimum(counts, free.sum(axis=1))
+        self.req_wait[e, s] = 0
+        self.req_active[e, s] = True
+        self.req_used[e, s] = True
+        self.req_seen[e, s] = False
+
+        # update requests
+        self.req_wait[self.req_active] += 1
+        cancel_prob = np.minimum(self.cancellation_prob + self.req_wait * 0.01, 0.5)
+        cancelled = self.req_active & (self.rng.random(self.req_active.shape) < cancel_prob)
+        self.req_active &= ~cancelled
+        removed |= cancelled
+
+        # update traffic
+        base = self._schedule._base_traffic(self.time)
+        self.traffic = np.clip(base + self.rng.uniform(-0.1, 0.1, E), 0.8, 2.0)
+        self.time += 1
+
+        # runEpisode bookkeeping: a request leaving the queue counts as a pickup
+        # when a taxi is serving it afterwards, otherwise as a cancellation;
+        # requests never seen in a state are not in the history
+        served = np.zeros_like(removed)
+        e, t = np.nonzero(self.taxi_slot >= 0)
+        served[e, self.taxi_slot[e, t]] = True
+        resolved = removed & self.req_seen
+        self.wait_sum += np.where(resolved, self.time - self.req_arrival, 0).sum(axis=1)
+        self.wait_count += resolved.sum(axis=1)
+        cancel_count = (resolved & ~served).sum(axis=1)
+        self.req_seen |= self.req_active
+        self.req_used = self.req_active | served
+
+        idle = status == IDLE
+        self.idle_steps += idle
+        self.completed += completed
+        moving = (self.taxi_pos != old_pos).any(axis=2).sum(axis=1)
+
+        cfg = self.reward_config
+        reward = (cfg.profitPerRide * completed - cfg.travelCostPerStep * moving
+                  - cfg.waitPenaltyPerStep * self.req_active.sum(axis=1)
+                  - cfg.cancelPenalty * cancel_count - cfg.idlePenaltyPerStep * idle.sum(axis=1))
+        self.revenue += reward
+        return reward
+
+    def summarized_metrics(self):
+        # one metrics.summarizedMetrics style dict per episode
+        results = []
+        for e in range(self.episodes):
+            ever_idle = self.idle_steps[e] > 0
+            results.append({
+                "avg_wait_time": float(self.wait_sum[e] / self.wait_count[e]) if self.wait_count[e] else 0.0,
+                "avg_idle_time": float(self.idle_steps[e][ever_idle].mean()) if ever_idle.any() else 0.0,
+                "completed_rides": float(self.completed[e]),
+                "total_revenue": float(self.revenue[e])
+            })
+        return results
+
+
+def greedy_batch_actions(benv):
+    # GreedyPolicy for every episode at once: longest waiting request first,
+    # nearest idle taxi, ties to the lowest taxi id; requests already served by
+    # an en-route taxi are still candidates, exactly like GreedyPolicy
+    E = benv.episodes
+    assign = np.full((E, benv.num_taxis), -1, dtype=np.int64)
+    free = benv.taxi_status == IDLE
+    order, queued = benv.queue_order()
+    episodes = np.arange(E)
+
+    for k in range(int(queued.max()) if E else 0):
+        live = (k < queued) & free.any(axis=1)
+        if not live.any():
+            break
+        slot = order[:, k]
+        origin = benv.req_origin[episodes, slot]
+        distance = benv.network.distances(benv.taxi_pos, origin[:, None, :])
+        distance = np.where(free, distance, np.iinfo(np.int64).max)
+        best = distance.argmin(axis=1)
+        e = episodes[live]
+        assign[e, best[live]] = slot[live]
+        free[e, best[live]] = False
+    return assign
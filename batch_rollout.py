@@ -0,0 +1,200 @@
+# batch_rollout.py
+# leaf-parallel MCTS rollouts: K copies of one State advanced together on
+# (rollouts, taxis) and (rollouts, requests) arrays with the transition
+# rules of Environment.step and the reward of Environment.get_reward
+# the arrays are named and laid out like BatchEnvironment's, with one
+# episode per rollout, so its batch policies (greedy_batch_actions) apply
+# request slots are in arrival order and never reused: the arrivals of the
+# whole rollout are drawn up front, which sizes the tables, and each step
+# then takes one batched uniform draw for its delays, cancellations and
+# traffic change
+
+import numpy as np
+from batch_env import IDLE, EN_ROUTE, OCCUPIED, greedy_batch_actions
+
+STATUS_CODES = {"idle": IDLE, "en_route_to_pickup": EN_ROUTE, "occupied": OCCUPIED}
+
+
+class BatchRollout:
+    def __init__(self, env, rollouts, rng=None):
+        self.env = env
+        self.episodes = rollouts
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.cfg = env.reward_config
+        self.network = env.road_network
+
+    def load(self, state, extra_slots=0):
+        # every copy starts as state, with extra_slots free request slots
+        K = self.episodes
+        requests = list(state.requests)
+        table = list(requests)
+        slot_of = {req.id: slot for slot, req in enumerate(table)}
+        for taxi in state.taxis:
+            req = taxi.assigned_request
+            if req is not None and req.id not in slot_of:
+                # served but no longer queued, like from_state's extra rows
+                slot_of[req.id] = len(table)
+                table.append(req)
+
+        n, R, T = len(table), len(table) + extra_slots, len(state.taxis)
+        self.num_taxis = T
+        self.req_origin = np.zeros((K, R, 2), dtype=np.int64)
+        self.req_dest = np.zeros((K, R, 2), dtype=np.int64)
+        self.req_wait = np.zeros((K, R), dtype=np.int64)
+        self.req_active = np.zeros((K, R), dtype=bool)
+        if n:
+            self.req_origin[:, :n] = [req.origin for req in table]
+            self.req_dest[:, :n] = [req.destination for req in table]
+            self.req_wait[:, :n] = [req.waiting_time for req in table]
+            self.req_active[:, :len(requests)] = True
+        self.next_slot = np.full(K, n, dtype=np.int64)
+
+        pos = np.zeros((T, 2), dtype=np.int64)
+        status = np.zeros(T, dtype=np.int8)
+        remaining = np.zeros(T, dtype=np.int64)
+        dest = np.zeros((T, 2), dtype=np.int64)
+        slot = np.full(T, -1, dtype=np.int64)
+        for taxi in state.taxis:
+            i = taxi.id
+            pos[i] = taxi.position
+            status[i] = STATUS_CODES[taxi.status]
+            remaining[i] = taxi.remaining_travel_time
+            if taxi.destination is not None:
+                dest[i] = taxi.destination
+            if taxi.assigned_request is not None:
+                slot[i] = slot_of[taxi.assigned_request.id]
+        self.taxi_pos = np.repeat(pos[None], K, axis=0)
+        self.taxi_status = np.repeat(status[None], K, axis=0)
+        self.taxi_remaining = np.repeat(remaining[None], K, axis=0)
+        self.taxi_dest = np.repeat(dest[None], K, axis=0)
+        self.taxi_slot = np.repeat(slot[None], K, axis=0)
+
+        self.time = state.time
+        self.traffic = np.full(K, state.traffic_level, dtype=np.float64)
+
+    def queue_order(self):
+        # BatchEnvironment.queue_order: queued slots first, in arrival order
+        return np.argsort(~self.req_active, axis=1, kind="stable"), self.req_active.sum(axis=1)
+
+    def run(self, state, policy, depth=15):
+        # rolls every copy out depth steps from state, policy maps the batch
+        # to a (rollouts, taxis) request slot per taxi (-1 = idle); returns
+        # the (rollouts,) total rewards
+        env = self.env
+        rates = [env.request_rate * env._demand_multiplier(state.time + k) for k in range(depth)]
+        arrivals = self.rng.poisson(np.asarray(rates)[:, None], (depth, self.episodes))
+        self.load(state, int(arrivals.sum(axis=0).max()) if depth else 0)
+        self._cells = self.rng.integers(0, env.grid_size, (int(arrivals.sum()), 4))
+        self._next_cell = 0
+
+        total = np.zeros(self.episodes)
+        for k in range(depth):
+            total += self.step(policy(self), arrivals[k])
+        return total
+
+    def step(self, assign, arrivals):
+        # one Environment.step in every copy, arrivals new requests each;
+        # returns the (rollouts,) Environment.get_reward values
+        env = self.env
+        cfg = self.cfg
+        network = self.network
+        K, T = self.taxi_status.shape
+        R = self.req_active.shape[1]
+        rows = np.arange(K)[:, None]
+        status = self.taxi_status
+        u = self.rng.random((K, T + R + 1))
+
+        # process actions
+        assign = np.asarray(assign)
+        valid = (assign >= 0) & (status == IDLE)
+        slot = np.where(valid, assign, 0)
+        valid &= self.req_active[rows, slot]
+        e, t = np.nonzero(valid)
+        s = slot[e, t]
+        status[e, t] = EN_ROUTE
+        self.taxi_slot[e, t] = s
+        self.taxi_dest[e, t] = self.req_origin[e, s]
+        self.taxi_remaining[e, t] = network.distances(self.taxi_pos[e, t], self.req_origin[e, s])
+
+        # update taxi positions
+        busy = status != IDLE
+        arrived = busy & (self.taxi_remaining <= 0)
+        driving = busy & ~arrived
+        dropoff = arrived & (status == OCCUPIED)
+
+        e, t = np.nonzero(arrived & (status == EN_ROUTE))
+        s = self.taxi_slot[e, t]
+        self.taxi_pos[e, t] = self.req_origin[e, s]
+        status[e, t] = OCCUPIED
+        self.taxi_dest[e, t] = self.req_dest[e, s]
+        self.taxi_remaining[e, t] = network.distances(self.req_origin[e, s], self.req_dest[e, s])
+        self.req_active[e, s] = False
+
+        completed = dropoff.sum(axis=1)
+        e, t = np.nonzero(dropoff)
+        self.taxi_pos[e, t] = self.taxi_dest[e, t]
+        status[e, t] = IDLE
+        self.taxi_slot[e, t] = -1
+        self.taxi_remaining[e, t] = 0
+
+        e, t = np.nonzero(driving)
+        if len(e):
+            self.taxi_pos[e, t] = network.next_positions(self.taxi_pos[e, t], self.taxi_dest[e, t])
+            delayed = u[e, t] < self.traffic[e] * 0.1
+            self.taxi_remaining[e, t] += delayed.astype(np.int64) - 1
+
+        # generate new requests into the next free slots
+        cols = np.arange(R)[None, :]
+        start = self.next_slot[:, None]
+        e, s = np.nonzero((cols >= start) & (cols < start + arrivals[:, None]))
+        cells = self._cells[self._next_cell:self._next_cell + len(e)]
+        self._next_cell += len(e)
+        same = (cells[:, :2] == cells[:, 2:]).all(axis=1)
+        while same.any():
+            cells[same, 2:] = self.rng.integers(0, env.grid_size, (int(same.sum()), 2))
+            same = (cells[:, :2] == cells[:, 2:]).all(axis=1)
+        self.req_origin[e, s] = cells[:, :2]
+        self.req_dest[e, s] = cells[:, 2:]
+        self.req_wait[e, s] = 0
+        self.req_active[e, s] = True
+        self.next_slot += arrivals
+
+        # update requests
+        self.req_wait[self.req_active] += 1
+        cancel_prob = np.minimum(env.cancellation_prob + self.req_wait * 0.01, 0.5)
+        cancelled = self.req_active & (u[:, T:T + R] < cancel_prob)
+        self.req_active &= ~cancelled
+
+        # update traffic
+        change = u[:, -1] * 0.2 - 0.1
+        self.traffic = np.clip(env._base_traffic(self.time) + change, 0.8, 2.0)
+        self.time += 1
+
+        moving = (status != IDLE).sum(axis=1)
+        wait_sum = np.where(self.req_active, self.req_wait, 0).sum(axis=1)
+        return (cfg.profitPerRide * completed - cfg.waitPenaltyPerStep * wait_sum
+                - cfg.cancelPenalty * cancelled.sum(axis=1) - cfg.travelCostPerStep * moving
+                - cfg.idlePenaltyPerStep * (T - moving))
+
+
+def random_batch_actions(sim, max_distance=5):
+    # per copy, uniform over the joint actions get_legal_actions would list:
+    # all idle, or one idle taxi assigned to one queued request within
+    # max_distance (taxi by taxi, requests in queue order)
+    K, T = sim.taxi_status.shape
+    R = int(sim.next_slot.max())  # slots past it have not arrived yet
+    distance = sim.network.distances(sim.taxi_pos[:, :, None, :], sim.req_origin[:, None, :R, :])
+    legal = ((sim.taxi_status == IDLE)[:, :, None] & sim.req_active[:, None, :R]
+             & (distance <= max_distance)).reshape(K, T * R)
+    pick = (sim.rng.random(K) * (legal.sum(axis=1) + 1)).astype(np.int64)
+
+    assign = np.full((K, T), -1, dtype=np.int64)
+    e = np.flatnonzero(pick > 0)
+    if len(e):
+        # the pick-th legal pair is where the running count first reaches pick
+        pair = (np.cumsum(legal[e], axis=1) == pick[e, None]).argmax(axis=1)
+        assign[e, pair // R] = pair % R
+    return assign
+
+
+BATCH_ROLLOUT_POLICIES = {"random": random_batch_actions, "greedy": greedy_batch_actions}
@@ -0,0 +1,221 @@
+# benchmarks.py
+# throughput benchmarks for the simulator and the policies:
+#   env_step        Environment.step steps/sec by fleet size and request rate
+#   greedy_latency  GreedyPolicy.selectAction ms per call by queue size
+#   mcts            search iterations/sec and traced bytes per tree node
+#   run_many        experiments.runMany episodes/sec
+# every result is a record {"benchmark", "params", "metric", "value", "unit",
+# "higher_is_better"}; --output saves them as json and --baseline compares
+# against a saved file, exiting with 1 when a metric regressed by more than
+# --tolerance
+#
+#   python benchmarks.py --scale small --output baseline.json
+#   python benchmarks.py --scale small --baseline baseline.json
+#
+# wall time on one core: small ~5 s, medium ~1 min, large ~10 min (env_step
+# and greedy_latency at 5000 taxis take most of it); MCTS runs on its own
+# fleets (MCTS_SCALES) with each search capped at MCTS_TIME_LIMIT seconds
+
+import json
+import platform
+import time
+import tracemalloc
+from environment import Environment, Request, Action
+from greedy_policy import GreedyPolicy, GreedyConfiguration
+from mcts_policy import search, new_search_stats
+from experiments import runMany
+
+# (grid_size, num_taxis) per scale, request rates scale with the fleet
+SCALES = {
+    "small": [(10, 5), (20, 20)],
+    "medium": [(50, 100), (100, 500)],
+    "large": [(100, 1000), (200, 5000)],
+}
+REQUESTS_PER_TAXI = (0.2, 1.0)  # request_rate / num_taxis for env_step
+QUEUE_SIZES = {"small": (10, 100), "medium": (100, 1000), "large": (1000, 10000)}
+# MCTS gets its own (grid_size, num_taxis, action_space): joint search slows
+# to under 3 iterations/sec past ~100 taxis (0.08 at 500), factored stays usable
+MCTS_SCALES = {
+    "small": [(10, 5, "joint"), (20, 20, "joint")],
+    "medium": [(50, 50, "joint"), (50, 100, "factored")],
+    "large": [(100, 200, "factored"), (100, 500, "factored")],
+}
+MCTS_TIME_LIMIT = 2.0  # seconds per timed search, whichever of it and the iterations ends first
+
+
+def record(benchmark, params, metric, value, unit, higher_is_better=True):
+    return {"benchmark": benchmark, "params": params, "metric": metric, "value": value,
+            "unit": unit, "higher_is_better": higher_is_better}
+
+
+def best_time(fn, repeat=5):
+    # fastest of repeat timed calls, in seconds
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_env_step(grid_size, num_taxis, request_rate, steps=200, repeat=5, seed=0):
+    env = Environment(grid_size=grid_size, num_taxis=num_taxis, request_rate=request_rate,
+                      cancellation_prob=0.05, seed=seed)
+    state = env.create_initial_state()
+    idle = [Action(i, "idle") for i in range(num_taxis)]
+    for _ in range(20):  # let the queue fill up
+        state = env.step(state, idle)
+
+    def run():
+        current = state
+        for _ in range(steps):
+            current = env.step(current, idle)
+
+    elapsed = best_time(run, repeat)
+    params = {"grid_size": grid_size, "num_taxis": num_taxis, "request_rate": request_rate}
+    return [record("env_step", params, "steps_per_sec", steps / elapsed, "steps/s")]
+
+
+def bench_greedy(grid_size, num_taxis, queue_size, calls=5, repeat=5, seed=0):
+    env = Environment(grid_size=grid_size, num_taxis=num_taxis, seed=seed)
+    state = env.create_initial_state()
+    rng = env.rng
+    state.requests = [Request(i, (rng.randrange(grid_size), rng.randrange(grid_size)),
+                              (rng.randrange(grid_size), rng.randrange(grid_size)), 0)
+                      for i in range(queue_size)]
+    policy = GreedyPolicy(GreedyConfiguration(), env)
+
+    def run():
+        for _ in range(calls):
+            policy.selectAction(state)
+
+    elapsed = best_time(run, repeat)
+    params = {"grid_size": grid_size, "num_taxis": num_taxis, "queue_size": queue_size}
+    return [record("greedy_latency", params, "ms_per_call", 1000 * elapsed / calls, "ms", False)]
+
+
+def bench_mcts(grid_size, num_taxis, iterations=100, repeat=3, seed=0, action_space="joint",
+               time_limit=MCTS_TIME_LIMIT):
+    env = Environment(grid_size=grid_size, num_taxis=num_taxis, request_rate=0.3 * num_taxis, seed=seed)
+    state = env.create_initial_state()
+    idle = [Action(i, "idle") for i in range(num_taxis)]
+    for _ in range(5):
+        state = env.step(state, idle)
+
+    # best rate over repeat searches, each stops at iterations or time_limit
+    rate = 0.0
+    for _ in range(repeat):
+        stats = new_search_stats()
+        start = time.perf_counter()
+        search(state, env, iterations, time_limit=time_limit, stats=stats, action_space=action_space)
+        rate = max(rate, stats["iterations"] / (time.perf_counter() - start))
+
+    # memory per node: bytes still held by a finished tree
+    stats = new_search_stats()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    root = search(state, env, iterations, time_limit=time_limit, stats=stats, action_space=action_space)
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del root
+
+    params = {"grid_size": grid_size, "num_taxis": num_taxis, "iterations": iterations,
+              "action_space": action_space}
+    return [record("mcts", params, "iterations_per_sec", rate, "iterations/s"),
+            record("mcts", params, "bytes_per_node", held / stats["nodes"], "bytes", False)]
+
+
+def bench_run_many(grid_size, num_taxis, episodes=3, max_steps=50, seed=0):
+    def env_builder():
+        return Environment(grid_size=grid_size, num_taxis=num_taxis, request_rate=0.3 * num_taxis, seed=seed)
+
+    def policy_builder(env):
+        return GreedyPolicy(GreedyConfiguration(), env)
+
+    elapsed = best_time(lambda: runMany(env_builder, policy_builder, episodes, max_steps), 1)
+    params = {"grid_size": grid_size, "num_taxis": num_taxis, "max_steps": max_steps}
+    return [record("run_many", params, "episodes_per_sec", episodes / elapsed, "episodes/s")]
+
+
+def run_suite(scale="small", benchmarks=None, mcts_iterations=100):
+    # all benchmarks of a scale, benchmarks limits them by name
+    selected = benchmarks or ("env_step", "greedy_latency", "mcts", "run_many")
+    results = []
+    for grid_size, num_taxis in SCALES[scale]:
+        if "env_step" in selected:
+            for per_taxi in REQUESTS_PER_TAXI:
+                results += bench_env_step(grid_size, num_taxis, per_taxi * num_taxis)
+        if "greedy_latency" in selected:
+            for queue_size in QUEUE_SIZES[scale]:
+                results += bench_greedy(grid_size, num_taxis, queue_size)
+        if "run_many" in selected:
+            results += bench_run_many(grid_size, num_taxis)
+    if "mcts" in selected:
+        for grid_size, num_taxis, action_space in MCTS_SCALES[scale]:
+            results += bench_mcts(grid_size, num_taxis, mcts_iterations, action_space=action_space)
+    return results
+
+
+def result_key(result):
+    return (result["benchmark"], json.dumps(result["params"], sort_keys=True), result["metric"])
+
+
+def compare(results, baseline, tolerance=0.2):
+    # one row per result found in baseline; change is the relative change,
+    # positive = better whichever direction the metric improves in
+    saved = {result_key(result): result for result in baseline}
+    rows = []
+    for result in results:
+        old = saved.get(result_key(result))
+        if old is None or old["value"] == 0:
+            continue
+        ratio = result["value"] / old["value"]
+        change = ratio - 1 if result["higher_is_better"] else 1 / ratio - 1
+        rows.append({"benchmark": result["benchmark"], "params": result["params"], "metric": result["metric"],
+                     "baseline": old["value"], "value": result["value"], "change": change,
+                     "regressed": change < -tolerance})
+    return rows
+
+
+def save(results, path):
+    # the machine is noted so baselines are only compared on like hardware
+    machine = {"platform": platform.platform(), "python": platform.python_version(),
+               "processor": platform.processor()}
+    with open(path, "w") as f:
+        json.dump({"machine": machine, "results": results}, f, indent=2)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="simulator and policy throughput benchmarks")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--only", nargs="+", choices=["env_step", "greedy_latency", "mcts", "run_many"])
+    parser.add_argument("--mcts-iterations", type=int, default=100)
+    parser.add_argument("--output", help="write the results to this json file")
+    parser.add_argument("--baseline", help="compare against results saved with --output")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown")
+    args = parser.parse_args()
+
+    results = run_suite(args.scale, args.only, args.mcts_iterations)
+    for result in results:
+        params = " ".join(f"{k}={v}" for k, v in result["params"].items())
+        print(f"{result['benchmark']:15s} {params:50s} {result['value']:12.2f} {result['unit']}")
+    if args.output:
+        save(results, args.output)
+
+    if args.baseline:
+        rows = compare(results, load(args.baseline), args.tolerance)
+        print("-" * 30)
+        for row in rows:
+            flag = "REGRESSED" if row["regressed"] else ""
+            params = " ".join(f"{k}={v}" for k, v in row["params"].items())
+            print(f"{row['benchmark']:15s} {params:50s} {row['change']:+8.1%} {flag}")
+        if any(row["regressed"] for row in rows):
+            sys.exit(1)
@@ -0,0 +1,122 @@
+# crn.py
+# common random numbers: every random draw of an episode is sampled up front
+# into a RandomTrace, and a TraceEnvironment replays it, so two policies run
+# on the same trace see the same demand, delays, cancellations and traffic
+# and only differ by what they decide
+
+import numpy as np
+from environment import Environment
+
+
+class RandomTrace:
+    # draws are keyed by what they belong to, not by the order they are made
+    # in, so they stay aligned when policies diverge:
+    #   arrivals by time step, delays by (time step, taxi), cancellations by
+    #   (request, waiting time) with request ids in arrival order
+    def __init__(self, env, horizon, seed=None):
+        rng = np.random.default_rng(seed)
+        size = env.grid_size
+        self.horizon = horizon
+        self.num_taxis = env.num_taxis
+
+        self.start_positions = rng.integers(0, size, (env.num_taxis, 2))
+
+        rates = [env.request_rate * env._demand_multiplier(t) for t in range(horizon)]
+        counts = rng.poisson(rates)
+        total = int(counts.sum())
+        self.first_arrival = np.concatenate([[0], np.cumsum(counts)])  # trips of step t: first[t]:first[t + 1]
+        self.origins = rng.integers(0, size, (total, 2))
+        self.destinations = rng.integers(0, size, (total, 2))
+        same = (self.origins == self.destinations).all(axis=1)
+        while same.any():
+            self.destinations[same] = rng.integers(0, size, (int(same.sum()), 2))
+            same = (self.origins == self.destinations).all(axis=1)
+
+        self.delays = rng.random((horizon, env.num_taxis))
+        self.cancels = rng.random((total, horizon + 1))
+        self.traffic_changes = rng.uniform(-0.1, 0.1, horizon)
+
+    @property
+    def num_requests(self):
+        return len(self.origins)
+
+
+class TraceEnvironment(Environment):
+    # Environment whose draws come from a RandomTrace; past the trace horizon
+    # it falls back to its own generators
+    # request ids are trace rows, so plan with a separate Environment: handing
+    # this one to a planner would let it look ahead into the trace
+    def __init__(self, trace, grid_size=10, num_taxis=3, request_rate=0.3, cancellation_prob=0.05, seed=None):
+        super().__init__(grid_size, num_taxis, request_rate, cancellation_prob, seed)
+        if trace.num_taxis != num_taxis:
+            raise ValueError(f"trace has {trace.num_taxis} taxis, environment {num_taxis}")
+        self.trace = trace
+
+    def create_initial_state(self):
+        self.request_counter = 0
+        return super().create_initial_state()
+
+    def _start_positions(self):
+        return [tuple(p) for p in self.trace.start_positions.tolist()]
+
+    def _traffic_delay(self, taxi, state):
+        if state.time >= self.trace.horizon:
+            return super()._traffic_delay(taxi, state)
+        return self.trace.delays[state.time, taxi.id] < state.traffic_level * 0.1
+
+    def _new_trips(self, time):
+        trace = self.trace
+        if time >= trace.horizon:
+            return super()._new_trips(time)
+        rows = range(trace.first_arrival[time], trace.first_arrival[time + 1])
+        return [(tuple(trace.origins[r].tolist()), tuple(trace.destinations[r].tolist())) for r in rows]
+
+    def _cancels(self, request, waiting_time, cancel_prob):
+        trace = self.trace
+        if request.id >= trace.num_requests or waiting_time > trace.horizon:
+            return super()._cancels(request, waiting_time, cancel_prob)
+        return trace.cancels[request.id, waiting_time] < cancel_prob
+
+    def _cancel_mask(self, requests, waiting_times, cancel_probs):
+        trace = self.trace
+        ids = np.fromiter((request.id for request in requests), dtype=np.int64, count=len(requests))
+        inside = (ids < trace.num_requests) & (waiting_times <= trace.horizon)
+        cancelled = np.zeros(len(requests), dtype=bool)
+        cancelled[inside] = trace.cancels[ids[inside], waiting_times[inside]] < cancel_probs[inside]
+        for index in np.flatnonzero(~inside).tolist():
+            cancelled[index] = super()._cancels(requests[index], int(waiting_times[index]),
+                                                float(cancel_probs[index]))
+        return cancelled
+
+    def _traffic_change(self, time):
+        if time >= self.trace.horizon:
+            return super()._traffic_change(time)
+        return float(self.trace.traffic_changes[time])
+
+
+def paired_differences(a, b, confidence=0.95):
+    # mean of a - b over paired episodes with a student t confidence interval
+    diff = np.asarray(a, dtype=float) - np.asarray(b, dtype=float)
+    n = len(diff)
+    mean = float(diff.mean()) if n else 0.0
+    std = float(diff.std(ddof=1)) if n > 1 else 0.0
+    stderr = std / np.sqrt(n) if n > 1 else float("inf")
+    half = t_quantile((1 + confidence) / 2, n - 1) * stderr if n > 1 else float("inf")
+    return {"n": n, "mean": mean, "std": std, "stderr": stderr,
+            "ci_low": mean - half, "ci_high": mean + half, "confidence": confidence}
+
+
+def t_quantile(p, df):
+    # student t quantile, scipy when installed, otherwise the normal quantile
+    # with the Cornish-Fisher correction terms (within 1% from df = 2 on)
+    try:
+        from scipy.stats import t
+        return float(t.ppf(p, df))
+    except ImportError:
+        pass
+    from statistics import NormalDist
+    z = NormalDist().inv_cdf(p)
+    return (z + (z ** 3 + z) / (4 * df)
+            + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+            + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * df ** 3)
+            + (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / (92160 * df ** 4))
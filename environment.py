@@ -2,14 +2,31 @@
 import random
 import copy
 import numpy as np
+import profiling
 from reward import RewardConfiguration
+from spatial_index import FleetIndex
+from road_network import GridNetwork
+from eta import ETAModel
+from request_queue import RequestQueue
+from zobrist import ZobristHasher
+
+# taxi statuses; plain strings so policies can keep comparing with literals,
+# CPython interns them, so every taxi holds a reference to the same object
+# and == against a literal succeeds on identity
+IDLE = "idle"
+EN_ROUTE_TO_PICKUP = "en_route_to_pickup"
+OCCUPIED = "occupied"
 
 
 class Taxi:
+    # slotted like Request, Action and MCTSNode: no per-instance dict, these
+    # are allocated every step and per search node
+    __slots__ = ("id", "position", "status", "assigned_request", "destination", "remaining_travel_time")
+
     def __init__(self, taxi_id, position):
         self.id = taxi_id
         self.position = position  # (x, y) coordinates on grid
-        self.status = "idle"  
+        self.status = IDLE  
         self.assigned_request = None  
         self.destination = None  
         self.remaining_travel_time = 0  
@@ -18,6 +35,7 @@ class Taxi:
         return f"Taxi(id={self.id}, pos={self.position}, status={self.status})"
 
 class Request:
+    __slots__ = ("id", "origin", "destination", "arrival_time", "waiting_time", "is_cancelled")
 
     def __init__(self, request_id, origin, destination, arrival_time):
         self.id = request_id
@@ -31,18 +49,34 @@ class Request:
         return f"Request(id={self.id}, from={self.origin}, to={self.destination})"
 
 class State:
-   
+    __slots__ = ("taxis", "_requests", "time", "traffic_level", "spatial_index", "zobrist")
+
     def __init__(self, taxis, requests, time, traffic_level = 1.0):
         self.taxis = taxis 
-        self.requests = requests  # active reqs*
+        self.zobrist = None  # state hash, see Environment.state_hash
+        self.requests = requests  # active reqs*, a RequestQueue
         self.time = time  
         self.traffic_level = traffic_level  # 1.0 = normal, >1.0 = congested
+        self.spatial_index = None  # FleetIndex, see Environment.spatial_index
+
+    @property
+    def requests(self):
+        return self._requests
+
+    @requests.setter
+    def requests(self, requests):
+        # any iterable of requests in arrival order
+        if not isinstance(requests, RequestQueue):
+            requests = RequestQueue(requests)
+        self._requests = requests
+        self.zobrist = None
         
     def __repr__(self):
         return f"State(time={self.time}, taxis={len(self.taxis)}, requests={len(self.requests)})"
 
 class Action:
-   
+    __slots__ = ("taxi_id", "action_type", "target")
+
     def __init__(self, taxi_id, action_type, target=None):
         self.taxi_id = taxi_id
         self.action_type = action_type  
@@ -53,24 +87,42 @@ class Action:
 
 class Environment:
     # simulates autonomous taxi dispatch system
-    def __init__(self, grid_size = 10, num_taxis = 3, request_rate = 0.3, cancellation_prob = 0.05):
+    def __init__(self, grid_size = 10, num_taxis = 3, request_rate = 0.3, cancellation_prob = 0.05, seed = None,
+                 demand_trace = None, road_network = None):
        
         self.grid_size = grid_size
         self.num_taxis = num_taxis
         self.request_rate = request_rate
         self.cancellation_prob = cancellation_prob
         self.request_counter = 0  # to generate unique request IDs
+        self.spatial_cell_size = 5
+        # queue length from which _update_requests updates waits and draws
+        # cancellations in bulk from np_rng, None keeps one draw per request
+        self.vector_min_requests = None
+        self.reward_config = RewardConfiguration()
+        self.demand_trace = demand_trace  # traces.DemandTrace replayed instead of sampling arrivals
+        # road_network.GraphNetwork for roads other than the open grid
+        self.road_network = road_network if road_network is not None else GridNetwork(grid_size)
+        self.eta_model = ETAModel(self)  # cached traffic-aware travel time estimates
+        self.state_hasher = ZobristHasher()
+        self.reseed(seed)
 
         self.last_completed_rides = []
         self.last_cancelled_requests = []
         self.last_picked_up_requests = []
+
+        self._owned_taxis = set()
+        self._first_new_request = 0
         
+    def reseed(self, seed):
+        # all randomness of the environment comes from these two generators
+        self.rng = random.Random(seed)
+        self.np_rng = np.random.default_rng(seed)
+
     def create_initial_state(self):
        # initial state w random positions
         taxis = []
-        for i in range(self.num_taxis):
-            position = (random.randint(0, self.grid_size - 1),
-                       random.randint(0, self.grid_size - 1))
+        for i, position in enumerate(self._start_positions()):
             taxis.append(Taxi(taxi_id=i, position=position))
         
         return State(taxis=taxis, requests=[], time=0)
@@ -81,74 +133,144 @@ class Environment:
         self.last_completed_rides = []
         self.last_cancelled_requests = []
         self.last_picked_up_requests = []
+        first_new_id = self.request_counter
+        lap = profiling.laps("env")
 
         new_state = self._copy_state(state)
+        lap("copy_state")
         
         self._process_taxi_actions(new_state, actions)
+        lap("process_taxi_actions")
         
         self._update_taxi_positions(new_state)
+        lap("update_taxi_positions")
 
         self._generate_new_requests(new_state)
+        lap("generate_new_requests")
 
         self._update_requests(new_state)
+        lap("update_requests")
         
         self._update_traffic(new_state)
+        lap("update_traffic")
         
         new_state.time += 1
+
+        if state.spatial_index is not None:
+            self._carry_spatial_index(state, new_state, first_new_id)
+            lap("carry_spatial_index")
+        if state.zobrist is not None:
+            new_state.zobrist = self._carry_state_hash(state, new_state, first_new_id)
+            lap("carry_state_hash")
     
         # track info for metrics
         self._last_step_info = {
             "completed_rides": self.last_completed_rides,
             "cancelled_requests": self.last_cancelled_requests,
             "picked_up_requests": self.last_picked_up_requests,
-            "moving_taxis": [taxi.id for taxi in new_state.taxis if taxi.status != "idle"],
-            "idle_taxis": [taxi.id for taxi in new_state.taxis if taxi.status == "idle"]
+            "moving_taxis": [taxi.id for taxi in new_state.taxis if taxi.status != IDLE],
+            "idle_taxis": [taxi.id for taxi in new_state.taxis if taxi.status == IDLE]
         }
     
         return new_state
     
+    def spatial_index(self, state):
+        # FleetIndex of state for proximity queries, built on first use and
+        # then handed from state to state by step with incremental updates
+        if state.spatial_index is None:
+            state.spatial_index = FleetIndex(state, self.spatial_cell_size)
+        return state.spatial_index
+
+    def _carry_spatial_index(self, state, new_state, first_new_id):
+        # copy-on-write copy of the parent's index for the new state, only
+        # applying what changed; the parent keeps its own, MCTS steps several
+        # children from one node
+        index = state.spatial_index.copy()
+
+        for i in self._owned_taxis:
+            old, new = state.taxis[i], new_state.taxis[i]
+            if old.status == IDLE and new.status != IDLE:
+                index.idle_taxis.remove(new.id)
+            elif new.status == IDLE:
+                index.idle_taxis.add(new.id, new.position)
+
+        for req_id in self.last_picked_up_requests:
+            index.requests.remove(req_id)
+        for req_id in self.last_cancelled_requests:
+            index.requests.remove(req_id)
+
+        # new requests sit at the end of the queue
+        for req in reversed(new_state.requests):
+            if req.id < first_new_id:
+                break
+            index.requests.add(req.id, req.origin)
+
+        new_state.spatial_index = index
+
+    def state_hash(self, state):
+        # Zobrist hash of state (zobrist.py), computed on first use and then
+        # updated incrementally by step like the spatial index
+        if state.zobrist is None:
+            state.zobrist = self.state_hasher.state_hash(state)
+        return state.zobrist
+
+    def _carry_state_hash(self, state, new_state, first_new_id):
+        owned = sorted(self._owned_taxis)
+        removed = set()
+        for req_id in self.last_picked_up_requests + self.last_cancelled_requests:
+            # a double-served pickup can name a request that is already gone
+            if req_id < first_new_id and state.requests.get(req_id) is not None:
+                removed.add(req_id)
+        added = [req_id for req_id in range(first_new_id, self.request_counter)
+                 if new_state.requests.get(req_id) is not None]
+        return self.state_hasher.update(state.zobrist, [state.taxis[i] for i in owned],
+                                        [new_state.taxis[i] for i in owned], removed, added,
+                                        (state.time, state.traffic_level),
+                                        (new_state.time, new_state.traffic_level))
+
     def _copy_state(self, state):
-        
-        new_taxis = []
-        for taxi in state.taxis:
+        # copy-on-write: the new state gets its own lists but shares the taxi
+        # and request objects with the parent until this step writes to them
+        self._owned_taxis = set()
+        return State(list(state.taxis), state.requests.copy(), state.time, state.traffic_level)
+
+    def _writable_taxi(self, state, index):
+        # clone a shared taxi the first time this step mutates it
+        if index not in self._owned_taxis:
+            taxi = state.taxis[index]
             new_taxi = Taxi(taxi.id, taxi.position)
             new_taxi.status = taxi.status
             new_taxi.assigned_request = taxi.assigned_request
             new_taxi.destination = taxi.destination
             new_taxi.remaining_travel_time = taxi.remaining_travel_time
-            new_taxis.append(new_taxi)
-        
-        new_requests = []
-        for req in state.requests:
-            new_req = Request(req.id, req.origin, req.destination, req.arrival_time)
-            new_req.waiting_time = req.waiting_time
-            new_req.is_cancelled = req.is_cancelled
-            new_requests.append(new_req)
-        
-        return State(new_taxis, new_requests, state.time, state.traffic_level)
+            state.taxis[index] = new_taxi
+            self._owned_taxis.add(index)
+        return state.taxis[index]
     
     def _process_taxi_actions(self, state, actions):
 
         for action in actions:
             taxi = state.taxis[action.taxi_id]
             
-            if action.action_type == "assign" and taxi.status == "idle":
+            if action.action_type == "assign" and taxi.status == IDLE:
                 # assign taxi to req
                 request = action.target
                 if request and not request.is_cancelled:
-                    taxi.status = "en_route_to_pickup"
+                    taxi = self._writable_taxi(state, action.taxi_id)
+                    taxi.status = EN_ROUTE_TO_PICKUP
                     taxi.assigned_request = request
                     taxi.destination = request.origin
-                    taxi.remaining_travel_time = self._manhattan_distance(
+                    taxi.remaining_travel_time = self._travel_time(
                         taxi.position, request.origin
                     )
                     
-            elif action.action_type == "move" and taxi.status == "idle":
+            elif action.action_type == "move" and taxi.status == IDLE:
                 # repositioning
                 target_pos = action.target
                 if target_pos:
+                    taxi = self._writable_taxi(state, action.taxi_id)
                     taxi.destination = target_pos
-                    taxi.remaining_travel_time = self._manhattan_distance(
+                    taxi.remaining_travel_time = self._travel_time(
                         taxi.position, target_pos
                     )
                     
@@ -157,34 +279,35 @@ class Environment:
     
     def _update_taxi_positions(self, state):
     
-        for taxi in state.taxis:
-            if taxi.status == "idle":
+        for index, taxi in enumerate(state.taxis):
+            if taxi.status == IDLE:
                 continue
-            
+
+            taxi = self._writable_taxi(state, index)
+
             # check if taxi reached destination
             if taxi.remaining_travel_time <= 0:
-                if taxi.status == "en_route_to_pickup":
+                if taxi.status == EN_ROUTE_TO_PICKUP:
                     taxi.position = taxi.assigned_request.origin
-                    taxi.status = "occupied"
+                    taxi.status = OCCUPIED
                     taxi.destination = taxi.assigned_request.destination
-                    taxi.remaining_travel_time = self._manhattan_distance(
+                    taxi.remaining_travel_time = self._travel_time(
                         taxi.position, taxi.destination
                     )
                     
                     
                     self.last_picked_up_requests.append(taxi.assigned_request.id)
                     
-                    state.requests = [r for r in state.requests 
-                                     if r.id != taxi.assigned_request.id]
+                    state.requests.remove(taxi.assigned_request.id)
                     
-                elif taxi.status == "occupied":
+                elif taxi.status == OCCUPIED:
                     completed_id = None
                     
                     if taxi.assigned_request is not None:
                         completed_id = taxi.assigned_request.id
                     
                     taxi.position = taxi.destination
-                    taxi.status = "idle"
+                    taxi.status = IDLE
                     taxi.assigned_request = None
                     taxi.destination = None
                     taxi.remaining_travel_time = 0
@@ -197,34 +320,13 @@ class Environment:
                 taxi.remaining_travel_time -= 1
                 
                 # stochastic traffic delay
-                if random.random() < state.traffic_level * 0.1:
+                if self._traffic_delay(taxi, state):
                     taxi.remaining_travel_time += 1  # Traffic delay
     
     def _generate_new_requests(self, state):
 
-        # add time-of-day demand pattern
-        hour_of_day = (state.time % 288) / 12.0
-        
-        if (7 <= hour_of_day < 9) or (17 <= hour_of_day < 19):
-            demand_multiplier = 2.0  # rush hours
-        elif (hour_of_day >= 23) or (hour_of_day < 5):
-            demand_multiplier = 0.5  # late night
-        else:
-            demand_multiplier = 1.0
-        
-        effective_rate = self.request_rate * demand_multiplier
-        num_new_requests = np.random.poisson(effective_rate)
-
-        for _ in range(num_new_requests):
-            origin = (random.randint(0, self.grid_size - 1),
-                    random.randint(0, self.grid_size - 1))
-            destination = (random.randint(0, self.grid_size - 1),
-                        random.randint(0, self.grid_size - 1))
-            
-            while origin == destination:
-                destination = (random.randint(0, self.grid_size - 1),
-                            random.randint(0, self.grid_size - 1))
-            
+        self._first_new_request = len(state.requests)
+        for origin, destination in self._new_trips(state.time):
             new_request = Request(
                 request_id=self.request_counter,
                 origin=origin,
@@ -236,53 +338,135 @@ class Environment:
     
     def _update_requests(self, state):
     
-        for request in state.requests:
-            request.waiting_time += 1
-            
+        if self.vector_min_requests is not None and len(state.requests) >= self.vector_min_requests:
+            self._update_requests_vectorized(state)
+            return
+
+        # requests generated this step are already owned, older ones are
+        # shared with the parent and only survivors get cloned
+        survivors = []
+        for index, request in enumerate(state.requests):
+            waiting_time = request.waiting_time + 1
+
             # cancellation increases with wait time
-            cancel_prob = self.cancellation_prob + (request.waiting_time * 0.01)
+            cancel_prob = self.cancellation_prob + (waiting_time * 0.01)
             cancel_prob = min(cancel_prob, 0.5)
-            
-            if random.random() < cancel_prob:
-                request.is_cancelled = True
+
+            if self._cancels(request, waiting_time, cancel_prob):
+                if index >= self._first_new_request:
+                    request.is_cancelled = True
                 self.last_cancelled_requests.append(request.id)
-    
-        state.requests = [r for r in state.requests if not r.is_cancelled]
+                continue
+
+            if index < self._first_new_request:
+                new_request = Request(request.id, request.origin, request.destination, request.arrival_time)
+                new_request.is_cancelled = request.is_cancelled
+                request = new_request
+            request.waiting_time = waiting_time
+            survivors.append(request)
+
+        state.requests = RequestQueue(survivors)
+
+    def _update_requests_vectorized(self, state):
+        # _update_requests with the wait increments, hazards and uniform draws
+        # as arrays, cancellations come out in the same queue order
+        requests = list(state.requests)
+        waits = np.fromiter((request.waiting_time for request in requests), dtype=np.int64,
+                            count=len(requests)) + 1
+        cancel_probs = np.minimum(self.cancellation_prob + waits * 0.01, 0.5)
+        cancelled = self._cancel_mask(requests, waits, cancel_probs)
+
+        first_new = self._first_new_request
+        for index in np.flatnonzero(cancelled).tolist():
+            request = requests[index]
+            if index >= first_new:
+                request.is_cancelled = True
+            self.last_cancelled_requests.append(request.id)
+
+        survivors = []
+        waits = waits.tolist()
+        for index in np.flatnonzero(~cancelled).tolist():
+            request = requests[index]
+            if index < first_new:
+                new_request = Request(request.id, request.origin, request.destination, request.arrival_time)
+                new_request.is_cancelled = request.is_cancelled
+                request = new_request
+            request.waiting_time = waits[index]
+            survivors.append(request)
+
+        state.requests = RequestQueue(survivors)
     
     def _update_traffic(self, state):
 
-        hour_of_day = (state.time % 288) / 12.0
-    
+        change = self._traffic_change(state.time)
+        state.traffic_level = max(0.8, min(2.0, self._base_traffic(state.time) + change))
+
+    # random draws of the transition, one hook per source of noise so a
+    # replayed trace can stand in for the generators (see crn.py)
+    def _start_positions(self):
+        return [(self.rng.randint(0, self.grid_size - 1), self.rng.randint(0, self.grid_size - 1))
+                for _ in range(self.num_taxis)]
+
+    def _traffic_delay(self, taxi, state):
+        return self.rng.random() < state.traffic_level * 0.1
+
+    def _new_trips(self, time):
+        if self.demand_trace is not None:
+            return self.demand_trace.trips(time)
+
+        effective_rate = self.request_rate * self._demand_multiplier(time)
+        num_new_requests = self.np_rng.poisson(effective_rate)
+
+        trips = []
+        for _ in range(num_new_requests):
+            origin = (self.rng.randint(0, self.grid_size - 1),
+                    self.rng.randint(0, self.grid_size - 1))
+            destination = (self.rng.randint(0, self.grid_size - 1),
+                        self.rng.randint(0, self.grid_size - 1))
+            
+            while origin == destination:
+                destination = (self.rng.randint(0, self.grid_size - 1),
+                            self.rng.randint(0, self.grid_size - 1))
+            trips.append((origin, destination))
+        return trips
+
+    def _cancels(self, request, waiting_time, cancel_prob):
+        return self.rng.random() < cancel_prob
+
+    def _cancel_mask(self, requests, waiting_times, cancel_probs):
+        # _cancels for a whole queue at once, waiting_times and cancel_probs
+        # are arrays aligned with requests
+        return self.np_rng.random(len(requests)) < cancel_probs
+
+    def _traffic_change(self, time):
+        return self.rng.uniform(-0.1, 0.1)
+
+    def _demand_multiplier(self, time):
+        # add time-of-day demand pattern
+        hour_of_day = (time % 288) / 12.0
+
         if (7 <= hour_of_day < 9) or (17 <= hour_of_day < 19):
-            base_traffic = 1.5  # rush hours
+            return 2.0  # rush hours
         elif (hour_of_day >= 23) or (hour_of_day < 5):
-            base_traffic = 0.8  # late night
-        else:
-            base_traffic = 1.0
-        
-        change = random.uniform(-0.1, 0.1)
-        state.traffic_level = max(0.8, min(2.0, base_traffic + change))
+            return 0.5  # late night
+        return 1.0
 
-    def _manhattan_distance(self, pos1, pos2):
-        
-        return abs(pos1[0] - pos2[0]) + abs(pos1[1] - pos2[1])
+    def _base_traffic(self, time):
+        hour_of_day = (time % 288) / 12.0
+
+        if (7 <= hour_of_day < 9) or (17 <= hour_of_day < 19):
+            return 1.5  # rush hours
+        elif (hour_of_day >= 23) or (hour_of_day < 5):
+            return 0.8  # late night
+        return 1.0
+
+    def _travel_time(self, pos1, pos2):
+        # table lookup on road graphs, manhattan distance on the open grid
+        return self.road_network.distance(pos1, pos2)
     
     def _move_toward(self, current, target):
-        
-        x, y = current
-        tx, ty = target
-        
-        # move in x direction first, then y
-        if x < tx:
-            return (x + 1, y)
-        elif x > tx:
-            return (x - 1, y)
-        elif y < ty:
-            return (x, y + 1)
-        elif y > ty:
-            return (x, y - 1)
-        else:
-            return current
+        # next cell on a shortest path, on the open grid x direction first, then y
+        return self.road_network.next_position(current, target)
     
     def get_observation(self, state):
        # simulates noisy observations of the state
@@ -290,14 +474,14 @@ class Environment:
             'time': state.time,
             'taxis': [],
             'requests': [],
-            'traffic_estimate': state.traffic_level + random.uniform(-0.1, 0.1)
+            'traffic_estimate': state.traffic_level + self.rng.uniform(-0.1, 0.1)
         }
         
         for taxi in state.taxis:
             noisy_position = taxi.position
             # 10% chance of 1-step error
-            if random.random() < 0.1:
-                noise = random.choice([(-1, 0), (1, 0), (0, -1), (0, 1)])
+            if self.rng.random() < 0.1:
+                noise = self.rng.choice([(-1, 0), (1, 0), (0, -1), (0, 1)])
                 noisy_position = (
                     max(0, min(self.grid_size - 1, taxi.position[0] + noise[0])),
                     max(0, min(self.grid_size - 1, taxi.position[1] + noise[1]))
@@ -311,7 +495,7 @@ class Environment:
 
         for request in state.requests:
             # 90% chance of observing request
-            if random.random() < 0.9:
+            if self.rng.random() < 0.9:
                 observation['requests'].append({
                     'id': request.id,
                     'origin': request.origin,
@@ -333,7 +517,7 @@ class Environment:
 
     def get_reward(self, state):
         # reward calculation for MCTS
-        cfg = RewardConfiguration()
+        cfg = self.reward_config
         info = getattr(self, "_last_step_info", {
             "completed_rides": [],
             "cancelled_requests": [],
@@ -0,0 +1,78 @@
+# eta.py
+# expected travel times under traffic: every step a moving taxi is delayed
+# with probability 0.1 * traffic_level, and the traffic level is redrawn
+# every step around the time-of-day base level, so a trip of d road steps
+# started at time t with traffic level L is expected to take
+#   1 / (1 - 0.1 L)  for its first step (traffic already known)
+#   1 / (1 - p(t))   for every later step, p(t) the mean delay probability
+#                    of the time-of-day bucket
+# both factors are cached per (time-of-day bucket, traffic level bin), so an
+# ETA per candidate pair is one multiply-add on its road distance
+
+import numpy as np
+
+DAY_STEPS = 288
+BUCKET_STEPS = 12  # one bucket per hour, the schedules change on the hour
+TRAFFIC_MIN = 0.8
+TRAFFIC_MAX = 2.0
+TRAFFIC_NOISE = 0.1  # Environment._update_traffic adds U(-0.1, 0.1)
+DELAY_PER_TRAFFIC = 0.1  # delay probability per unit of traffic level
+
+
+class ETAModel:
+    def __init__(self, env, level_step=0.05):
+        self.env = env
+        self.level_step = level_step
+        self._factors = {}  # (bucket, level bin) -> (first step, later steps)
+
+    def bucket(self, time):
+        return (time % DAY_STEPS) // BUCKET_STEPS
+
+    def delay_probability(self, time):
+        # P(delay) of a step taken at time: its traffic level was drawn at the
+        # end of step time - 1, the initial state starts at level 1.0
+        if time == 0:
+            return DELAY_PER_TRAFFIC
+        base = self.env._base_traffic(time - 1)
+        return DELAY_PER_TRAFFIC * mean_clipped(base, TRAFFIC_NOISE)
+
+    def factors(self, time, traffic_level):
+        # (expected steps for the first move, for each later move)
+        level = int(round(traffic_level / self.level_step))
+        key = (self.bucket(time), level)
+        factors = self._factors.get(key)
+        if factors is None:
+            first = 1.0 / (1.0 - DELAY_PER_TRAFFIC * level * self.level_step)
+            later = 1.0 / (1.0 - self.delay_probability(time + 1))
+            factors = self._factors[key] = (first, later)
+        return factors
+
+    def eta(self, distance, time, traffic_level):
+        # expected steps to cover distance road steps from time
+        if distance <= 0:
+            return 0.0
+        first, later = self.factors(time, traffic_level)
+        return first + (distance - 1) * later
+
+    def etas(self, distances, time, traffic_level):
+        # eta for an array of distances
+        first, later = self.factors(time, traffic_level)
+        distances = np.asarray(distances)
+        return np.where(distances > 0, first + (distances - 1) * later, 0.0)
+
+    def reach(self, max_eta, time, traffic_level):
+        # largest road distance whose eta is at most max_eta
+        first, later = self.factors(time, traffic_level)
+        if max_eta < first:
+            return 0
+        return int((max_eta - first) / later + 1e-9) + 1
+
+
+def mean_clipped(base, noise):
+    # E[clip(base + U(-noise, noise), TRAFFIC_MIN, TRAFFIC_MAX)]
+    a, b = base - noise, base + noise
+    below = max(0.0, min(b, TRAFFIC_MIN) - a) * TRAFFIC_MIN
+    above = max(0.0, b - max(a, TRAFFIC_MAX)) * TRAFFIC_MAX
+    lo, hi = max(a, TRAFFIC_MIN), min(b, TRAFFIC_MAX)
+    inside = (hi * hi - lo * lo) / 2 if hi > lo else 0.0
+    return (below + inside + above) / (b - a)
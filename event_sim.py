@@ -0,0 +1,340 @@
+# event_sim.py
+# discrete-event version of Environment.step: pickups, dropoffs, request
+# arrivals and cancellations sit in a heap keyed by the step they happen in,
+# and the simulator jumps from one decision epoch to the next instead of
+# touching every taxi and request every tick
+#
+# the per-tick randomness of Environment is drawn once per trip / request:
+#   travel time: d moves where each tick is delayed with probability
+#       0.1 * traffic, i.e. d + NegativeBinomial(d, 1 - p) ticks, with p the
+#       mean delay probability of the step the trip starts in
+#   cancellation: the waiting time at which a request gives up, by inverting
+#       the survival function of the hazard min(cancellation_prob + 0.01 w, 0.5)
+#   arrivals: a traces.DemandTrace for the whole horizon
+# a decision epoch is any step with an idle taxi and a waiting request;
+# when the policy leaves such a pair unmatched it is asked again next step,
+# just like Environment would ask it every step
+#
+# info["reward"] follows Environment.get_reward, info["step_reward"] and the
+# "pickup" / "dropoff" / "cancel" events follow experiments.runEpisode, which
+# only sees the queue and fleet between steps: requests that give up in their
+# arrival step are never seen, a request that gives up while a taxi drives to
+# it counts as picked up then ("withdrawn" event, the taxi still serves it),
+# and only taxis whose position changes pay travel cost
+
+import heapq
+import numpy as np
+from environment import Taxi, Request, State
+from traces import generate_demand
+from eta import TRAFFIC_MIN, TRAFFIC_MAX
+
+# event phases within a step, in the order Environment.step handles them
+TAXI_EVENT = 0
+CANCEL_EVENT = 1
+
+
+class EventSimulator:
+    def __init__(self, env, horizon, seed=None, demand_trace=None):
+        self.env = env
+        self.horizon = horizon
+        self.rng = np.random.default_rng(seed)
+        if demand_trace is None:
+            demand_trace = env.demand_trace
+        if demand_trace is None:
+            demand_trace = generate_demand(env, horizon, self.rng.integers(2 ** 32))
+        self.demand = demand_trace
+        self.survival = _survival_table(env.cancellation_prob)
+
+    def reset(self):
+        env = self.env
+        n = env.num_taxis
+        self.time = 0
+        self.first_id = env.request_counter
+        positions = self.rng.integers(0, env.grid_size, (n, 2)).tolist()
+
+        self.position = [tuple(p) for p in positions]
+        self.status = ["idle"] * n
+        self.request = [None] * n  # request object each taxi is serving
+        self.start = [0] * n  # step the current leg started, its origin and length in steps
+        self.start_position = [None] * n
+        self.leg_steps = [0] * n
+        self.leg_distance = [0] * n  # the leg's moves, made in its first leg_distance steps
+        self.event_step = [0] * n  # step of the taxi's next event
+        self.idle_count = n
+
+        self.queue = {}  # request id -> Request, in arrival order
+        self.en_route = set()  # ids of requests a taxi is driving to
+        self.arrival_sum = 0  # sum of arrival times over the queue
+        self.heap = []
+        self.next_row = 0  # next demand trace row to arrive
+
+        # cancellation step of every trace row, drawn in one go
+        _, last = self.demand.rows(0, self.horizon)
+        u = self.rng.random(last)
+        self.give_up = self.demand.arrival[:last] + _waits_until_cancel(self.survival, u) - 1
+        self.give_up = self.give_up.tolist()
+        self.last_row = last
+
+        self._last_step_info = _empty_info(n)
+        self.traffic_level = 1.0
+        return self._state()
+
+    @property
+    def done(self):
+        return self.time >= self.horizon
+
+    def get_last_step_info(self):
+        return self._last_step_info
+
+    def step(self, actions):
+        # applies actions at the current step, then simulates up to the next
+        # decision epoch (or the horizon) and returns the state there
+        info = _empty_info(len(self.status))
+        self._info = info
+        T = self.time
+        for action in actions:
+            i = action.taxi_id
+            request = action.target
+            if (action.action_type == "assign" and self.status[i] == "idle"
+                    and request is not None and not request.is_cancelled):
+                self._dispatch(i, request, T)
+
+        while True:
+            self._process_step(self.time)
+            self.time += 1
+            if self.time >= self.horizon or (self.idle_count and self.queue):
+                break
+            # nothing to decide until the next event, integrate the quiet steps
+            quiet_until = min(self._next_event_step(), self.horizon)
+            self._integrate(self.time, quiet_until)
+            self.time = quiet_until
+            if self.time >= self.horizon:
+                break
+
+        info["moving_taxis"] = [i for i, s in enumerate(self.status) if s != "idle"]
+        info["idle_taxis"] = [i for i, s in enumerate(self.status) if s == "idle"]
+        info["elapsed"] = self.time - T
+        self._last_step_info = info
+        self.traffic_level = self._traffic_level(self.time)
+        return self._state()
+
+    def _dispatch(self, i, request, t):
+        distance = self.env.road_network.distance(self.position[i], request.origin)
+        self.status[i] = "en_route_to_pickup"
+        self.idle_count -= 1
+        self.request[i] = request
+        self.en_route.add(request.id)
+        self._start_leg(i, t, distance, t)
+
+    def _start_leg(self, i, t, distance, first_move):
+        # the taxi moves in steps first_move, first_move + 1, ... and its event
+        # fires in the step after the last move
+        ticks = distance
+        if distance > 0:
+            delay = self.env.eta_model.delay_probability(first_move)
+            ticks += int(self.rng.negative_binomial(distance, 1.0 - delay))
+        self.start[i] = first_move
+        self.start_position[i] = self.position[i]
+        self.leg_steps[i] = ticks
+        self.leg_distance[i] = distance
+        self.event_step[i] = first_move + ticks
+        heapq.heappush(self.heap, (first_move + ticks, TAXI_EVENT, i))
+
+    def _next_event_step(self):
+        step = self.heap[0][0] if self.heap else self.horizon
+        if self.next_row < self.last_row:
+            step = min(step, int(self.demand.arrival[self.next_row]))
+        return step
+
+    def _process_step(self, s):
+        info = self._info
+        heap = self.heap
+        completed = cancelled = unseen = 0
+
+        # pickups and dropoffs, by taxi id like Environment._update_taxi_positions
+        while heap and heap[0][0] == s and heap[0][1] == TAXI_EVENT:
+            _, _, i = heapq.heappop(heap)
+            request = self.request[i]
+            if self.status[i] == "en_route_to_pickup":
+                self.position[i] = request.origin
+                self.status[i] = "occupied"
+                self.en_route.discard(request.id)
+                info["picked_up_requests"].append(request.id)
+                info["events"].append((s, "pickup", request.id))
+                if self.queue.pop(request.id, None) is not None:
+                    self.arrival_sum -= request.arrival_time
+                distance = self.env.road_network.distance(request.origin, request.destination)
+                self._start_leg(i, s, distance, s + 1)
+            else:
+                self.position[i] = request.destination
+                self.status[i] = "idle"
+                self.request[i] = None
+                self.idle_count += 1
+                completed += 1
+                info["completed_rides"].append(request.id)
+                info["events"].append((s, "dropoff", request.id))
+
+        # arrivals of this step
+        first, last = self.demand.rows(s, s + 1)
+        env = self.env
+        for row in range(first, min(last, self.last_row)):
+            request = Request(env.request_counter, tuple(self.demand.origin[row].tolist()),
+                              tuple(self.demand.destination[row].tolist()), s)
+            env.request_counter += 1
+            self.queue[request.id] = request
+            self.arrival_sum += s
+            heapq.heappush(heap, (self.give_up[row], CANCEL_EVENT, request.id))
+            if self.give_up[row] > s:
+                info["new_requests"].append(request)
+        self.next_row = max(self.next_row, last)
+
+        # cancellations, in queue (= id) order like Environment._update_requests
+        while heap and heap[0][0] == s:
+            _, _, request_id = heapq.heappop(heap)
+            request = self.queue.pop(request_id, None)
+            if request is None:
+                continue  # picked up before giving up
+            self.arrival_sum -= request.arrival_time
+            cancelled += 1
+            info["cancelled_requests"].append(request_id)
+            if request.arrival_time == s:
+                unseen += 1  # never in a queue between steps
+            elif request_id in self.en_route:
+                unseen += 1
+                info["events"].append((s, "withdrawn", request_id))
+            else:
+                info["events"].append((s, "cancel", request_id))
+
+        self._add_rewards(1, completed, cancelled, s + 1, unseen)
+
+    def _integrate(self, start, stop):
+        # steps start .. stop - 1 without events
+        if stop > start:
+            self._add_rewards(stop - start, 0, 0, stop)
+
+    def _add_rewards(self, steps, completed, cancelled, end_time, unseen=0):
+        # rewards of the steps ending at times end_time - steps + 1 .. end_time,
+        # queue and fleet unchanged over them:
+        #   reward: Environment.get_reward, wait penalty on summed waiting times,
+        #       travel cost per busy taxi
+        #   step_reward: reward.computeStepReward as runEpisode calls it, wait
+        #       penalty per waiting request, travel cost per move, no penalty
+        #       for the unseen cancellations
+        cfg = self.env.reward_config
+        info = self._info
+        waiting = len(self.queue)
+        times = steps * end_time - steps * (steps - 1) // 2
+        wait_sum = waiting * times - steps * self.arrival_sum
+        busy = len(self.status) - self.idle_count
+        first = end_time - steps
+        moves = 0
+        idle_steps = info["idle_steps"]
+        for i, s in enumerate(self.status):
+            if s == "idle":
+                idle_steps[i] += steps
+            else:
+                moves += max(0, min(end_time, self.start[i] + self.leg_distance[i]) - max(first, self.start[i]))
+        common = cfg.profitPerRide * completed - cfg.idlePenaltyPerStep * self.idle_count * steps
+        info["reward"] += (common - cfg.cancelPenalty * cancelled - cfg.travelCostPerStep * busy * steps
+                           - cfg.waitPenaltyPerStep * wait_sum)
+        info["step_reward"] += (common - cfg.cancelPenalty * (cancelled - unseen) - cfg.travelCostPerStep * moves
+                                - cfg.waitPenaltyPerStep * waiting * steps)
+
+    def _traffic_level(self, t):
+        if t == 0:
+            return 1.0
+        base = self.env._base_traffic(t - 1)
+        return max(TRAFFIC_MIN, min(TRAFFIC_MAX, base + self.rng.uniform(-0.1, 0.1)))
+
+    def _state(self):
+        # fresh State at the current step, busy taxis placed along their path
+        # in proportion to the time spent on the leg
+        t = self.time
+        network = self.env.road_network
+        requests = []
+        for request in self.queue.values():
+            copy = Request(request.id, request.origin, request.destination, request.arrival_time)
+            copy.waiting_time = t - request.arrival_time
+            requests.append(copy)
+        by_id = {request.id: request for request in requests}
+
+        taxis = []
+        for i, status in enumerate(self.status):
+            taxi = Taxi(i, self.position[i])
+            taxi.status = status
+            if status != "idle":
+                request = self.request[i]
+                taxi.assigned_request = by_id.get(request.id, request)
+                taxi.destination = request.origin if status == "en_route_to_pickup" else request.destination
+                taxi.remaining_travel_time = max(self.event_step[i] - t, 0)
+                done = t - self.start[i]
+                if done > 0 and self.leg_steps[i] > 0:
+                    distance = network.distance(self.start_position[i], taxi.destination)
+                    moves = min(distance, distance * done // self.leg_steps[i])
+                    position = self.start_position[i]
+                    for _ in range(moves):
+                        position = network.next_position(position, taxi.destination)
+                    taxi.position = position
+            taxis.append(taxi)
+        return State(taxis, requests, t, self.traffic_level)
+
+
+def run_event_episode(sim, policy, history=None):
+    # run_mcts.run_episode on an EventSimulator: the policy is only asked at
+    # decision epochs, history (metrics.EpisodeHistory) gets the event steps
+    # as experiments.runEpisode would note them
+    state = sim.reset()
+    total_reward = 0.0
+    epochs = 0
+    while not sim.done:
+        actions = policy.selectAction(state)
+        state = sim.step(actions)
+        info = sim.get_last_step_info()
+        total_reward += info["step_reward"]
+        epochs += 1
+        if history is not None:
+            history.noteNewRequests(info["new_requests"])
+            for step, kind, request_id in info["events"]:
+                if kind == "pickup" or kind == "withdrawn":
+                    history.notePickups(step + 1, [request_id])
+                elif kind == "dropoff":
+                    history.noteDropoffs(step + 1, [request_id])
+                else:
+                    history.noteCancellations(step + 1, [request_id])
+            for taxi_id, steps in enumerate(info["idle_steps"]):
+                if steps:
+                    history.taxiIdleSteps[taxi_id] = history.taxiIdleSteps.get(taxi_id, 0) + steps
+            history.totalRevenue += info["step_reward"]
+    return total_reward, epochs
+
+
+def _empty_info(num_taxis):
+    return {"completed_rides": [], "cancelled_requests": [], "picked_up_requests": [],
+            "moving_taxis": [], "idle_taxis": [], "new_requests": [], "events": [],
+            "idle_steps": [0] * num_taxis, "elapsed": 0, "reward": 0.0, "step_reward": 0.0}
+
+
+def _survival_table(cancellation_prob):
+    # P(still waiting after w checks) for w = 1, 2, ... until the hazard
+    # reaches its 0.5 cap, after which it decays geometrically
+    survival = []
+    alive = 1.0
+    w = 1
+    while True:
+        hazard = min(cancellation_prob + w * 0.01, 0.5)
+        alive *= 1.0 - hazard
+        survival.append(alive)
+        if hazard >= 0.5:
+            return np.array(survival)
+        w += 1
+
+
+def _waits_until_cancel(survival, u):
+    # smallest w with survival[w - 1] <= u, one per uniform u
+    waits = np.searchsorted(-survival, -u, side="left") + 1
+    tail = waits > len(survival)
+    if tail.any():
+        # past the table every check cancels with probability 0.5
+        extra = np.ceil(np.log(u[tail] / survival[-1]) / np.log(0.5))
+        waits[tail] = len(survival) + np.maximum(extra, 1).astype(np.int64)
+    return waits
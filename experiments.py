@@ -5,8 +5,13 @@ Created on Wed Dec  3 20:49:19 2025
 @author: Rachel
 """
 
+import random
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import profiling
 from metrics import EpisodeHistory, summarizedMetrics
 from reward import computeStepReward, RewardConfiguration
+from batch_env import greedy_batch_actions
 
 def runEpisode(env, policy, maxSteps, rewardCfg):
     state = env.create_initial_state()
@@ -110,7 +115,10 @@ def runEpisode(env, policy, maxSteps, rewardCfg):
         
     return hist
 
-def runMany(envBuilder, policyBuilder, episodes, maxSteps):
+def runMany(envBuilder, policyBuilder, episodes, maxSteps, profilePath=None):
+    # profilePath: write a profiling summary of the whole run there as json
+    if profilePath is not None:
+        profiling.enable()
     results = []
     episode = 0
     while episode < episodes:
@@ -121,4 +129,64 @@ def runMany(envBuilder, policyBuilder, episodes, maxSteps):
         results.append(metrics)
         episode = episode + 1
         
-    return results
\ No newline at end of file
+    if profilePath is not None:
+        profiling.write_json(profiling.disable(), profilePath)
+    return results
+
+def episodeSeeds(episodes, seed):
+    # independent 32 bit seeds, one per episode, from a single sweep seed
+    children = np.random.SeedSequence(seed).spawn(episodes)
+    seeds = []
+    i = 0
+    while i < len(children):
+        seeds.append(int(children[i].generate_state(1)[0]))
+        i = i + 1
+    return seeds
+
+def runEpisodeSeeded(envBuilder, policyBuilder, maxSteps, seed):
+    # the environment gets its own generators, the global ones are seeded too
+    # for policies that still draw from random / np.random
+    random.seed(seed)
+    np.random.seed(seed)
+    env = envBuilder()
+    env.reseed(seed)
+    policy = policyBuilder(env)
+    hist = runEpisode(env, policy, maxSteps, RewardConfiguration())
+    return summarizedMetrics(hist)
+
+def runManyParallel(envBuilder, policyBuilder, episodes, maxSteps, workers=None, seed=0):
+    # like runMany, but episodes fan out over a process pool (builders must be
+    # picklable, i.e. module level functions); results come back in episode
+    # order and only depend on seed, not on workers
+    seeds = episodeSeeds(episodes, seed)
+    if workers == 1:
+        results = []
+        i = 0
+        while i < episodes:
+            results.append(runEpisodeSeeded(envBuilder, policyBuilder, maxSteps, seeds[i]))
+            i = i + 1
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        i = 0
+        while i < episodes:
+            futures.append(pool.submit(runEpisodeSeeded, envBuilder, policyBuilder, maxSteps, seeds[i]))
+            i = i + 1
+        results = []
+        i = 0
+        while i < len(futures):
+            results.append(futures[i].result())
+            i = i + 1
+    return results
+
+def runManyBatched(batchEnvBuilder, episodes, maxSteps, batchPolicy=greedy_batch_actions):
+    # all episodes advance together in one BatchEnvironment, batchPolicy maps
+    # the batch environment to an (episodes, taxis) array of request slots
+    env = batchEnvBuilder(episodes)
+    stepIndex = 0
+    while stepIndex < maxSteps:
+        env.step(batchPolicy(env))
+        stepIndex = stepIndex + 1
+        
+    return env.summarized_metrics()
\ No newline at end of file
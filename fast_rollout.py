@@ -0,0 +1,243 @@
+# fast_rollout.py
+# lean simulator for MCTS rollouts: same transition rules as Environment.step
+# but in place on flat lists, without Taxi/Request copies, info dicts or
+# per-call RewardConfiguration, and with random numbers drawn in batches
+
+import numpy as np
+
+IDLE = 0
+EN_ROUTE = 1
+OCCUPIED = 2
+
+# queue entry fields: [request id, origin x, origin y, dest x, dest y, waiting time, removed]
+ID, OX, OY, DX, DY, WAIT, REMOVED = range(7)
+
+
+class RolloutSimulator:
+    def __init__(self, env, rng=None, block_size=4096):
+        self.env = env
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.block_size = block_size
+        self.cfg = env.reward_config
+        # road graph lookups, None on the open grid where it is all inlined
+        self.network = None if env.road_network.manhattan else env.road_network
+        self._uniforms = []
+        self._next_uniform = 0
+        self._coords = []
+        self._next_coord = 0
+
+    def next_uniform(self):
+        # one U(0, 1) from a pre-drawn block
+        if self._next_uniform >= len(self._uniforms):
+            self._uniforms = self.rng.random(self.block_size).tolist()
+            self._next_uniform = 0
+        u = self._uniforms[self._next_uniform]
+        self._next_uniform += 1
+        return u
+
+    def _next_cell(self):
+        if self._next_coord >= len(self._coords):
+            self._coords = self.rng.integers(0, self.env.grid_size, self.block_size).tolist()
+            self._next_coord = 0
+        c = self._coords[self._next_coord]
+        self._next_coord += 1
+        return c
+
+    def load(self, state):
+        # copies state into flat lists the simulator can mutate
+        entries = {}
+        self.queue = []
+        for req in state.requests:
+            entry = [req.id, req.origin[0], req.origin[1], req.destination[0], req.destination[1],
+                     req.waiting_time, False]
+            entries[req.id] = entry
+            self.queue.append(entry)
+
+        n = len(state.taxis)
+        self.x = [0] * n
+        self.y = [0] * n
+        self.status = [IDLE] * n
+        self.remaining = [0] * n
+        self.dest = [None] * n
+        self.assigned = [None] * n
+        for taxi in state.taxis:
+            i = taxi.id
+            self.x[i], self.y[i] = taxi.position
+            self.status[i] = (IDLE if taxi.status == "idle" else
+                              EN_ROUTE if taxi.status == "en_route_to_pickup" else OCCUPIED)
+            self.remaining[i] = taxi.remaining_travel_time
+            self.dest[i] = taxi.destination
+            req = taxi.assigned_request
+            if req is not None:
+                self.assigned[i] = entries.get(req.id) or [
+                    req.id, req.origin[0], req.origin[1], req.destination[0], req.destination[1],
+                    req.waiting_time, True]
+        self.time = state.time
+        self.traffic_level = state.traffic_level
+
+    def run(self, state, policy, depth=15):
+        # rolls out depth steps from state, returns (total reward, steps)
+        env = self.env
+        self.load(state)
+
+        rates = [env.request_rate * env._demand_multiplier(self.time + k) for k in range(depth)]
+        arrivals = self.rng.poisson(rates).tolist()
+        traffic_noise = self.rng.uniform(-0.1, 0.1, depth).tolist()
+
+        total = 0.0
+        for k in range(depth):
+            for taxi, entry in policy(self):
+                self.assign(taxi, entry)
+            total += self.advance(arrivals[k], traffic_noise[k])
+        return total, depth
+
+    def assign(self, i, entry):
+        if self.status[i] != IDLE:
+            return
+        self.status[i] = EN_ROUTE
+        self.assigned[i] = entry
+        self.dest[i] = (entry[OX], entry[OY])
+        if self.network is not None:
+            self.remaining[i] = self.network.distance((self.x[i], self.y[i]), (entry[OX], entry[OY]))
+        else:
+            self.remaining[i] = abs(self.x[i] - entry[OX]) + abs(self.y[i] - entry[OY])
+
+    def advance(self, num_arrivals, traffic_change):
+        # one Environment.step in place, returns the Environment.get_reward value
+        env = self.env
+        cfg = self.cfg
+        network = self.network
+        x, y, status, remaining, dest, assigned = self.x, self.y, self.status, self.remaining, self.dest, self.assigned
+        delay_prob = self.traffic_level * 0.1
+        completed = 0
+        busy = 0
+
+        # update taxi positions
+        for i in range(len(status)):
+            s = status[i]
+            if s == IDLE:
+                continue
+            if remaining[i] <= 0:
+                entry = assigned[i]
+                if s == EN_ROUTE:
+                    x[i], y[i] = entry[OX], entry[OY]
+                    status[i] = OCCUPIED
+                    dest[i] = (entry[DX], entry[DY])
+                    if network is not None:
+                        remaining[i] = network.distance((entry[OX], entry[OY]), dest[i])
+                    else:
+                        remaining[i] = abs(entry[OX] - entry[DX]) + abs(entry[OY] - entry[DY])
+                    entry[REMOVED] = True
+                    busy += 1
+                else:
+                    x[i], y[i] = dest[i]
+                    status[i] = IDLE
+                    assigned[i] = None
+                    dest[i] = None
+                    remaining[i] = 0
+                    if entry is not None:
+                        completed += 1
+            else:
+                # move in x direction first, then y
+                tx, ty = dest[i]
+                if network is not None:
+                    x[i], y[i] = network.next_position((x[i], y[i]), dest[i])
+                elif x[i] != tx:
+                    x[i] += 1 if x[i] < tx else -1
+                elif y[i] != ty:
+                    y[i] += 1 if y[i] < ty else -1
+                remaining[i] -= 1
+                if self.next_uniform() < delay_prob:
+                    remaining[i] += 1
+                busy += 1
+
+        # generate new requests
+        queue = self.queue
+        for _ in range(num_arrivals):
+            ox, oy = self._next_cell(), self._next_cell()
+            dx, dy = self._next_cell(), self._next_cell()
+            while ox == dx and oy == dy:
+                dx, dy = self._next_cell(), self._next_cell()
+            queue.append([env.request_counter, ox, oy, dx, dy, 0, False])
+            env.request_counter += 1
+
+        # update requests
+        cancelled = 0
+        wait_sum = 0
+        survivors = []
+        base_prob = env.cancellation_prob
+        for entry in queue:
+            if entry[REMOVED]:
+                continue
+            wait = entry[WAIT] + 1
+            entry[WAIT] = wait
+            if self.next_uniform() < min(base_prob + wait * 0.01, 0.5):
+                entry[REMOVED] = True
+                cancelled += 1
+            else:
+                survivors.append(entry)
+                wait_sum += wait
+        self.queue = survivors
+
+        # update traffic
+        self.traffic_level = max(0.8, min(2.0, env._base_traffic(self.time) + traffic_change))
+        self.time += 1
+
+        idle = len(status) - busy
+        return (cfg.profitPerRide * completed - cfg.waitPenaltyPerStep * wait_sum
+                - cfg.cancelPenalty * cancelled - cfg.travelCostPerStep * busy
+                - cfg.idlePenaltyPerStep * idle)
+
+
+def random_rollout_policy(sim, max_distance=5):
+    # uniform over the joint actions get_legal_actions would list:
+    # all idle, or one idle taxi assigned to one request within max_distance
+    network = sim.network
+    pairs = 0
+    for i in range(len(sim.status)):
+        if sim.status[i] != IDLE:
+            continue
+        xi, yi = sim.x[i], sim.y[i]
+        for entry in sim.queue:
+            if abs(xi - entry[OX]) + abs(yi - entry[OY]) <= max_distance and (
+                    network is None or network.distance((xi, yi), (entry[OX], entry[OY])) <= max_distance):
+                pairs += 1
+
+    pick = int(sim.next_uniform() * (pairs + 1))
+    if pick == 0:
+        return []
+
+    for i in range(len(sim.status)):
+        if sim.status[i] != IDLE:
+            continue
+        xi, yi = sim.x[i], sim.y[i]
+        for entry in sim.queue:
+            if abs(xi - entry[OX]) + abs(yi - entry[OY]) <= max_distance and (
+                    network is None or network.distance((xi, yi), (entry[OX], entry[OY])) <= max_distance):
+                pick -= 1
+                if pick == 0:
+                    return [(i, entry)]
+    return []
+
+
+def greedy_rollout_policy(sim):
+    # GreedyPolicy on the simulator: longest waiting request first, nearest idle taxi
+    network = sim.network
+    idle = [i for i in range(len(sim.status)) if sim.status[i] == IDLE]
+    assignments = []
+    for entry in sim.queue:  # queue order is arrival order, i.e. longest waiting first
+        if not idle:
+            break
+        best, best_distance = 0, None
+        for j, i in enumerate(idle):
+            if network is not None:
+                distance = network.distance((sim.x[i], sim.y[i]), (entry[OX], entry[OY]))
+            else:
+                distance = abs(sim.x[i] - entry[OX]) + abs(sim.y[i] - entry[OY])
+            if best_distance is None or distance < best_distance:
+                best, best_distance = j, distance
+        assignments.append((idle.pop(best), entry))
+    return assignments
+
+
+ROLLOUT_POLICIES = {"random": random_rollout_policy, "greedy": greedy_rollout_policy}
@@ -11,6 +11,7 @@ from environment import Action
 class GreedyConfiguration:
     def __init__(self):
         self.repositionWhenIdle = True
+        self.useSpatialIndex = False
         
 class GreedyPolicy:
     def __init__(self, cfg, env, seed=None):
@@ -33,24 +34,13 @@ class GreedyPolicy:
                 idleTaxis.append(taxi)
             i = i + 1
             
-        requests = []
-        i = 0
-        while i < len(state.requests):
-            requests.append(state.requests[i])
-            i = i + 1
-            
-        n = len(requests)
-        a = 0
-        while a < n:
-            b = 0
-            while b < n-1:
-                if requests[b].waiting_time < requests[b + 1].waiting_time:                
-                    temp = requests[b]
-                    requests[b] = requests[b + 1]
-                    requests[b + 1] = temp
-                b = b + 1
-            a = a + 1
+        # longest waiting first, the queue keeps them in that order
+        requests = state.requests.by_waiting_time()
             
+        # the index ranks taxis by manhattan distance, exact on the open grid only
+        if self.cfg.useSpatialIndex and self.env.road_network.manhattan:
+            return self.assignWithIndex(state, actions, requests)
+
         rIndex = 0
         while rIndex < len(requests):
             r = requests[rIndex]
@@ -63,7 +53,7 @@ class GreedyPolicy:
             j = 0
             while j < len(idleTaxis):
                 taxi = idleTaxis[j]
-                distance = manhattan(taxi.position, r.origin)
+                distance = self.env.road_network.distance(taxi.position, r.origin)
                 if distance < bestDistance:
                     bestDistance = distance
                     bestIndex = j
@@ -83,6 +73,29 @@ class GreedyPolicy:
             rIndex = rIndex + 1
                 
         return actions
+
+    def assignWithIndex(self, state, actions, requests):
+        # same assignment as selectAction, nearest idle taxi found through the
+        # environment's spatial index instead of scanning every idle taxi
+        index = self.env.spatial_index(state)
+        taken = set()
+        
+        rIndex = 0
+        while rIndex < len(requests):
+            r = requests[rIndex]
+            if len(taken) == len(index.idle_taxis):
+                break
+            
+            nearest = index.nearest_idle_taxis(r.origin, 1, exclude=taken)
+            if len(nearest) == 0:
+                break
+            
+            bestTaxi = state.taxis[nearest[0]]
+            actions[bestTaxi.id] = Action(bestTaxi.id, "assign", target = r)
+            taken.add(bestTaxi.id)
+            rIndex = rIndex + 1
+        
+        return actions
             
 
 
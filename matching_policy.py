@@ -0,0 +1,127 @@
+# matching_policy.py
+# batch dispatch: all idle taxis and waiting requests matched at once as a
+# min-cost assignment instead of one request at a time like GreedyPolicy
+
+import numpy as np
+from environment import Action
+
+try:
+    from scipy.optimize import linear_sum_assignment as scipyAssignment
+except ImportError:  # scipy is optional, fall back to the numpy solver below
+    scipyAssignment = None
+
+INFEASIBLE = 1e9
+
+class MatchingConfiguration:
+    def __init__(self):
+        self.waitWeight = 1.0    # cost reduction per step the request has waited
+        self.maxRadius = None    # pairs farther apart than this are never matched
+        self.useScipy = True     # use scipy's solver when it is installed
+
+class MatchingPolicy:
+    def __init__(self, cfg, env, seed=None):
+        self.cfg = cfg
+        self.env = env
+
+    def selectAction(self, state):
+        actions = [Action(taxi.id, "idle") for taxi in state.taxis]
+
+        idleTaxis = [taxi for taxi in state.taxis if taxi.status == "idle"]
+        requests = list(state.requests)
+        if len(idleTaxis) == 0 or len(requests) == 0:
+            return actions
+
+        cost, distance = self.costMatrix(idleTaxis, requests)
+
+        # sparsify: keep only taxis and requests with at least one feasible pair
+        feasible = cost < INFEASIBLE
+        rows = np.flatnonzero(feasible.any(axis=1))
+        cols = np.flatnonzero(feasible.any(axis=0))
+        if len(rows) == 0:
+            return actions
+        cost = cost[np.ix_(rows, cols)]
+
+        if self.cfg.useScipy and scipyAssignment is not None:
+            matchedRows, matchedCols = scipyAssignment(cost)
+        else:
+            matchedRows, matchedCols = linearSumAssignment(cost)
+
+        i = 0
+        while i < len(matchedRows):
+            if cost[matchedRows[i], matchedCols[i]] < INFEASIBLE:
+                taxi = idleTaxis[rows[matchedRows[i]]]
+                r = requests[cols[matchedCols[i]]]
+                actions[taxi.id] = Action(taxi.id, "assign", target = r)
+            i = i + 1
+
+        return actions
+
+    def costMatrix(self, idleTaxis, requests):
+        # (taxis, requests) pickup distance minus a bonus for waiting time
+        taxiPos = np.array([taxi.position for taxi in idleTaxis])
+        origins = np.array([r.origin for r in requests])
+        waits = np.array([r.waiting_time for r in requests], dtype=float)
+
+        distance = self.env.road_network.distance_matrix(taxiPos, origins)
+        cost = distance - self.cfg.waitWeight * waits[None, :]
+        if self.cfg.maxRadius is not None:
+            cost[distance > self.cfg.maxRadius] = INFEASIBLE
+        return cost, distance
+
+
+def linearSumAssignment(cost):
+    # rectangular min-cost assignment (shortest augmenting path Hungarian),
+    # returns (rows, cols) like scipy.optimize.linear_sum_assignment
+    cost = np.asarray(cost, dtype=float)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    owner = np.zeros(m + 1, dtype=int)  # row (1-based) matched to each column, 0 = free
+    way = np.zeros(m + 1, dtype=int)
+
+    row = 1
+    while row <= n:
+        owner[0] = row
+        col = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[col] = True
+            current = owner[col]
+            free = ~used
+            free[0] = False
+
+            reduced = cost[current - 1] - u[current] - v[1:]
+            better = free[1:] & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = col
+
+            candidates = np.where(free, minv, np.inf)
+            nextCol = int(np.argmin(candidates))
+            delta = candidates[nextCol]
+
+            u[owner[used]] += delta
+            v[used] -= delta
+            minv[free] -= delta
+
+            col = nextCol
+            if owner[col] == 0:
+                break
+
+        # augment along the alternating path
+        while col != 0:
+            prev = way[col]
+            owner[col] = owner[prev]
+            col = prev
+        row = row + 1
+
+    cols = np.flatnonzero(owner[1:])
+    rows = owner[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
@@ -2,10 +2,21 @@
 
 import math
 import random
+import time
 from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import profiling
 from environment import Action
+from fast_rollout import RolloutSimulator, ROLLOUT_POLICIES
+from batch_rollout import BatchRollout, BATCH_ROLLOUT_POLICIES
+from mcts_tree import FlatTree, StateCache, ROOT, NO_TAXI
+from zobrist import TranspositionTable
 
 class MCTSNode:
+    __slots__ = ("state", "parent", "action", "children", "visits", "value", "choices", "taxi_options",
+                 "option_visits", "option_values", "child_index", "untried_actions", "key")
+
     def __init__(self, state, parent=None, action=None):
         self.state = state
         self.parent = parent
@@ -13,6 +24,13 @@ class MCTSNode:
         self.children = []
         self.visits = 0
         self.value = 0.0
+        self.choices = None  # factored mode: (taxi_id, option index) pairs taken from parent
+        self.taxi_options = None
+        self.option_visits = None
+        self.option_values = None
+        self.child_index = None
+        self.untried_actions = None  # joint mode: legal actions not expanded yet
+        self.key = None  # state hash when searching with a transposition table
 
 def ucb_score(parent, child, c=2.0):
     if child.visits == 0:
@@ -22,14 +40,69 @@ def ucb_score(parent, child, c=2.0):
     return exploit + explore
 
 
-def get_legal_actions(state, max_distance=5):
+def shared_ucb_score(parent, child, table, c=2.0):
+    # ucb_score on the statistics every node with the child's state shares
+    entry = table.get(child.key)
+    if entry is None or entry[0] == 0:
+        return ucb_score(parent, child, c)
+    exploit = entry[1] / entry[0]
+    explore = c * math.sqrt(math.log(parent.visits) / entry[0])
+    return exploit + explore
+
+
+def queue_order(state):
+    # request id -> (queue position, request)
+    return {req.id: (i, req) for i, req in enumerate(state.requests)}
+
+
+def nearby_requests(taxi, max_distance, index, order, network=None):
+    # requests within max_distance of taxi in queue order, through a FleetIndex
+    # the index answers in manhattan distance, a lower bound of road distance
+    found = [order[req_id] for req_id in index.requests_within(taxi.position, max_distance)]
+    if network is not None and not network.manhattan:
+        found = [entry for entry in found
+                 if network.distance(taxi.position, entry[1].origin) <= max_distance]
+    found.sort(key=lambda entry: entry[0])
+    return [req for _, req in found]
+
+
+def action_radius(state, env, traffic_aware=False, max_distance=5):
+    # max_distance in road steps, or with traffic_aware in expected steps
+    # under the state's traffic (Environment.eta_model), as a road distance
+    if not traffic_aware:
+        return max_distance
+    return env.eta_model.reach(max_distance, state.time, state.traffic_level)
+
+
+def get_legal_actions(state, max_distance=5, index=None, network=None):
+    # index is an optional FleetIndex (Environment.spatial_index) used instead
+    # of scanning every request for every idle taxi
+    # network (Environment.road_network) measures max_distance along roads
     actions = []
 
     idle_all = [Action(taxi.id, "idle") for taxi in state.taxis]
     actions.append(idle_all)
 
+    for taxi, req in legal_assignments(state, max_distance, index, network):
+        joint = [Action(t.id, "idle") for t in state.taxis]
+        joint[taxi.id] = Action(taxi.id, "assign", target=req)
+        actions.append(joint)
+
+    return actions
+
+
+def legal_assignments(state, max_distance=5, index=None, network=None):
+    # the (taxi, request) pairs behind get_legal_actions, in the same order
+    pairs = []
     idle_taxis = [t for t in state.taxis if t.status == "idle"]
 
+    if index is not None:
+        order = queue_order(state)
+        for taxi in idle_taxis:
+            for req in nearby_requests(taxi, max_distance, index, order, network):
+                pairs.append((taxi, req))
+        return pairs
+
     for taxi in idle_taxis:
         for req in state.requests:
             # unpack positions
@@ -38,93 +111,761 @@ def get_legal_actions(state, max_distance=5):
             
             # manhattan distance
             distance = abs(taxi_x - pickup_x) + abs(taxi_y - pickup_y)
+            # roads never beat it, so only candidates need a road lookup
+            if distance <= max_distance and network is not None and not network.manhattan:
+                distance = network.distance(taxi.position, req.origin)
             
             # only create action if taxi is close enough
             if distance <= max_distance:
-                joint = [Action(t.id, "idle") for t in state.taxis]
-                joint[taxi.id] = Action(taxi.id, "assign", target=req)
-                actions.append(joint)
+                pairs.append((taxi, req))
 
+    return pairs
+
+
+def assignment_priority(taxi, req, network=None):
+    # cheap ordering of candidate assignments, lower first: distance to the
+    # pickup less the time the request has already waited
+    if network is None or network.manhattan:
+        distance = abs(taxi.position[0] - req.origin[0]) + abs(taxi.position[1] - req.origin[1])
+    else:
+        distance = network.distance(taxi.position, req.origin)
+    return distance - req.waiting_time
+
+
+def ranked_assignments(state, max_distance=5, index=None, network=None, max_children=None):
+    # legal_assignments best first by assignment_priority, ties in legal
+    # order, cut to max_children - 1 so a node has at most max_children
+    # actions with the all-idle one
+    pairs = legal_assignments(state, max_distance, index, network)
+    pairs.sort(key=lambda pair: assignment_priority(pair[0], pair[1], network))
+    if max_children is not None:
+        pairs = pairs[:max(max_children - 1, 0)]
+    return pairs
+
+
+def ranked_legal_actions(state, max_distance=5, index=None, network=None, max_children=None):
+    # get_legal_actions in the order progressive widening admits them, the
+    # all-idle action last
+    actions = []
+    for taxi, req in ranked_assignments(state, max_distance, index, network, max_children):
+        joint = [Action(t.id, "idle") for t in state.taxis]
+        joint[taxi.id] = Action(taxi.id, "assign", target=req)
+        actions.append(joint)
+    actions.append([Action(taxi.id, "idle") for taxi in state.taxis])
     return actions
 
 
-def select(node):
+def widening_limit(visits, widening):
+    # children a node with visits may have under progressive widening
+    return int(visits ** widening) + 1
+
+
+def get_taxi_options(state, max_distance=5, index=None, network=None):
+    # factored action space: per idle taxi, the list of its own sub-decisions
+    # (None = stay idle, else a request within max_distance)
+    options = []
+    order = queue_order(state) if index is not None else None
+    for taxi in state.taxis:
+        if taxi.status != "idle":
+            continue
+        if index is not None:
+            options.append((taxi.id, [None] + nearby_requests(taxi, max_distance, index, order, network)))
+            continue
+        taxi_x, taxi_y = taxi.position
+        choices = [None]
+        for req in state.requests:
+            pickup_x, pickup_y = req.origin
+            if abs(taxi_x - pickup_x) + abs(taxi_y - pickup_y) > max_distance:
+                continue
+            if network is None or network.manhattan or network.distance(taxi.position, req.origin) <= max_distance:
+                choices.append(req)
+        options.append((taxi.id, choices))
+    return options
+
+
+def compose_joint_action(state, options, picks):
+    # joint action from one option index per idle taxi, a request already
+    # claimed by an earlier taxi falls back to idle
+    joint = [Action(t.id, "idle") for t in state.taxis]
+    taken = set()
+    choices = []
+    for (taxi_id, taxi_options), pick in zip(options, picks):
+        req = taxi_options[pick]
+        if req is not None and req.id in taken:
+            pick, req = 0, None
+        if req is not None:
+            taken.add(req.id)
+            joint[taxi_id] = Action(taxi_id, "assign", target=req)
+        choices.append((taxi_id, pick))
+    return joint, choices
+
+
+def sample_factored_action(state, max_distance=5, index=None, network=None):
+    options = get_taxi_options(state, max_distance, index, network)
+    picks = [random.randrange(len(taxi_options)) for _, taxi_options in options]
+    return compose_joint_action(state, options, picks)[0]
+
 
+def decoupled_ucb_picks(node, c=2.0):
+    # every idle taxi picks its own option by UCB over its own statistics,
+    # options already claimed by an earlier taxi are skipped
+    picks = []
+    taken = set()
+    log_visits = math.log(max(node.visits, 1))
+    for taxi_id, taxi_options in node.taxi_options:
+        visits = node.option_visits[taxi_id]
+        values = node.option_values[taxi_id]
+        best, best_score = 0, -float('inf')
+        for i, req in enumerate(taxi_options):
+            if req is not None and req.id in taken:
+                continue
+            if visits[i] == 0:
+                best = i
+                break
+            score = values[i] / visits[i] + c * math.sqrt(log_visits / visits[i])
+            if score > best_score:
+                best, best_score = i, score
+        if taxi_options[best] is not None:
+            taken.add(taxi_options[best].id)
+        picks.append(best)
+    return picks
+
+
+def select_factored(root, env, stats=None, use_spatial_index=False, traffic_aware=False):
+    # decoupled UCT descent, returns the node to roll out from
+    node = root
+    while node.visits > 0:
+        if node.taxi_options is None:
+            index = env.spatial_index(node.state) if use_spatial_index else None
+            radius = action_radius(node.state, env, traffic_aware)
+            node.taxi_options = get_taxi_options(node.state, max_distance=radius, index=index, network=env.road_network)
+            node.option_visits = {tid: [0] * len(opts) for tid, opts in node.taxi_options}
+            node.option_values = {tid: [0.0] * len(opts) for tid, opts in node.taxi_options}
+            node.child_index = {}
+
+        picks = decoupled_ucb_picks(node)
+        joint, choices = compose_joint_action(node.state, node.taxi_options, picks)
+        key = action_key(joint)
+
+        child = node.child_index.get(key)
+        if child is None:
+            child = MCTSNode(env.step(node.state, joint), parent=node, action=joint)
+            child.choices = choices
+            node.children.append(child)
+            node.child_index[key] = child
+            if stats is not None:
+                stats["nodes"] += 1
+            return child
+        node = child
+    return node
+
+
+def select(node, table=None, widening=None):
+    # with widening, stops at a node that may admit another child
     while node.children:
-        node = max(node.children, key=lambda c: ucb_score(node, c))
+        if widening is not None and node.untried_actions != [] and \
+                len(node.children) < widening_limit(node.visits, widening):
+            return node
+        if table is None:
+            node = max(node.children, key=lambda c: ucb_score(node, c))
+        else:
+            node = max(node.children, key=lambda c: shared_ucb_score(node, c, table))
     return node
 
 
-def expand(node, env):
-    if not hasattr(node, 'untried_actions'):
-        node.untried_actions = get_legal_actions(node.state, max_distance=5)
+def expand(node, env, use_spatial_index=False, traffic_aware=False, widening=None, max_children=None):
+    if node.untried_actions is None:
+        index = env.spatial_index(node.state) if use_spatial_index else None
+        radius = action_radius(node.state, env, traffic_aware)
+        if widening is None and max_children is None:
+            node.untried_actions = get_legal_actions(node.state, max_distance=radius, index=index,
+                                                     network=env.road_network)
+        else:
+            # best candidate last, pop takes it first
+            node.untried_actions = ranked_legal_actions(node.state, radius, index, env.road_network,
+                                                        max_children)[::-1]
+        if node.children:
+            # listed again for a re-rooted node, some are children already
+            expanded = {action_key(child.action) for child in node.children}
+            node.untried_actions = [a for a in node.untried_actions if action_key(a) not in expanded]
 
     if not node.untried_actions:
         return None
     
     # expand one action at a time
     action = node.untried_actions.pop()
-    next_state = env.step(node.state, action)
+    if node.key is None:
+        next_state, key = env.step(node.state, action), None
+    else:
+        next_state, key = step_with_key(env, node.state, node.key, action)
     child = MCTSNode(next_state, parent=node, action=action)
+    child.key = key
     node.children.append(child)
     
     return [child] 
 
 
-def rollout(state, env, depth=15):
+def step_with_key(env, state, key, joint):
+    # env.step that also updates the state hash key of state incrementally
+    # to the child's; neither state keeps its hash, so rollouts from them do
+    # not pay for carrying it
+    state.zobrist = key
+    child = env.step(state, joint)
+    child_key = child.zobrist
+    state.zobrist = child.zobrist = None
+    return child, child_key
+
+
+def rollout(state, env, depth=15, stats=None, action_space="joint", use_spatial_index=False,
+            simulator=None, rollout_policy=None, traffic_aware=False):
+    # with a RolloutSimulator the rollout runs on its flat lists with
+    # rollout_policy choosing the actions instead of env.step + random joint actions
+    if simulator is not None:
+        total_reward, steps = simulator.run(state, rollout_policy, depth)
+        if stats is not None:
+            stats["rollouts"] += 1
+            stats["rollout_steps"] += steps
+        return total_reward
   
     total_reward = 0.0
     current_state = state
+    steps = 0
 
     for _ in range(depth):
-        actions = get_legal_actions(current_state, max_distance=5)
-        if not actions:
-            break
-        action = random.choice(actions)
+        index = env.spatial_index(current_state) if use_spatial_index else None
+        radius = action_radius(current_state, env, traffic_aware)
+        if action_space == "factored":
+            action = sample_factored_action(current_state, max_distance=radius, index=index, network=env.road_network)
+        else:
+            actions = get_legal_actions(current_state, max_distance=radius, index=index, network=env.road_network)
+            if not actions:
+                break
+            action = random.choice(actions)
 
         current_state = env.step(current_state, action)
         total_reward += env.get_reward(current_state)
+        steps += 1
+
+    if stats is not None:
+        stats["rollouts"] += 1
+        stats["rollout_steps"] += steps
 
     return total_reward
 
 
-def backpropagate(node, reward):
-   
+def batch_rollout(state, batch, policy, depth=15, stats=None):
+    # batch.episodes rollouts from state at once on a BatchRollout, returns
+    # the mean and variance of their total rewards
+    totals = batch.run(state, policy, depth)
+    if stats is not None:
+        stats["rollouts"] += len(totals)
+        stats["rollout_steps"] += depth * len(totals)
+        stats["leaf_batches"] += 1
+        stats["leaf_variance"] += float(totals.var())
+    return float(totals.mean()), float(totals.var())
+
+
+def backpropagate(node, reward, table=None, count=1):
+    # count: rollouts behind reward, a leaf batch backs up its mean once per rollout
     while node is not None:
-        node.visits += 1
-        node.value += reward
+        node.visits += count
+        node.value += reward * count
+        if table is not None and node.key is not None:
+            entry = table.entry(node.key)
+            entry[0] += count
+            entry[1] += reward * count
+        if node.choices is not None:
+            # factored mode: credit every taxi's own sub-decision at the parent
+            parent = node.parent
+            for taxi_id, pick in node.choices:
+                parent.option_visits[taxi_id][pick] += count
+                parent.option_values[taxi_id][pick] += reward * count
         node = node.parent
 
 
-def mcts_policy(state, env, iterations=100):
+def new_search_stats():
+    return {"iterations": 0, "nodes": 0, "rollouts": 0, "rollout_steps": 0, "transpositions": 0,
+            "leaf_batches": 0, "leaf_variance": 0.0}
+
+
+def finish_search_stats(stats, elapsed):
+    # adds the derived fields reported by MCTSPolicy.last_stats
+    stats["elapsed"] = elapsed
+    stats["mean_rollout_depth"] = stats["rollout_steps"] / stats["rollouts"] if stats["rollouts"] else 0.0
+    stats["mean_leaf_variance"] = stats["leaf_variance"] / stats["leaf_batches"] if stats["leaf_batches"] else 0.0
+    return stats
 
-    root = MCTSNode(state)
 
-    for _ in range(iterations):
-        # selection: find leaf node
-        node = select(root)
+def rollout_simulators(env, rollout_policy, leaf_rollouts=1):
+    # (RolloutSimulator, BatchRollout, policy function) for a search, the
+    # simulator the options do not ask for is None
+    rng = None
+    if rollout_policy is not None or leaf_rollouts > 1:
+        rng = np.random.default_rng(random.getrandbits(32))
+    if leaf_rollouts > 1:
+        policy = BATCH_ROLLOUT_POLICIES.get(rollout_policy or "random", rollout_policy)
+        return None, BatchRollout(env, leaf_rollouts, rng), policy
+    if rollout_policy is not None:
+        return RolloutSimulator(env, rng), None, ROLLOUT_POLICIES.get(rollout_policy, rollout_policy)
+    return None, None, None
 
-        if node.visits > 0:
-            children = expand(node, env)
-            if children:
-                    node = children[0] 
-        #simulation: rollout from current node
-        reward = rollout(node.state, env, depth=15)
+
+def search(state, env, iterations=100, time_limit=None, stats=None, root=None, action_space="joint",
+           use_spatial_index=False, rollout_policy=None, traffic_aware=False, tree="object", state_cache=4096,
+           transpositions=0, widening=None, max_children=None, leaf_rollouts=1):
+    # builds a tree from state and returns its root
+    # runs until iterations are done or time_limit seconds have passed,
+    # whichever comes first (either may be None), always at least once
+    # root can be a kept subtree from the previous decision (see reroot)
+    # action_space "joint" enumerates single-assignment joint actions,
+    # "factored" lets each idle taxi decide separately (decoupled UCT)
+    # use_spatial_index answers the max_distance filters from Environment.spatial_index
+    # rollout_policy ("random", "greedy" or a function of a RolloutSimulator)
+    # switches rollouts to the fast simulator in fast_rollout.py
+    # traffic_aware measures the max_distance of candidate assignments in
+    # expected steps under the current traffic instead of road steps
+    # tree "flat" searches on a FlatTree (mcts_tree.py) and returns it instead,
+    # keeping at most state_cache node states (joint action space only)
+    # transpositions > 0 shares visit statistics between nodes with the same
+    # state hash (zobrist.py) through an LRU table of that many entries; a
+    # new node whose state is known backs up the known mean value instead of
+    # running a rollout (joint action space)
+    # widening (an exponent, e.g. 0.5) turns on progressive widening: a node
+    # with n visits has at most int(n ** widening) + 1 children, admitted
+    # best first by assignment_priority; max_children prunes each node's
+    # candidates to that many (joint action space)
+    # leaf_rollouts > 1 evaluates each leaf with that many rollouts at once on
+    # a BatchRollout (batch_rollout.py) and backs their mean up once per
+    # rollout; rollout_policy is then "random" (default), "greedy" or a
+    # function of the BatchRollout (joint action space)
+    if (transpositions or widening is not None or max_children is not None or leaf_rollouts > 1) and \
+            action_space != "joint":
+        raise ValueError("transpositions, widening, max_children and leaf_rollouts need the joint action space")
+    if tree == "flat":
+        if action_space != "joint" or root is not None:
+            raise ValueError("the flat tree supports the joint action space without tree reuse only")
+        return flat_search(state, env, iterations, time_limit, stats, use_spatial_index, rollout_policy,
+                           traffic_aware, state_cache, transpositions, widening, max_children, leaf_rollouts)
+    if stats is None:
+        stats = new_search_stats()
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+
+    simulator, batch, rollout_policy = rollout_simulators(env, rollout_policy, leaf_rollouts)
+
+    if root is None:
+        root = MCTSNode(state)
+        stats["nodes"] += 1
+    table = None
+    if transpositions:
+        table = TranspositionTable(transpositions)
+        root.key = env.state_hasher.state_hash(root.state)
+
+    while True:
+        lap = profiling.laps("mcts")
+        known = None
+        if action_space == "factored":
+            # selection and expansion in one pass
+            node = select_factored(root, env, stats, use_spatial_index, traffic_aware)
+            lap("select")
+        else:
+            # selection: find leaf node
+            node = select(root, table, widening)
+            lap("select")
+
+            if node.visits > 0:
+                children = expand(node, env, use_spatial_index, traffic_aware, widening, max_children)
+                if children:
+                        node = children[0] 
+                        stats["nodes"] += 1
+                        if table is not None:
+                            known = table.get(node.key)
+                lap("expand")
+        count = 1
+        if known is not None and known[0] > 0:
+            # transposition: the state was evaluated on another path
+            reward = known[1] / known[0]
+            stats["transpositions"] += 1
+        elif batch is not None:
+            reward = batch_rollout(node.state, batch, rollout_policy, depth=15, stats=stats)[0]
+            count = leaf_rollouts
+        else:
+            #simulation: rollout from current node
+            reward = rollout(node.state, env, depth=15, stats=stats, action_space=action_space,
+                             use_spatial_index=use_spatial_index, simulator=simulator,
+                             rollout_policy=rollout_policy, traffic_aware=traffic_aware)
+        lap("rollout")
         
         # update ancestors
-        backpropagate(node, reward)
+        backpropagate(node, reward, table, count)
+        lap("backpropagate")
+        stats["iterations"] += 1
 
-    # select best action
+        if iterations is not None and stats["iterations"] >= iterations:
+            break
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+        if iterations is None and deadline is None:
+            break
+
+    return root
+
+
+def flat_search(state, env, iterations=100, time_limit=None, stats=None, use_spatial_index=False,
+                rollout_policy=None, traffic_aware=False, state_cache=4096, transpositions=0,
+                widening=None, max_children=None, leaf_rollouts=1):
+    # search with the tree in flat arrays: a node is expanded with all its
+    # legal actions at once, children are picked by vectorized UCB, and the
+    # state of a node comes from the cache or is re-simulated from its parent
+    # with widening the children are stored best first and UCB only looks at
+    # the first widening_limit of them
+    if stats is None:
+        stats = new_search_stats()
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+
+    simulator, batch, rollout_policy = rollout_simulators(env, rollout_policy, leaf_rollouts)
+
+    tree = FlatTree()
+    tree.counter[ROOT] = env.request_counter
+    cache = StateCache(state_cache)
+    table = None
+    if transpositions:
+        table = TranspositionTable(transpositions)
+        tree.key[ROOT] = env.state_hasher.state_hash(state)
+    stats["nodes"] += 1
+    # tree steps run on per-node generators, rollouts on the environment's own
+    rng, np_rng = env.rng, env.np_rng
+    request_counter = env.request_counter
+
+    while True:
+        lap = profiling.laps("mcts")
+        node, node_state, path = ROOT, state, [ROOT]
+        while tree.expanded(node):
+            limit = None if widening is None else widening_limit(tree.visits[node], widening)
+            node = tree.ucb_child(node, table=table, limit=limit)
+            node_state = flat_child_state(tree, cache, env, node, node_state, table)
+            path.append(node)
+        lap("select")
+
+        if tree.visits[node] > 0:
+            index = env.spatial_index(node_state) if use_spatial_index else None
+            radius = action_radius(node_state, env, traffic_aware)
+            if widening is None and max_children is None:
+                edges = [(NO_TAXI, -1)]
+                for taxi, req in legal_assignments(node_state, radius, index, env.road_network):
+                    edges.append((taxi.id, req.id))
+            else:
+                edges = [(taxi.id, req.id) for taxi, req in
+                         ranked_assignments(node_state, radius, index, env.road_network, max_children)]
+                edges.append((NO_TAXI, -1))
+            node = tree.expand(node, edges, [random.getrandbits(63) for _ in edges])
+            stats["nodes"] += len(edges)
+            node_state = flat_child_state(tree, cache, env, node, node_state, table)
+            path.append(node)
+            lap("expand")
+
+        env.rng, env.np_rng = rng, np_rng
+        request_counter = max(request_counter, env.request_counter)
+        known = None if table is None or node == ROOT else table.get(int(tree.key[node]))
+        count = 1
+        if known is not None and known[0] > 0:
+            # transposition: the state was evaluated on another path
+            reward = known[1] / known[0]
+            stats["transpositions"] += 1
+        elif batch is not None:
+            reward = batch_rollout(node_state, batch, rollout_policy, depth=15, stats=stats)[0]
+            count = leaf_rollouts
+        else:
+            reward = rollout(node_state, env, depth=15, stats=stats, simulator=simulator,
+                             use_spatial_index=use_spatial_index, rollout_policy=rollout_policy,
+                             traffic_aware=traffic_aware)
+            request_counter = max(request_counter, env.request_counter)
+        lap("rollout")
+
+        tree.backpropagate(path, reward, table, count)
+        lap("backpropagate")
+        stats["iterations"] += 1
+
+        if iterations is not None and stats["iterations"] >= iterations:
+            break
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+        if iterations is None and deadline is None:
+            break
+
+    # later ids never repeat one handed out during the search
+    env.request_counter = request_counter
+    tree.root_state = state
+    return tree
+
+
+def flat_child_state(tree, cache, env, node, parent_state, table=None):
+    # the state of node from the state of its parent; the step is drawn from
+    # the node's own seed and request counter, so it comes out the same
+    # every time it is re-simulated
+    state = cache.get(node)
+    if state is not None:
+        return state
+    env.reseed(int(tree.seed[node]))
+    parent = tree.parent[node]
+    env.request_counter = int(tree.counter[parent])
+    joint = flat_joint_action(parent_state, tree.taxi[node], tree.request[node])
+    if table is None:
+        state = env.step(parent_state, joint)
+    else:
+        state, key = step_with_key(env, parent_state, int(tree.key[parent]), joint)
+        tree.key[node] = key
+    tree.counter[node] = env.request_counter
+    cache.put(node, state)
+    return state
+
+
+def flat_joint_action(state, taxi_id, request_id):
+    joint = [Action(t.id, "idle") for t in state.taxis]
+    if taxi_id != NO_TAXI:
+        joint[taxi_id] = Action(int(taxi_id), "assign", target=state.requests.get(int(request_id)))
+    return joint
+
+
+def action_key(joint):
+    # hashable identity of a joint action, stable across processes
+    key = []
+    for action in joint:
+        target = action.target
+        if action.action_type == "assign" and target is not None:
+            target = target.id
+        key.append((action.taxi_id, action.action_type, target))
+    return tuple(key)
+
+
+def action_from_key(state, key):
+    # rebuilds a joint action against the requests of state
+    requests = {req.id: req for req in state.requests}
+    joint = []
+    for taxi_id, action_type, target in key:
+        if action_type == "assign":
+            target = requests.get(target)
+            if target is None:
+                action_type = "idle"
+        joint.append(Action(taxi_id, action_type, target=target))
+    return joint
+
+
+def root_statistics(root):
+    # {joint action key: [visits, value]} over the root's children
+    if isinstance(root, FlatTree):
+        return flat_root_statistics(root)
+    stats = {}
+    for child in root.children:
+        entry = stats.setdefault(action_key(child.action), [0, 0.0])
+        entry[0] += child.visits
+        entry[1] += child.value
+    return stats
+
+
+def flat_root_statistics(tree):
+    stats = {}
+    for child in tree.children(ROOT):
+        joint = flat_joint_action(tree.root_state, tree.taxi[child], tree.request[child])
+        entry = stats.setdefault(action_key(joint), [0, 0.0])
+        entry[0] += int(tree.visits[child])
+        entry[1] += float(tree.value[child])
+    return stats
+
+
+def merge_statistics(all_stats):
+    merged = {}
+    for stats in all_stats:
+        for key, (visits, value) in stats.items():
+            entry = merged.setdefault(key, [0, 0.0])
+            entry[0] += visits
+            entry[1] += value
+    return merged
+
+
+def best_key(stats):
+    # same criterion as the serial search: highest mean value
+    return max(stats, key=lambda k: stats[k][1] / stats[k][0] if stats[k][0] > 0 else 0)
+
+
+_worker_env = None  # the pool's Environment, set once per worker process
+
+
+def search_pool(env, workers):
+    # process pool for parallel_mcts_policy: env is pickled to each worker
+    # once, not with every search, so large road networks are sent once
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(env,))
+
+
+def _init_worker(env):
+    global _worker_env
+    _worker_env = env
+
+
+def _search_worker(state, request_counter, iterations, time_limit, seed, options):
+    # runs one independent tree in a worker process; the request counter is
+    # the only part of the environment that changes between decisions
+    env = _worker_env
+    env.request_counter = request_counter
+    random.seed(seed)
+    np.random.seed(seed)
+    env.reseed(seed)
+    stats = new_search_stats()
+    root = search(state, env, iterations, time_limit=time_limit, stats=stats, **options)
+    return root_statistics(root), stats
+
+
+def best_child(root):
     if not root.children:
+        return None
+    return max(root.children, key=lambda c: c.value / c.visits if c.visits > 0 else  0)
+
+
+def state_key(state):
+    # approximate identity of a state: taxi positions, statuses and
+    # assignments plus the set of pending request ids; travel times,
+    # waiting times and traffic are ignored
+    taxis = tuple((t.position, t.status, None if t.assigned_request is None else t.assigned_request.id)
+                  for t in state.taxis)
+    return taxis, tuple(sorted(req.id for req in state.requests))
+
+
+def reroot(node, state):
+    # detaches a kept subtree so it can serve as the root for state
+    # returns None when state does not match the state the subtree was built on
+    # a step's arrivals and cancellations are random draws the tree sampled
+    # differently (even arrivals at the same place get other ids), so a kept
+    # joint-action node only needs the same taxis; its children assigning a
+    # request state does not have are dropped and its untried actions are
+    # listed again for state
+    if node is None:
+        return None
+    key = state_key(state)
+    if state_key(node.state)[0] != key[0]:
+        return None
+    if state_key(node.state)[1] != key[1]:
+        if node.taxi_options is not None:
+            # factored statistics are indexed by the options of the old state
+            return None
+        pending = {req.id for req in state.requests}
+        kept = []
+        for child in node.children:
+            if all(a.action_type != "assign" or a.target is None or a.target.id in pending for a in child.action):
+                kept.append(child)
+            else:
+                node.visits -= child.visits
+                node.value -= child.value
+        node.children = kept
+        node.untried_actions = None
+    node.parent = None
+    node.action = None
+    node.choices = None
+    node.state = state
+    return node
+
+
+def mcts_policy(state, env, iterations=100, time_limit=None, stats=None, **options):
+    # options are passed through to search (action_space, ...)
+
+    root = search(state, env, iterations, time_limit=time_limit, stats=stats, **options)
+
+    if isinstance(root, FlatTree):
+        best = root.best_child()
+        if best is None:
+            return [Action(taxi.id, "idle") for taxi in state.taxis]
+        return flat_joint_action(state, root.taxi[best], root.request[best])
+
+    # select best action
+    best = best_child(root)
+    if best is None:
         return [Action(taxi.id, "idle") for taxi in state.taxis]
-    
-    best = max(root.children, key=lambda c: c.value / c.visits if c.visits > 0 else  0)
     return best.action
 
+
+def parallel_mcts_policy(state, env, iterations, executor, seeds, time_limit=None, stats=None, **options):
+    # root parallelization: independent trees, root statistics merged by joint action
+    # executor comes from search_pool(env, ...), its workers already hold env
+    workers = len(seeds)
+    share = None if iterations is None else -(-iterations // workers)
+    futures = [executor.submit(_search_worker, state, env.request_counter, share, time_limit, seed, options)
+               for seed in seeds]
+    results = [f.result() for f in futures]
+    if stats is not None:
+        for _, worker_stats in results:
+            for name in stats:
+                stats[name] += worker_stats[name]
+    stats = merge_statistics(root_stats for root_stats, _ in results)
+
+    if not stats:
+        return [Action(taxi.id, "idle") for taxi in state.taxis]
+    return action_from_key(state, best_key(stats))
+
 class MCTSPolicy:
-    def __init__(self, env, iterations=100):
+    # iterations and time_limit (seconds) bound each decision, whichever
+    # runs out first; either can be None for a pure time or iteration budget
+    # reuse_tree keeps the subtree under the chosen action and re-roots it
+    # on the next call when the observed state matches it (single process only)
+    # action_space is "joint" or "factored", tree "object" or "flat", see search
+    def __init__(self, env, iterations=100, workers=1, seed=None, time_limit=None, reuse_tree=False,
+                 action_space="joint", use_spatial_index=False, rollout_policy=None, traffic_aware=False,
+                 tree="object", state_cache=4096, transpositions=0, widening=None, max_children=None,
+                 leaf_rollouts=1):
+        if tree == "flat" and reuse_tree:
+            raise ValueError("reuse_tree needs the object tree")
         self.env = env
         self.iterations = iterations
+        self.workers = workers
+        self.time_limit = time_limit
+        self.reuse_tree = reuse_tree
+        self.search_options = {"action_space": action_space, "use_spatial_index": use_spatial_index,
+                               "rollout_policy": rollout_policy, "traffic_aware": traffic_aware,
+                               "tree": tree, "state_cache": state_cache, "transpositions": transpositions,
+                               "widening": widening, "max_children": max_children,
+                               "leaf_rollouts": leaf_rollouts}
+        self.rng = random.Random(seed)
+        self.last_stats = None
+        self._executor = None
+        self._kept = None
     
-    def selectAction(self, state):
-        return mcts_policy(state, self.env, self.iterations)
\ No newline at end of file
+    def selectAction(self, state, time_limit=None):
+        if time_limit is None:
+            time_limit = self.time_limit
+        stats = new_search_stats()
+        start = time.perf_counter()
+
+        if self.workers <= 1 and self.reuse_tree:
+            action = self._search_with_reuse(state, time_limit, stats)
+        elif self.workers <= 1:
+            action = mcts_policy(state, self.env, self.iterations, time_limit=time_limit, stats=stats,
+                                 **self.search_options)
+        else:
+            if self._executor is None:
+                self._executor = search_pool(self.env, self.workers)
+            seeds = [self.rng.getrandbits(32) for _ in range(self.workers)]
+            action = parallel_mcts_policy(state, self.env, self.iterations, self._executor, seeds,
+                                          time_limit=time_limit, stats=stats, **self.search_options)
+
+        self.last_stats = finish_search_stats(stats, time.perf_counter() - start)
+        for name in ("iterations", "nodes", "rollouts", "rollout_steps", "transpositions"):
+            profiling.count("mcts." + name, stats[name])
+        return action
+
+    def _search_with_reuse(self, state, time_limit, stats):
+        root = reroot(self._kept, state)
+        self._kept = None
+        stats["reused_visits"] = 0 if root is None else root.visits
+
+        root = search(state, self.env, self.iterations, time_limit=time_limit, stats=stats, root=root,
+                      **self.search_options)
+        best = best_child(root)
+        if best is None:
+            return [Action(taxi.id, "idle") for taxi in state.taxis]
+
+        self._kept = best
+        # the kept tree may hold request objects from an earlier state
+        return action_from_key(state, action_key(best.action))
+
+    def close(self):
+        # shuts down the worker pool of the root-parallel mode
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,148 @@
+# mcts_tree.py
+# array-backed search tree for mcts_policy.search(tree="flat"): one row per
+# node in parallel numpy arrays, the children of a node in one contiguous
+# block, so UCB over them is a single vectorized expression
+# edges are stored as (taxi id, request id) assignments, -1 = all idle, and
+# states are not stored per node: every node keeps the seed and request
+# counter its step was drawn with, so its state can be re-simulated exactly
+# from its parent's; StateCache keeps a bounded number of them around
+
+from collections import OrderedDict
+import numpy as np
+
+ROOT = 0
+NO_TAXI = -1  # edge that leaves every taxi idle
+COLUMNS = ("parent", "visits", "value", "first_child", "num_children", "taxi", "request", "seed", "counter", "key")
+
+
+class FlatTree:
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.parent = np.empty(0, dtype=np.int32)
+        self.visits = np.empty(0, dtype=np.int64)
+        self.value = np.empty(0, dtype=np.float64)
+        self.first_child = np.empty(0, dtype=np.int32)  # -1 until expanded
+        self.num_children = np.empty(0, dtype=np.int32)
+        self.taxi = np.empty(0, dtype=np.int32)  # edge from the parent
+        self.request = np.empty(0, dtype=np.int64)
+        self.seed = np.empty(0, dtype=np.uint64)  # Environment.reseed for the edge's step
+        self.counter = np.empty(0, dtype=np.int64)  # request_counter after the node's step, -1 until stepped
+        self.key = np.empty(0, dtype=np.uint64)  # state hash, with a transposition table only
+        self.root_state = None
+        self._grow(capacity)
+        self._add(1, -1)  # root
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self, capacity):
+        for name in COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def _add(self, count, parent):
+        first = self.size
+        if first + count > len(self.parent):
+            self._grow(max(2 * len(self.parent), first + count))
+        block = slice(first, first + count)
+        self.parent[block] = parent
+        self.first_child[block] = -1
+        self.counter[block] = -1
+        self.size += count
+        return first
+
+    def expanded(self, node):
+        return self.first_child[node] >= 0
+
+    def expand(self, node, edges, seeds):
+        # children for the (taxi id, request id) edges, first child returned
+        count = len(edges)
+        first = self._add(count, node)
+        self.first_child[node] = first
+        self.num_children[node] = count
+        block = slice(first, first + count)
+        edges = np.asarray(edges, dtype=np.int64).reshape(count, 2)
+        self.taxi[block] = edges[:, 0]
+        self.request[block] = edges[:, 1]
+        self.seed[block] = seeds
+        return first
+
+    def children(self, node):
+        first = self.first_child[node]
+        if first < 0:
+            return range(0)
+        return range(first, first + self.num_children[node])
+
+    def ucb_child(self, node, c=2.0, table=None, limit=None):
+        # UCB1 over the node's children, unvisited children first and ties to
+        # the first one, like max over MCTSNode.children with ucb_score;
+        # with a transposition table, visited children are scored on the
+        # statistics shared by their state (shared_ucb_score); limit only
+        # considers the first limit children (progressive widening)
+        first = self.first_child[node]
+        count = self.num_children[node] if limit is None else min(limit, self.num_children[node])
+        block = slice(first, first + count)
+        visits = self.visits[block]
+        unvisited = np.flatnonzero(visits == 0)
+        if len(unvisited):
+            return first + int(unvisited[0])
+        value = self.value[block]
+        if table is not None:
+            visits, value = visits.copy(), value.copy()
+            for i, key in enumerate(self.key[block].tolist()):
+                entry = table.get(key)
+                if entry is not None and entry[0] > 0:
+                    visits[i], value[i] = entry
+        scores = value / visits + c * np.sqrt(np.log(self.visits[node]) / visits)
+        return first + int(np.argmax(scores))
+
+    def backpropagate(self, path, reward, table=None, count=1):
+        # path: node indices from the root down, each appears once; count
+        # rollouts are behind reward, like mcts_policy.backpropagate
+        self.visits[path] += count
+        self.value[path] += reward * count
+        if table is not None:
+            for key in self.key[path].tolist():
+                entry = table.entry(key)
+                entry[0] += count
+                entry[1] += reward * count
+
+    def best_child(self, node=ROOT):
+        # highest mean value, unvisited children count as 0 like best_child
+        children = self.children(node)
+        if len(children) == 0:
+            return None
+        visits = self.visits[children.start:children.stop]
+        means = np.where(visits > 0, self.value[children.start:children.stop] / np.maximum(visits, 1), 0.0)
+        return children.start + int(np.argmax(means))
+
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in COLUMNS)
+
+
+class StateCache:
+    # least recently used node -> State, at most capacity of them
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.states = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, node):
+        state = self.states.get(node)
+        if state is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.states.move_to_end(node)
+        return state
+
+    def put(self, node, state):
+        if self.capacity <= 0:
+            return
+        self.states[node] = state
+        self.states.move_to_end(node)
+        if len(self.states) > self.capacity:
+            self.states.popitem(last=False)
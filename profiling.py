@@ -0,0 +1,85 @@
+# profiling.py
+# opt-in timing of the hot paths: Environment.step and mcts_policy.search
+# report their phases to the module level PROFILER, which stays None until
+# enable(), so a disabled run only pays one no-op call per phase
+# phase times are inclusive (mcts.rollout contains the env.* phases of the
+# steps it simulates) and only cover this process, root-parallel MCTS
+# workers add their counters but not their phase times
+
+import json
+import time
+
+PROFILER = None
+
+
+class Profiler:
+    def __init__(self):
+        self.calls = {}  # phase -> number of calls
+        self.nanoseconds = {}  # phase -> cumulative nanoseconds
+        self.counters = {}  # name -> total, e.g. mcts.nodes or mcts.rollout_steps
+
+    def add(self, phase, nanoseconds):
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+        self.nanoseconds[phase] = self.nanoseconds.get(phase, 0) + nanoseconds
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def laps(self, prefix):
+        return _Laps(self, prefix)
+
+    def summary(self):
+        phases = {}
+        for phase in sorted(self.calls):
+            calls, total = self.calls[phase], self.nanoseconds[phase]
+            phases[phase] = {"calls": calls, "total_ns": total, "mean_ns": total / calls}
+        return {"phases": phases, "counters": dict(sorted(self.counters.items()))}
+
+
+class _Laps:
+    # laps("env")("copy_state") books the time since the previous lap (or
+    # since laps was called) as phase env.copy_state
+    def __init__(self, profiler, prefix):
+        self.profiler = profiler
+        self.prefix = prefix + "."
+        self.last = time.perf_counter_ns()
+
+    def __call__(self, phase):
+        now = time.perf_counter_ns()
+        self.profiler.add(self.prefix + phase, now - self.last)
+        self.last = time.perf_counter_ns()
+
+
+def _no_lap(phase):
+    pass
+
+
+def laps(prefix):
+    # lap recorder for one pass through a hot path, a no-op when disabled
+    if PROFILER is None:
+        return _no_lap
+    return PROFILER.laps(prefix)
+
+
+def count(name, amount=1):
+    if PROFILER is not None:
+        PROFILER.count(name, amount)
+
+
+def enable():
+    # starts a fresh profile and returns it
+    global PROFILER
+    PROFILER = Profiler()
+    return PROFILER
+
+
+def disable():
+    # stops profiling and returns the summary of the profile, None if none ran
+    global PROFILER
+    profiler, PROFILER = PROFILER, None
+    return None if profiler is None else profiler.summary()
+
+
+def write_json(summary, path):
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=2)
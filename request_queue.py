@@ -0,0 +1,105 @@
+# request_queue.py
+
+
+class RequestQueue:
+    # waiting requests in arrival order, with an id -> slot map so a pickup or
+    # cancellation removes its request in O(1): the slot becomes a tombstone
+    # (None) and the slots are compacted once tombstones outnumber requests
+    # behaves like the list State.requests used to be for reading: len,
+    # iteration, reversed, `in`, indexing and slicing (a slice is a plain
+    # list) follow arrival order over the live requests; for writing it has
+    # append and extend, but remove takes a request id and returns the
+    # request, and the other list methods (insert, pop, sort, item
+    # assignment) are not there, list(queue) gives a list that has them
+    def __init__(self, requests=()):
+        requests = list(requests)
+        self._slots = requests  # Request or None, in arrival order
+        # request id -> index in _slots
+        self._slot_of = {request.id: slot for slot, request in enumerate(requests)}
+        # arrival times never decrease along _slots, up to _last_arrival
+        self._ordered = all(a.arrival_time <= b.arrival_time for a, b in zip(requests, requests[1:]))
+        self._last_arrival = requests[-1].arrival_time if requests else None
+        if len(self._slot_of) < len(requests):
+            # repeated ids, the later request replaces the earlier one
+            self.__init__()
+            for request in requests:
+                self.append(request)
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def __iter__(self):
+        for request in self._slots:
+            if request is not None:
+                yield request
+
+    def __reversed__(self):
+        for request in reversed(self._slots):
+            if request is not None:
+                yield request
+
+    def __getitem__(self, index):
+        # reads never compact, with tombstones this is O(n)
+        if len(self._slots) == len(self._slot_of):
+            return self._slots[index]
+        return list(self)[index]
+
+    def __contains__(self, request):
+        slot = self._slot_of.get(request.id)
+        return slot is not None and self._slots[slot] is request
+
+    def __repr__(self):
+        return f"RequestQueue({list(self)})"
+
+    def append(self, request):
+        # requests are expected in arrival order, anything else falls back to
+        # sorting in by_waiting_time
+        if self._last_arrival is not None and request.arrival_time < self._last_arrival:
+            self._ordered = False
+        else:
+            self._last_arrival = request.arrival_time
+        self.remove(request.id)
+        self._slot_of[request.id] = len(self._slots)
+        self._slots.append(request)
+
+    def extend(self, requests):
+        for request in requests:
+            self.append(request)
+
+    def get(self, request_id):
+        slot = self._slot_of.get(request_id)
+        return None if slot is None else self._slots[slot]
+
+    def remove(self, request_id):
+        # returns the removed request, None when it is not queued
+        slot = self._slot_of.pop(request_id, None)
+        if slot is None:
+            return None
+        request = self._slots[slot]
+        self._slots[slot] = None
+        if len(self._slots) > 2 * len(self._slot_of) + 8:
+            self._compact()
+        return request
+
+    def copy(self):
+        new = RequestQueue()
+        new._slots = [request for request in self._slots if request is not None]
+        new._slot_of = {request.id: slot for slot, request in enumerate(new._slots)}
+        new._ordered = self._ordered
+        new._last_arrival = self._last_arrival
+        return new
+
+    def by_waiting_time(self):
+        # longest waiting first, ties in queue order; waiting_time is
+        # time - arrival_time, so arrival order already is that order
+        requests = list(self)
+        if not self._ordered:
+            requests.sort(key=lambda request: -request.waiting_time)
+        return requests
+
+    def _compact(self):
+        if len(self._slots) == len(self._slot_of):
+            return
+        self._slots = [request for request in self._slots if request is not None]
+        self._slot_of = {request.id: slot for slot, request in enumerate(self._slots)}
+
@@ -0,0 +1,187 @@
+# road_network.py
+# travel times and movement between grid cells
+# GridNetwork is the obstacle-free grid Environment always assumed
+# (manhattan distance, x direction first); GraphNetwork is a road graph over
+# the same cells whose roads join 4-adjacent cells, with closed roads and one
+# way streets, answered from precomputed all-pairs tables
+# either way a road never beats manhattan distance, so manhattan is a valid
+# lower bound for radius filters (spatial_index)
+
+import numpy as np
+
+# neighbour order decides ties between shortest paths: x moves before y moves
+# like Environment has always moved
+STEPS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+# largest GraphNetwork built without asking: 64 x 64 cells, ~134 MB of tables
+MAX_GRAPH_CELLS = 64 * 64
+
+
+class GridNetwork:
+    manhattan = True  # distance is exactly manhattan distance
+
+    def __init__(self, grid_size):
+        self.grid_size = grid_size
+
+    def distance(self, a, b):
+        return abs(a[0] - b[0]) + abs(a[1] - b[1])
+
+    def next_position(self, current, target):
+        # one step toward target, x direction first, then y
+        x, y = current
+        tx, ty = target
+        if x < tx:
+            return (x + 1, y)
+        elif x > tx:
+            return (x - 1, y)
+        elif y < ty:
+            return (x, y + 1)
+        elif y > ty:
+            return (x, y - 1)
+        return current
+
+    # vectorized versions over (n, 2) position arrays
+
+    def distances(self, a, b):
+        # row by row, broadcasting like numpy
+        return np.abs(a - b).sum(axis=-1)
+
+    def distance_matrix(self, a, b):
+        # every row of a to every row of b
+        return np.abs(a[:, None, 0] - b[None, :, 0]) + np.abs(a[:, None, 1] - b[None, :, 1])
+
+    def next_positions(self, a, b):
+        sx = np.sign(b[:, 0] - a[:, 0])
+        sy = np.where(sx != 0, 0, np.sign(b[:, 1] - a[:, 1]))
+        moved = a.copy()
+        moved[:, 0] += sx
+        moved[:, 1] += sy
+        return moved
+
+
+class GraphNetwork:
+    # roads are directed (a, b) pairs of 4-adjacent cells, one step each;
+    # every cell has to be reachable from every other one
+    # tables are (cells, cells) arrays indexed by cell = x * grid_size + y:
+    #   dist[s, t]: steps from s to t
+    #   hop[s, t]: the cell after s on a shortest path to t (t itself if s == t)
+    # both are int32, so the tables take 8 * cells^2 bytes (grid 64: 134 MB,
+    # grid 100: 800 MB, grid 200: 12.8 GB) and building them briefly needs
+    # about as much again; grids over max_cells cells are refused
+    manhattan = False
+
+    def __init__(self, grid_size, roads, max_cells=MAX_GRAPH_CELLS):
+        self.grid_size = grid_size
+        n = grid_size * grid_size
+        if n > max_cells:
+            raise ValueError(f"a {grid_size} x {grid_size} road network needs {8 * n * n / 1e9:.1f} GB of "
+                             f"distance and next-hop tables; pass max_cells={n} to build it anyway")
+        incoming = [[] for _ in range(n)]
+        outgoing = [[] for _ in range(n)]
+        for a, b in roads:
+            if abs(a[0] - b[0]) + abs(a[1] - b[1]) != 1 or not (self._on_grid(a) and self._on_grid(b)):
+                raise ValueError(f"road {a} -> {b} does not join two adjacent cells of the grid")
+            outgoing[self.cell(a)].append(self.cell(b))
+            incoming[self.cell(b)].append(self.cell(a))
+
+        self.dist = self._all_pairs(incoming)
+        if (self.dist < 0).any():
+            raise ValueError("road network is not strongly connected")
+        self.hop = self._next_hops(outgoing)
+
+    def _on_grid(self, p):
+        return 0 <= p[0] < self.grid_size and 0 <= p[1] < self.grid_size
+
+    def cell(self, p):
+        return p[0] * self.grid_size + p[1]
+
+    def position(self, cell):
+        return divmod(int(cell), self.grid_size)
+
+    def _all_pairs(self, incoming):
+        # breadth first search from every source at once: a cell is reached
+        # in round k when one of its incoming roads starts at a cell reached
+        # in round k - 1
+        n = len(incoming)
+        width = max(1, max(len(roads) for roads in incoming))
+        pred = np.full((n, width), -1, dtype=np.int64)
+        for v, roads in enumerate(incoming):
+            pred[v, :len(roads)] = roads
+
+        # source cells are bit-packed along axis 0, one byte covers 8 sources
+        dist = np.full((n, n), -1, dtype=np.int32)
+        np.fill_diagonal(dist, 0)
+        frontier = np.packbits(np.eye(n, dtype=bool), axis=0)
+        reached = frontier.copy()
+        k = 0
+        while frontier.any():
+            k += 1
+            nxt = np.zeros_like(frontier)
+            for slot in range(width):
+                has = pred[:, slot] >= 0
+                nxt[:, has] |= frontier[:, pred[has, slot]]
+            nxt &= ~reached
+            dist[np.unpackbits(nxt, axis=0, count=n).astype(bool)] = k
+            reached |= nxt
+            frontier = nxt
+        return dist
+
+    def _next_hops(self, outgoing):
+        n = len(outgoing)
+        hop = np.tile(np.arange(n, dtype=np.int32), (n, 1))  # hop[s, s] = s
+        found = np.eye(n, dtype=bool)
+        for dx, dy in STEPS:
+            # neighbour of every cell in this direction, if a road goes there
+            nbr = np.full(n, -1, dtype=np.int64)
+            for s in range(n):
+                x, y = self.position(s)
+                target = (x + dx, y + dy)
+                if self._on_grid(target) and self.cell(target) in outgoing[s]:
+                    nbr[s] = self.cell(target)
+            has = nbr >= 0
+            closer = np.zeros((n, n), dtype=bool)
+            closer[has] = self.dist[nbr[has]] == self.dist[has] - 1
+            take = closer & ~found
+            rows, cols = np.nonzero(take)
+            hop[rows, cols] = nbr[rows]
+            found |= take
+        return hop
+
+    def distance(self, a, b):
+        size = self.grid_size
+        return int(self.dist[a[0] * size + a[1], b[0] * size + b[1]])
+
+    def next_position(self, current, target):
+        size = self.grid_size
+        return divmod(int(self.hop[current[0] * size + current[1], target[0] * size + target[1]]), size)
+
+    def distances(self, a, b):
+        return self.dist[self._cells(a), self._cells(b)].astype(np.int64)
+
+    def distance_matrix(self, a, b):
+        return self.dist[np.ix_(self._cells(a), self._cells(b))].astype(np.int64)
+
+    def next_positions(self, a, b):
+        hop = self.hop[self._cells(a), self._cells(b)]
+        return np.stack([hop // self.grid_size, hop % self.grid_size], axis=-1).astype(a.dtype)
+
+    def _cells(self, p):
+        p = np.asarray(p)
+        return p[..., 0] * self.grid_size + p[..., 1]
+
+
+def grid_roads(grid_size, closed=(), one_way=()):
+    # two-way roads between all 4-adjacent cells, minus the closed (a, b)
+    # pairs (both directions), with only a -> b kept for every one_way (a, b)
+    closed = {frozenset(pair) for pair in closed}
+    blocked = {(b, a) for a, b in one_way}
+    roads = []
+    for x in range(grid_size):
+        for y in range(grid_size):
+            for dx, dy in STEPS:
+                a, b = (x, y), (x + dx, y + dy)
+                if not (0 <= b[0] < grid_size and 0 <= b[1] < grid_size):
+                    continue
+                if frozenset((a, b)) in closed or (a, b) in blocked:
+                    continue
+                roads.append((a, b))
+    return roads
@@ -6,23 +6,27 @@ Created on Wed Dec  3 21:08:58 2025
 """
 from environment import Environment
 from greedy_policy import GreedyPolicy, GreedyConfiguration
-from experiments import runMany
-from settings import GRID_SIZE, NUM_TAXIS, REQUEST_RATE, CANCELLATION_PROB, EPISODES, HORIZON
+from experiments import runManyParallel
+from traces import DemandTrace
+from settings import GRID_SIZE, NUM_TAXIS, REQUEST_RATE, CANCELLATION_PROB, EPISODES, HORIZON, SEED, WORKERS, DEMAND_TRACE
 
 
 def buildEnv():
-    return Environment(grid_size=GRID_SIZE, num_taxis=NUM_TAXIS, request_rate=REQUEST_RATE, cancellation_prob=CANCELLATION_PROB)
+    trace = DemandTrace.load(DEMAND_TRACE) if DEMAND_TRACE else None
+    return Environment(grid_size=GRID_SIZE, num_taxis=NUM_TAXIS, request_rate=REQUEST_RATE, cancellation_prob=CANCELLATION_PROB,
+                       demand_trace=trace)
 
 def buildPolicy(env):
     cfg = GreedyConfiguration()
     return GreedyPolicy(cfg, env)
 
-episodes = EPISODES
-maxSteps = HORIZON
+if __name__ == "__main__":
+    episodes = EPISODES
+    maxSteps = HORIZON
 
-results = runMany(buildEnv, buildPolicy, episodes, maxSteps)
-print("Greedy policy results over " + str(episodes) + " episodes:")
-i = 0
-while i < len(results):
-    print("Episode " + str(i + 1) + " " + str(results[i]))
-    i = i + 1
\ No newline at end of file
+    results = runManyParallel(buildEnv, buildPolicy, episodes, maxSteps, workers=WORKERS, seed=SEED)
+    print("Greedy policy results over " + str(episodes) + " episodes:")
+    i = 0
+    while i < len(results):
+        print("Episode " + str(i + 1) + " " + str(results[i]))
+        i = i + 1
@@ -3,11 +3,14 @@
 import matplotlib.pyplot as plt
 import random
 import numpy as np
+import profiling
 from environment import Environment
 from reward import RewardConfiguration, computeStepReward
 from greedy_policy import GreedyPolicy, GreedyConfiguration
 from mcts_policy import MCTSPolicy
 from metrics import EpisodeHistory, summarizedMetrics
+from crn import RandomTrace, TraceEnvironment, paired_differences
+from experiments import episodeSeeds
 
 from settings import (
     GRID_SIZE,
@@ -17,6 +20,12 @@ from settings import (
     EPISODES,
     HORIZON,
     MCTS_ITERATIONS,
+    MCTS_WORKERS,
+    MCTS_TIME_LIMIT,
+    MCTS_REUSE_TREE,
+    SEED,
+    PAIRED_EVALUATION,
+    PROFILE_PATH,
 )
 
 reward_config = RewardConfiguration()
@@ -49,8 +58,12 @@ def run_episode(env, policy, horizon=100):
     return metrics, total_reward
 
 
-def run_experiment(num_episodes=EPISODES, horizon=HORIZON, mcts_iterations=MCTS_ITERATIONS):
+def run_experiment(num_episodes=EPISODES, horizon=HORIZON, mcts_iterations=MCTS_ITERATIONS, mcts_workers=MCTS_WORKERS,
+                   mcts_time_limit=MCTS_TIME_LIMIT, mcts_reuse_tree=MCTS_REUSE_TREE, profile_path=PROFILE_PATH):
     # comp btwn greedy and mcts
+    # profile_path: write per-phase timings of both policies' episodes there as json
+    if profile_path is not None:
+        profiling.enable()
     
     greedy_config = GreedyConfiguration()
     
@@ -61,7 +74,9 @@ def run_experiment(num_episodes=EPISODES, horizon=HORIZON, mcts_iterations=MCTS_
 
     print("-" * 30)
     print(f"Running {num_episodes} episodes (horizon={horizon})")
-    print(f"MCTS iterations per step: {mcts_iterations}")
+    print(f"MCTS iterations per step: {mcts_iterations} (workers: {mcts_workers})")
+    if mcts_time_limit is not None:
+        print(f"MCTS time limit per step: {mcts_time_limit * 1000:.0f} ms")
     print("-" * 30)
 
     for i in range(num_episodes):
@@ -72,8 +87,10 @@ def run_experiment(num_episodes=EPISODES, horizon=HORIZON, mcts_iterations=MCTS_
             request_rate=REQUEST_RATE,
             cancellation_prob=CANCELLATION_PROB,
         )
-        mcts_policy = MCTSPolicy(env_mcts, iterations=mcts_iterations)
+        mcts_policy = MCTSPolicy(env_mcts, iterations=mcts_iterations, workers=mcts_workers,
+                                 time_limit=mcts_time_limit, reuse_tree=mcts_reuse_tree)
         metrics_m, mcts_r = run_episode(env_mcts, mcts_policy, horizon)
+        mcts_policy.close()
         
         env_greedy = Environment(
             grid_size=GRID_SIZE,
@@ -101,6 +118,8 @@ def run_experiment(num_episodes=EPISODES, horizon=HORIZON, mcts_iterations=MCTS_
     print(f"MCTS   Mean: {np.mean(mcts_rewards):7.2f} ± {np.std(mcts_rewards):6.2f}")
     print(f"Greedy Mean: {np.mean(greedy_rewards):7.2f} ± {np.std(greedy_rewards):6.2f}")
     print(f"Difference:  {np.mean(mcts_rewards) - np.mean(greedy_rewards):+7.2f}")
+    if profile_path is not None:
+        report_profile(profiling.disable(), profile_path)
 
     plt.figure(figsize=(12, 5))
         
@@ -115,4 +134,67 @@ def run_experiment(num_episodes=EPISODES, horizon=HORIZON, mcts_iterations=MCTS_
     plt.tight_layout()
     plt.show()
 
-run_experiment(num_episodes=EPISODES, horizon=HORIZON, mcts_iterations=MCTS_ITERATIONS)
\ No newline at end of file
+def report_profile(summary, path):
+    profiling.write_json(summary, path)
+    print("\n" + "-"*30)
+    print(f"PROFILE (written to {path})")
+    print("-"* 30)
+    for phase, entry in summary["phases"].items():
+        print(f"{phase:28s} {entry['calls']:9d} calls {entry['total_ns'] / 1e6:10.1f} ms")
+    for name, total in summary["counters"].items():
+        print(f"{name:28s} {total:9d}")
+
+def run_paired_experiment(num_episodes=EPISODES, horizon=HORIZON, mcts_iterations=MCTS_ITERATIONS, mcts_workers=MCTS_WORKERS,
+                          mcts_time_limit=MCTS_TIME_LIMIT, mcts_reuse_tree=MCTS_REUSE_TREE, seed=SEED):
+    # both policies replay the same RandomTrace per episode (common random
+    # numbers), so the per-episode difference is not drowned in demand noise
+    greedy_config = GreedyConfiguration()
+    env_args = dict(grid_size=GRID_SIZE, num_taxis=NUM_TAXIS, request_rate=REQUEST_RATE,
+                    cancellation_prob=CANCELLATION_PROB)
+
+    mcts_rewards = []
+    greedy_rewards = []
+
+    print("-" * 30)
+    print(f"Running {num_episodes} paired episodes (horizon={horizon}, seed={seed})")
+    print(f"MCTS iterations per step: {mcts_iterations} (workers: {mcts_workers})")
+    print("-" * 30)
+
+    for i, episode_seed in enumerate(episodeSeeds(num_episodes, seed)):
+        trace = RandomTrace(Environment(**env_args), horizon, episode_seed)
+
+        # the planner simulates with its own environment, it must not see the trace
+        env_plan = Environment(seed=episode_seed, **env_args)
+        env_plan.request_counter = trace.num_requests  # simulated requests never reuse a trace id
+        mcts_policy = MCTSPolicy(env_plan, iterations=mcts_iterations, workers=mcts_workers, seed=episode_seed,
+                                 time_limit=mcts_time_limit, reuse_tree=mcts_reuse_tree)
+        _, mcts_r = run_episode(TraceEnvironment(trace, seed=episode_seed, **env_args), mcts_policy, horizon)
+        mcts_policy.close()
+
+        env_greedy = TraceEnvironment(trace, seed=episode_seed, **env_args)
+        _, greedy_r = run_episode(env_greedy, GreedyPolicy(greedy_config, env_greedy), horizon)
+
+        mcts_rewards.append(mcts_r)
+        greedy_rewards.append(greedy_r)
+        print(
+            f"Episode {i+1:2d} | MCTS: {mcts_r:7.2f} | Greedy: {greedy_r:7.2f} | "
+            f"Diff: {mcts_r - greedy_r:+7.2f}"
+        )
+
+    paired = paired_differences(mcts_rewards, greedy_rewards)
+    print("\n" + "-"*30)
+    print("PAIRED SUMMARY")
+    print("-"* 30)
+    print(f"MCTS   Mean: {np.mean(mcts_rewards):7.2f} ± {np.std(mcts_rewards):6.2f}")
+    print(f"Greedy Mean: {np.mean(greedy_rewards):7.2f} ± {np.std(greedy_rewards):6.2f}")
+    print(f"Difference:  {paired['mean']:+7.2f} ± {paired['std']:6.2f} (paired)")
+    print(f"{paired['confidence']:.0%} CI:      [{paired['ci_low']:+7.2f}, {paired['ci_high']:+7.2f}]")
+    return paired
+
+if __name__ == "__main__" and PAIRED_EVALUATION:
+    run_paired_experiment(num_episodes=EPISODES, horizon=HORIZON, mcts_iterations=MCTS_ITERATIONS,
+                          mcts_workers=MCTS_WORKERS, mcts_time_limit=MCTS_TIME_LIMIT,
+                          mcts_reuse_tree=MCTS_REUSE_TREE, seed=SEED)
+elif __name__ == "__main__":
+    run_experiment(num_episodes=EPISODES, horizon=HORIZON, mcts_iterations=MCTS_ITERATIONS, mcts_workers=MCTS_WORKERS,
+                   mcts_time_limit=MCTS_TIME_LIMIT, mcts_reuse_tree=MCTS_REUSE_TREE)
\ No newline at end of file
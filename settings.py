@@ -12,7 +12,15 @@ CANCELLATION_PROB = 0.2
 
 EPISODES = 20      # number of episodes to run
 HORIZON = 50        # steps per episode
+SEED = 0            # sweep seed, each episode gets its own seed derived from it
+WORKERS = None      # processes for the episode sweep, None = all cores
+DEMAND_TRACE = None  # directory written by traces.py to replay instead of sampling arrivals
 MCTS_ITERATIONS = 200
+MCTS_WORKERS = 1      # >1 runs root-parallel trees in a process pool
+MCTS_TIME_LIMIT = None  # seconds per decision, None = iterations only
+MCTS_REUSE_TREE = False  # carry the chosen subtree over to the next decision
+PAIRED_EVALUATION = False  # run_mcts.py: replay one random trace per episode for both policies
+PROFILE_PATH = None  # json file for per-phase timings of the run (profiling.py), None = off
 
 PROFIT_PER_RIDE = 10.0
 TRAVEL_COST_PER_STEP = 0.1
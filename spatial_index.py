@@ -0,0 +1,155 @@
+# spatial_index.py
+
+
+class GridIndex:
+    # uniform grid buckets of points keyed by item id, queried in manhattan distance
+    # copies share their buckets until one of them writes to a cell
+    def __init__(self, cell_size=5):
+        self.cell_size = cell_size
+        self.cells = {}  # (cx, cy) -> {item_id: position}
+        self.positions = {}  # item_id -> position
+        self._owned = set()  # cells whose bucket is not shared with a copy
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, item_id):
+        return item_id in self.positions
+
+    def _cell(self, position):
+        return (position[0] // self.cell_size, position[1] // self.cell_size)
+
+    def add(self, item_id, position):
+        if item_id in self.positions:
+            self.remove(item_id)
+        self.positions[item_id] = position
+        self._bucket(self._cell(position))[item_id] = position
+
+    def remove(self, item_id):
+        # returns False when the item was not indexed
+        position = self.positions.pop(item_id, None)
+        if position is None:
+            return False
+        cell = self._cell(position)
+        bucket = self._bucket(cell)
+        del bucket[item_id]
+        if not bucket:
+            del self.cells[cell]
+            self._owned.discard(cell)
+        return True
+
+    def _bucket(self, cell):
+        # writable bucket of cell, copied first if a copy still shares it
+        bucket = self.cells.get(cell)
+        if bucket is None:
+            bucket = self.cells[cell] = {}
+        elif cell not in self._owned:
+            bucket = self.cells[cell] = dict(bucket)
+        self._owned.add(cell)
+        return bucket
+
+    def copy(self):
+        # copy-on-write: the buckets are shared by both until written
+        new = GridIndex(self.cell_size)
+        new.positions = dict(self.positions)
+        new.cells = dict(self.cells)
+        self._owned = set()
+        return new
+
+    def within(self, point, radius):
+        # [(distance, item_id)] with distance <= radius, closest first
+        px, py = point
+        cx0, cy0 = self._cell((px - radius, py - radius))
+        cx1, cy1 = self._cell((px + radius, py + radius))
+
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self.cells):
+            buckets = self.cells.values()
+        else:
+            buckets = [self.cells[cell] for cell in
+                       ((cx, cy) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1))
+                       if cell in self.cells]
+
+        found = []
+        for bucket in buckets:
+            for item_id, (x, y) in bucket.items():
+                distance = abs(x - px) + abs(y - py)
+                if distance <= radius:
+                    found.append((distance, item_id))
+        found.sort()
+        return found
+
+    def nearest(self, point, k=1, exclude=None):
+        # [(distance, item_id)] of the k closest items, ties broken by id
+        px, py = point
+        cx0, cy0 = self._cell(point)
+        size = self.cell_size
+        remaining = len(self.positions)
+
+        found = []
+        ring = 0
+        while remaining > 0:
+            if 8 * ring > len(self.cells):
+                # rings are sparser than the occupied cells: scan what is left
+                seen = {item_id for _, item_id in found}
+                for item_id, (x, y) in self.positions.items():
+                    if item_id not in seen and (exclude is None or item_id not in exclude):
+                        found.append((abs(x - px) + abs(y - py), item_id))
+                found.sort()
+                return found[:k]
+
+            for cell in _ring_cells(cx0, cy0, ring):
+                bucket = self.cells.get(cell)
+                if bucket is None:
+                    continue
+                remaining -= len(bucket)
+                for item_id, (x, y) in bucket.items():
+                    if exclude is None or item_id not in exclude:
+                        found.append((abs(x - px) + abs(y - py), item_id))
+
+            # anything outside the rings seen so far is farther than ring * size
+            if len(found) >= k:
+                found.sort()
+                if found[k - 1][0] <= ring * size:
+                    return found[:k]
+            ring += 1
+
+        found.sort()
+        return found[:k]
+
+
+def _ring_cells(cx, cy, ring):
+    if ring == 0:
+        yield (cx, cy)
+        return
+    for dx in range(-ring, ring + 1):
+        yield (cx + dx, cy - ring)
+        yield (cx + dx, cy + ring)
+    for dy in range(-ring + 1, ring):
+        yield (cx - ring, cy + dy)
+        yield (cx + ring, cy + dy)
+
+
+class FleetIndex:
+    # pending requests by pickup location and idle taxis by position
+    def __init__(self, state, cell_size=5):
+        self.requests = GridIndex(cell_size)
+        self.idle_taxis = GridIndex(cell_size)
+        for req in state.requests:
+            self.requests.add(req.id, req.origin)
+        for taxi in state.taxis:
+            if taxi.status == "idle":
+                self.idle_taxis.add(taxi.id, taxi.position)
+
+    def copy(self):
+        new = FleetIndex.__new__(FleetIndex)
+        new.requests = self.requests.copy()
+        new.idle_taxis = self.idle_taxis.copy()
+        return new
+
+    def requests_within(self, point, radius):
+        # ids of pending requests whose pickup is within radius of point
+        return [req_id for _, req_id in self.requests.within(point, radius)]
+
+    def nearest_idle_taxis(self, point, k=1, exclude=None):
+        # ids of the k idle taxis closest to point
+        return [taxi_id for _, taxi_id in self.idle_taxis.nearest(point, k, exclude)]
@@ -119,7 +119,578 @@ def test_observation_model():
         print(f"  Observed requests: {len(obs['requests'])}")
         print(f"  Traffic estimate: {obs['traffic_estimate']:.2f}")
 
+def test_array_state():
+
+    print("\n" + "-" * 60)
+    print("Array State test")
+    print("-" * 60)
+
+    from array_state import from_state, to_state, step_arrays
+
+    env = Environment(grid_size=5, num_taxis=2, request_rate=0, cancellation_prob=0)
+
+    taxi1 = Taxi(0, (0, 0))
+    taxi2 = Taxi(1, (4, 4))
+    request1 = Request(0, (2, 2), (3, 3), arrival_time=0)
+    state = State([taxi1, taxi2], [request1], time=0)
+
+    # round trip keeps taxis and queue intact
+    back = to_state(from_state(state))
+    assert [t.position for t in back.taxis] == [(0, 0), (4, 4)]
+    assert [r.id for r in back.requests] == [0]
+
+    arr = step_arrays(env, from_state(state), [Action(0, "assign", target=request1), Action(1, "idle")])
+    next_state = to_state(arr)
+    print(f"  Taxi 0 at {next_state.taxis[0].position}, status: {next_state.taxis[0].status}")
+    assert next_state.taxis[0].status == "en_route_to_pickup"
+    assert next_state.taxis[0].assigned_request.id == 0
+
+    completed = []
+    for i in range(40):
+        arr = step_arrays(env, arr, [Action(0, "idle"), Action(1, "idle")])
+        completed += env.get_last_step_info()["completed_rides"]
+    assert completed == [0]
+    assert to_state(arr).taxis[0].position == (3, 3)
+
+def test_copy_on_write():
+
+    print("\n" + "-" * 60)
+    print("Copy-on-write test")
+    print("-" * 60)
+
+    env = Environment(grid_size=5, num_taxis=2, request_rate=0, cancellation_prob=0, seed=0)
+
+    request1 = Request(0, (2, 2), (3, 3), arrival_time=0)
+    state = State([Taxi(0, (0, 0)), Taxi(1, (4, 4))], [request1], time=0)
+
+    next_state = env.step(state, [Action(0, "assign", target=request1), Action(1, "idle")])
+
+    # parent is untouched, the idle taxi is shared
+    assert state.taxis[0].status == "idle"
+    assert state.requests[0].waiting_time == 0
+    assert next_state.taxis[0] is not state.taxis[0]
+    assert next_state.taxis[1] is state.taxis[1]
+    assert next_state.requests[0].waiting_time == 1
+
+def test_spatial_index():
+
+    print("\n" + "-" * 60)
+    print("Spatial Index test")
+    print("-" * 60)
+
+    from spatial_index import FleetIndex
+
+    env = Environment(grid_size=20, num_taxis=8, request_rate=2.0)
+    state = env.create_initial_state()
+    env.spatial_index(state)
+
+    for step in range(15):
+        idle = [t for t in state.taxis if t.status == "idle"]
+        actions = [Action(t.id, "idle") for t in state.taxis]
+        for taxi, request in zip(idle, state.requests):
+            actions[taxi.id] = Action(taxi.id, "assign", target=request)
+        state = env.step(state, actions)
+
+        # the index handed along by step matches one built from scratch
+        index = state.spatial_index
+        fresh = FleetIndex(state)
+        assert index.requests.positions == fresh.requests.positions
+        assert index.idle_taxis.positions == fresh.idle_taxis.positions
+
+    point = (10, 10)
+    expected = sorted((abs(r.origin[0] - 10) + abs(r.origin[1] - 10), r.id) for r in state.requests)
+    expected = [rid for d, rid in expected if d <= 6]
+    assert env.spatial_index(state).requests_within(point, 6) == expected
+
+    idle = sorted((abs(t.position[0] - 10) + abs(t.position[1] - 10), t.id)
+                  for t in state.taxis if t.status == "idle")
+    assert env.spatial_index(state).nearest_idle_taxis(point, 2) == [tid for _, tid in idle[:2]]
+
+    # two children stepped from one parent (as MCTS does) both carry an
+    # index, and the parent keeps its own untouched
+    import environment
+    builds = []
+
+    class CountingIndex(FleetIndex):
+        def __init__(self, *args):
+            builds.append(1)
+            FleetIndex.__init__(self, *args)
+
+    environment.FleetIndex = CountingIndex
+    try:
+        parent = state
+        before = dict(parent.spatial_index.requests.positions)
+        idle_all = [Action(t.id, "idle") for t in parent.taxis]
+        children = [env.step(parent, idle_all) for _ in range(2)]
+        for child in children:
+            assert env.spatial_index(child) is child.spatial_index
+            assert child.spatial_index.requests.positions == FleetIndex(child).requests.positions
+        assert parent.spatial_index.requests.positions == before == FleetIndex(parent).requests.positions
+        assert not builds
+    finally:
+        environment.FleetIndex = FleetIndex
+
+def test_batch_environment():
+
+    print("\n" + "-" * 60)
+    print("Batch Environment test")
+    print("-" * 60)
+
+    from batch_env import BatchEnvironment, greedy_batch_actions
+    from experiments import runManyBatched
+
+    # no demand: every taxi idles every step
+    env = BatchEnvironment(3, grid_size=5, num_taxis=2, request_rate=0, seed=0)
+    for step in range(5):
+        env.step(greedy_batch_actions(env))
+    for metrics in env.summarized_metrics():
+        assert metrics["avg_idle_time"] == 5.0
+        assert abs(metrics["total_revenue"] + 10 * env.reward_config.idlePenaltyPerStep) < 1e-9
+
+    # one request served by the nearest taxi of each episode
+    env = BatchEnvironment(2, grid_size=5, num_taxis=2, request_rate=0, cancellation_prob=0, seed=0)
+    env.taxi_pos[:] = [[0, 0], [4, 4]]
+    env.req_origin[:, 0] = [3, 4]
+    env.req_dest[:, 0] = [0, 4]
+    env.req_active[:, 0] = env.req_used[:, 0] = env.req_seen[:, 0] = True
+    assign = greedy_batch_actions(env)
+    assert assign.tolist() == [[-1, 0], [-1, 0]]
+    for step in range(20):
+        env.step(assign if step == 0 else greedy_batch_actions(env))
+    # like GreedyPolicy, the request stays a candidate while taxi 1 drives to it,
+    # so the idle taxi 0 is sent as well and both complete the ride
+    assert env.completed.tolist() == [2, 2]
+
+    results = runManyBatched(lambda n: BatchEnvironment(n, 10, 5, 2.0, 0.2, seed=1), 4, 10)
+    print(f"  Batched greedy: {results[0]}")
+    assert len(results) == 4
+
+def _seeded_env():
+    return Environment(grid_size=10, num_taxis=5, request_rate=2.0, cancellation_prob=0.2)
+
+def _seeded_greedy(env):
+    from greedy_policy import GreedyPolicy, GreedyConfiguration
+    return GreedyPolicy(GreedyConfiguration(), env)
+
+def test_seeded_parallel_runs():
+    print("-" * 60)
+    print("Seeded parallel runs test")
+    print("-" * 60)
+    from experiments import runManyParallel
+
+    # same seed, same episode, whatever else used the global generators
+    first = Environment(grid_size=10, num_taxis=3, seed=5).create_initial_state()
+    random.random()
+    second = Environment(grid_size=10, num_taxis=3, seed=5).create_initial_state()
+    assert [t.position for t in first.taxis] == [t.position for t in second.taxis]
+
+    serial = runManyParallel(_seeded_env, _seeded_greedy, 4, 15, workers=1, seed=3)
+    parallel = runManyParallel(_seeded_env, _seeded_greedy, 4, 15, workers=2, seed=3)
+    print(f"  Episode 1: {serial[0]}")
+    assert serial == parallel
+    assert serial != runManyParallel(_seeded_env, _seeded_greedy, 4, 15, workers=1, seed=4)
+    assert len(set(str(m) for m in serial)) > 1  # episodes get different seeds
+
+def test_common_random_numbers():
+    print("-" * 60)
+    print("Common random numbers test")
+    print("-" * 60)
+    from crn import RandomTrace, TraceEnvironment, paired_differences
+    from greedy_policy import GreedyPolicy, GreedyConfiguration
+
+    args = dict(grid_size=10, num_taxis=4, request_rate=2.0, cancellation_prob=0.2)
+    trace = RandomTrace(Environment(**args), horizon=30, seed=11)
+
+    def play(choose, seed):
+        # trips seen right after they arrive and the total reward
+        env = TraceEnvironment(trace, seed=seed, **args)
+        state = env.create_initial_state()
+        start = [t.position for t in state.taxis]
+        seen = set()
+        total = 0.0
+        for _ in range(30):
+            state = env.step(state, choose(env, state))
+            total += env.get_reward(state)
+            seen |= {(r.id, r.origin, r.destination, r.arrival_time) for r in state.requests if r.waiting_time == 1}
+        return start, seen, total
+
+    idle = lambda env, state: [Action(t.id, "idle") for t in state.taxis]
+    greedy = lambda env, state: GreedyPolicy(GreedyConfiguration(), env).selectAction(state)
+
+    start_i, seen_i, total_i = play(idle, 1)
+    start_g, seen_g, total_g = play(greedy, 2)
+    print(f"  Idle: {total_i:.2f}, Greedy: {total_g:.2f}, trips: {len(seen_g)}")
+    # same demand whatever the policy did, only the decisions differ
+    assert start_i == start_g
+    assert seen_i == seen_g and len(seen_i) > 0
+    assert total_g > total_i
+    assert play(greedy, 3)[2] == total_g
+
+    paired = paired_differences([3.0, 5.0, 4.0], [1.0, 2.0, 3.0])
+    assert paired["mean"] == 2.0 and paired["ci_low"] < 2.0 < paired["ci_high"]
+
+def test_demand_trace():
+    print("-" * 60)
+    print("Demand trace test")
+    print("-" * 60)
+    import os
+    import tempfile
+    from traces import DemandTrace, generate_demand, import_trip_log
+
+    env = Environment(grid_size=10, num_taxis=3, request_rate=2.0)
+    trace = generate_demand(env, horizon=400, seed=4)
+    print(f"  {len(trace)} requests over {trace.horizon} steps")
+    assert trace.horizon <= 400 and len(trace) > 400
+    assert (trace.origin != trace.destination).any(axis=1).all()
+
+    with tempfile.TemporaryDirectory() as path:
+        trace.save(path)
+        loaded = DemandTrace.load(path)
+        assert isinstance(loaded.arrival, np.memmap)
+        assert loaded.trips(100) == trace.trips(100)
+
+        # the environment streams exactly the rows of each time step
+        env = Environment(grid_size=10, num_taxis=3, request_rate=2.0, demand_trace=loaded)
+        state = env.create_initial_state()
+        for t in range(5):
+            expected = loaded.trips(t)
+            next_state = env.step(state, [Action(taxi.id, "idle") for taxi in state.taxis])
+            arrived = [(r.origin, r.destination) for r in next_state.requests if r.arrival_time == t]
+            assert set(arrived) <= set(expected)
+            assert env.request_counter - sum(len(loaded.trips(k)) for k in range(t + 1)) == 0
+            state = next_state
+
+        log = os.path.join(path, "trips.csv")
+        with open(log, "w") as f:
+            f.write("arrival_time,origin_x,origin_y,destination_x,destination_y\n")
+            f.write("3,0,0,4,4\n1,1,1,2,2\n2,5,5,5,5\n2,0,0,20,1\n")
+        imported = import_trip_log(log, grid_size=10)
+        # sorted by arrival, same-cell and off-grid trips dropped
+        assert imported.arrival.tolist() == [1, 3]
+        assert imported.trips(0, 10) == [((1, 1), (2, 2)), ((0, 0), (4, 4))]
+
+def test_event_simulation():
+    print("-" * 60)
+    print("Event-driven simulation test")
+    print("-" * 60)
+    from event_sim import EventSimulator, run_event_episode
+    from traces import DemandTrace
+    from greedy_policy import GreedyPolicy, GreedyConfiguration
+    from metrics import EpisodeHistory, summarizedMetrics
+
+    # one request at step 3, one taxi nine cells from its pickup
+    env = Environment(grid_size=10, num_taxis=1, request_rate=0.0, cancellation_prob=0.0)
+    trace = DemandTrace([3], [(0, 0)], [(0, 9)])
+    sim = EventSimulator(env, horizon=60, seed=2, demand_trace=trace)
+    state = sim.reset()
+    sim.position[0] = (9, 0)
+
+    state = sim.step([Action(0, "idle")])
+    # nothing happens before the request arrives in step 3
+    assert state.time == 4 and sim.get_last_step_info()["elapsed"] == 4
+    assert [r.waiting_time for r in state.requests] == [1]
+
+    state = sim.step([Action(0, "assign", target=state.requests[0])])
+    info = sim.get_last_step_info()
+    print(f"  Epoch at {state.time}: {info['events']}")
+    steps = {kind: step for step, kind, _ in info["events"]}
+    assert steps["pickup"] >= 4 + 9 and steps["dropoff"] >= steps["pickup"] + 10
+    assert sim.done and info["completed_rides"] == [0]
+    assert info["idle_steps"][0] == 60 - steps["dropoff"]
+
+    def play(seed):
+        env = Environment(grid_size=10, num_taxis=5, request_rate=0.3, cancellation_prob=0.2)
+        sim = EventSimulator(env, horizon=288, seed=seed)
+        hist = EpisodeHistory()
+        total, epochs = run_event_episode(sim, GreedyPolicy(GreedyConfiguration(), env), hist)
+        return total, epochs, summarizedMetrics(hist)
+
+    total, epochs, metrics = play(7)
+    print(f"  288 steps in {epochs} epochs: {metrics}")
+    assert epochs < 288 and metrics["completed_rides"] > 0
+    assert metrics["total_revenue"] == total
+    assert play(7)[0] == total
+
+def test_event_simulation_metrics():
+    print("-" * 60)
+    print("Event-driven simulation metrics test")
+    print("-" * 60)
+    from event_sim import EventSimulator, run_event_episode
+    from greedy_policy import GreedyPolicy, GreedyConfiguration
+    from experiments import runEpisode
+    from reward import RewardConfiguration
+    from metrics import EpisodeHistory, summarizedMetrics
+
+    # summarizedMetrics of the two paths agree in distribution
+    episodes = 200
+    stepped, evented = [], []
+    for seed in range(episodes):
+        env = Environment(grid_size=10, num_taxis=5, request_rate=0.3, cancellation_prob=0.2, seed=seed)
+        hist = runEpisode(env, GreedyPolicy(GreedyConfiguration(), env), 288, RewardConfiguration())
+        stepped.append(summarizedMetrics(hist))
+        env = Environment(grid_size=10, num_taxis=5, request_rate=0.3, cancellation_prob=0.2)
+        hist = EpisodeHistory()
+        run_event_episode(EventSimulator(env, horizon=288, seed=seed), GreedyPolicy(GreedyConfiguration(), env), hist)
+        evented.append(summarizedMetrics(hist))
+    for key in stepped[0]:
+        a = np.array([m[key] for m in stepped])
+        b = np.array([m[key] for m in evented])
+        error = np.sqrt(a.var() / episodes + b.var() / episodes)
+        print(f"  {key}: {a.mean():.2f} vs {b.mean():.2f} (se {error:.2f})")
+        assert abs(a.mean() - b.mean()) < 4 * error
+
+def test_road_network():
+    print("-" * 60)
+    print("Road network test")
+    print("-" * 60)
+    from road_network import GridNetwork, GraphNetwork, grid_roads
+    from greedy_policy import GreedyPolicy, GreedyConfiguration
+
+    # the full grid as a road graph is the open grid
+    grid, graph = GridNetwork(6), GraphNetwork(6, grid_roads(6))
+    cells = [(x, y) for x in range(6) for y in range(6)]
+    for a in cells:
+        for b in cells:
+            assert graph.distance(a, b) == grid.distance(a, b)
+            assert graph.next_position(a, b) == grid.next_position(a, b)
+
+    # a wall between x = 4 and x = 5 with one gap at y = 9
+    wall = [((4, y), (5, y)) for y in range(9)]
+    network = GraphNetwork(10, grid_roads(10, closed=wall))
+    assert network.distance((4, 0), (5, 0)) == 19
+    points = np.array([(4, 0), (0, 0)])
+    assert network.distances(points, np.array([(5, 0), (5, 0)])).tolist() == [19, 23]
+    print(f"  (4, 0) -> (5, 0): {network.distance((4, 0), (5, 0))} steps")
+
+    env = Environment(grid_size=10, num_taxis=2, request_rate=0.0, road_network=network)
+    state = State([Taxi(0, (4, 0)), Taxi(1, (9, 9))], [Request(0, (5, 0), (6, 0), 0)], 0)
+    actions = GreedyPolicy(GreedyConfiguration(), env).selectAction(state)
+    # taxi 0 is one cell away on the map but 19 by road, taxi 1 is 13 by road
+    assert actions[1].action_type == "assign" and actions[0].action_type == "idle"
+
+    state = env.step(state, [Action(0, "assign", target=state.requests[0]), Action(1, "idle")])
+    assert state.taxis[0].remaining_travel_time in (18, 19)
+    path = [state.taxis[0].position]
+    for _ in range(8):
+        state = env.step(state, [Action(0, "idle"), Action(1, "idle")])
+        path.append(state.taxis[0].position)
+    # along the wall to the gap, delays only add time, not detours
+    assert path == [(4, y) for y in range(1, 10)]
+
+    # dense tables are refused beyond the cell limit unless asked for
+    try:
+        GraphNetwork(200, [])
+        assert False, "a 200 x 200 road network was built"
+    except ValueError as error:
+        assert "12.8 GB" in str(error)
+    assert GraphNetwork(3, grid_roads(3), max_cells=9).distance((0, 0), (2, 2)) == 4
+
+def test_eta_model():
+    print("-" * 60)
+    print("ETA model test")
+    print("-" * 60)
+    from eta import mean_clipped
+    from mcts_policy import action_radius
+
+    env = Environment(grid_size=10, num_taxis=2, request_rate=0.0, seed=1)
+    model = env.eta_model
+    assert model.eta(0, 0, 1.0) == 0.0
+    first, later = model.factors(0, 1.0)
+    assert abs(first - 1 / 0.9) < 1e-9
+    assert model.factors(0, 1.01) is model.factors(0, 1.0)  # same level bin, cached
+    assert abs(model.eta(4, 0, 1.0) - (first + 3 * later)) < 1e-9
+    assert model.etas([0, 4], 0, 1.0).tolist() == [0.0, model.eta(4, 0, 1.0)]
+    # heavier traffic, slower first step; the morning peak slows later steps
+    assert model.eta(4, 0, 2.0) > model.eta(4, 0, 1.0)
+    assert model.factors(96, 1.0)[1] > model.factors(12, 1.0)[1]
+    assert abs(mean_clipped(1.5, 0.1) - 1.5) < 1e-9 and mean_clipped(0.8, 0.1) > 0.8
+
+    # reach is the distance budget a radius of 5 expected steps allows
+    for level in (0.8, 1.0, 2.0):
+        radius = model.reach(5, 0, level)
+        assert model.eta(radius, 0, level) <= 5 < model.eta(radius + 1, 0, level)
+    assert model.reach(5, 0, 2.0) < 5
+    state = env.create_initial_state()
+    state.traffic_level = 2.0
+    assert action_radius(state, env) == 5 and action_radius(state, env, traffic_aware=True) == 4
+
+    # a mean trip time the ETA model expects, measured on Environment
+    trips = []
+    for trial in range(300):
+        env.reseed(trial)
+        state = State([Taxi(0, (0, 0)), Taxi(1, (9, 9))], [Request(0, (0, 8), (1, 8), 0)], 0, 1.0)
+        state = env.step(state, [Action(0, "assign", target=state.requests[0]), Action(1, "idle")])
+        steps = 1
+        while state.taxis[0].status == "en_route_to_pickup":
+            state = env.step(state, [Action(0, "idle"), Action(1, "idle")])
+            steps += 1
+        trips.append(steps)
+    expected = model.eta(8, 0, 1.0) + 1  # the pickup registers the step after the last move
+    print(f"  8 road steps: {np.mean(trips):.2f} measured, {expected:.2f} expected")
+    assert abs(np.mean(trips) - expected) < 4 * np.std(trips) / np.sqrt(len(trips))
+
+def test_request_queue():
+    print("-" * 60)
+    print("Request queue test")
+    print("-" * 60)
+    from request_queue import RequestQueue
+    from greedy_policy import GreedyPolicy, GreedyConfiguration
+
+    queue = RequestQueue(Request(i, (0, i), (1, i), i // 2) for i in range(6))
+    removed = queue.remove(2)
+    assert removed.id == 2 and queue.remove(2) is None
+    assert len(queue) == 5 and [r.id for r in queue] == [0, 1, 3, 4, 5]
+    assert queue[2].id == 3 and [r.id for r in queue[-2:]] == [4, 5]
+    assert queue.get(4).origin == (0, 4) and queue.get(2) is None
+    assert queue[0] in queue and Request(0, (0, 0), (1, 0), 0) not in queue
+    assert [r.id for r in reversed(queue)] == [5, 4, 3, 1, 0]
+    slots = list(queue._slots)
+    assert queue[2].id == 3 and queue[1:3] == [queue.get(1), queue.get(3)]
+    assert queue._slots == slots  # reads leave the tombstones alone
+    extended = queue.copy()
+    extended.extend([Request(6, (0, 6), (1, 6), 3), Request(7, (0, 7), (1, 7), 3)])
+    assert [r.id for r in extended] == [0, 1, 3, 4, 5, 6, 7] and len(queue) == 5
+    copy = queue.copy()
+    copy.remove(0)
+    assert len(queue) == 5 and len(copy) == 4
+
+    # tombstones are compacted away once they outnumber the requests
+    big = RequestQueue(Request(i, (0, 0), (1, 1), i) for i in range(100))
+    for i in range(90):
+        big.remove(i)
+    assert len(big._slots) < 50 and [r.id for r in big] == list(range(90, 100))
+
+    # out of arrival order falls back to a stable sort on waiting time
+    late = Request(7, (0, 0), (1, 1), 0)
+    late.waiting_time = 10
+    queue.append(late)
+    assert [r.id for r in queue.by_waiting_time()][0] == 7
+
+    # states take plain lists, and stepping keeps a queue in arrival order
+    env = Environment(grid_size=10, num_taxis=4, request_rate=2.0, cancellation_prob=0.1, seed=2)
+    policy = GreedyPolicy(GreedyConfiguration(), env)
+    state = env.create_initial_state()
+    assert isinstance(state.requests, RequestQueue)
+    for _ in range(40):
+        parent_ids = [r.id for r in state.requests]
+        next_state = env.step(state, policy.selectAction(state))
+        assert [r.id for r in state.requests] == parent_ids  # parent untouched
+        info = env.get_last_step_info()
+        gone = set(info["picked_up_requests"]) | set(info["cancelled_requests"])
+        assert not gone & {r.id for r in next_state.requests}
+        waits = [r.waiting_time for r in next_state.requests]
+        assert waits == sorted(waits, reverse=True)
+        assert next_state.requests.by_waiting_time() == list(next_state.requests)
+        state = next_state
+    print(f"  {len(state.requests)} requests waiting after 40 steps")
+
+def test_vectorized_request_update():
+    print("-" * 60)
+    print("Vectorized request update test")
+    print("-" * 60)
+    from crn import RandomTrace, TraceEnvironment
+    from greedy_policy import GreedyPolicy, GreedyConfiguration
+
+    # on a random trace both paths read the same draws, so they agree exactly
+    args = dict(grid_size=10, num_taxis=3, request_rate=3.0, cancellation_prob=0.05)
+    trace = RandomTrace(Environment(**args), 60, seed=4)
+    runs = []
+    for vector_min in (None, 1):
+        env = TraceEnvironment(trace, seed=4, **args)
+        env.vector_min_requests = vector_min
+        policy = GreedyPolicy(GreedyConfiguration(), env)
+        state = env.create_initial_state()
+        log = []
+        for _ in range(80):  # past the trace horizon too
+            state = env.step(state, policy.selectAction(state))
+            log.append((env.get_last_step_info()["cancelled_requests"],
+                        [(r.id, r.waiting_time) for r in state.requests]))
+        runs.append(log)
+    assert runs[0] == runs[1]
+    print(f"  {sum(len(c) for c, _ in runs[0])} identical cancellations")
+
+    # the bulk draws cancel at the hazard min(p + 0.01 w, 0.5)
+    env = Environment(grid_size=10, num_taxis=1, request_rate=0.0, cancellation_prob=0.05, seed=1)
+    env.vector_min_requests = 1
+    state = env.create_initial_state()
+    state.requests = [Request(i, (0, 0), (1, 1), 0) for i in range(20000)]
+    parent = state
+    state = env.step(state, [])
+    cancelled = env.get_last_step_info()["cancelled_requests"]
+    assert abs(len(cancelled) / 20000 - 0.06) < 0.01
+    assert cancelled == sorted(cancelled) and not set(cancelled) & {r.id for r in state.requests}
+    assert all(r.waiting_time == 1 for r in state.requests)
+    assert all(r.waiting_time == 0 for r in parent.requests)  # parent untouched
+
+def test_benchmarks():
+    print("-" * 60)
+    print("Benchmark suite test")
+    print("-" * 60)
+    import os
+    import tempfile
+    from benchmarks import bench_env_step, bench_greedy, bench_mcts, bench_run_many, compare, save, load
+
+    results = (bench_env_step(10, 3, 1.0, steps=20, repeat=1) + bench_greedy(10, 3, 50, calls=2, repeat=1)
+               + bench_mcts(10, 3, iterations=10, repeat=1) + bench_run_many(10, 3, episodes=1, max_steps=10))
+    assert [r["metric"] for r in results] == ["steps_per_sec", "ms_per_call", "iterations_per_sec",
+                                              "bytes_per_node", "episodes_per_sec"]
+    assert all(r["value"] > 0 for r in results)
+
+    path = os.path.join(tempfile.mkdtemp(), "baseline.json")
+    save(results, path)
+    assert load(path) == results
+    assert not any(row["regressed"] for row in compare(results, load(path)))
+
+    # half the throughput or twice the latency is a regression either way
+    slower = [dict(r, value=r["value"] / 2 if r["higher_is_better"] else r["value"] * 2) for r in results]
+    rows = compare(slower, results, tolerance=0.2)
+    assert len(rows) == len(results) and all(row["regressed"] for row in rows)
+    assert abs(rows[0]["change"] + 0.5) < 1e-9
+
+def test_slotted_types():
+    print("-" * 60)
+    print("Slotted types test")
+    print("-" * 60)
+    import pickle
+    from environment import IDLE, EN_ROUTE_TO_PICKUP
+    from mcts_policy import MCTSNode
+
+    taxi, request = Taxi(0, (1, 1)), Request(3, (0, 0), (2, 2), 0)
+    for obj in (taxi, request, Action(0, "idle"), State([taxi], [request], 0), MCTSNode(None)):
+        assert not hasattr(obj, "__dict__")
+    try:
+        taxi.colour = "yellow"
+        assert False, "slotted taxi took a new attribute"
+    except AttributeError:
+        pass
+
+    # statuses stay comparable with plain strings
+    assert taxi.status == "idle" and taxi.status is IDLE
+    env = Environment(grid_size=5, num_taxis=1, request_rate=0, seed=0)
+    state = env.step(State([taxi], [request], 0), [Action(0, "assign", target=request)])
+    assert state.taxis[0].status == "en_route_to_pickup" == EN_ROUTE_TO_PICKUP
+
+    # and survive pickling for the process pools
+    copy = pickle.loads(pickle.dumps(state))
+    assert copy.taxis[0].status == EN_ROUTE_TO_PICKUP
+    assert [r.id for r in copy.requests] == [3] and copy.taxis[0].assigned_request.id == 3
+
 if __name__ == "__main__":
     test_basic_simulation()
     test_state_transition()
-    test_observation_model()
\ No newline at end of file
+    test_observation_model()
+    test_array_state()
+    test_copy_on_write()
+    test_spatial_index()
+    test_batch_environment()
+    test_seeded_parallel_runs()
+    test_common_random_numbers()
+    test_demand_trace()
+    test_event_simulation()
+    test_event_simulation_metrics()
+    test_road_network()
+    test_eta_model()
+    test_request_queue()
+    test_vectorized_request_update()
+    test_benchmarks()
+    test_slotted_types()
@@ -0,0 +1,54 @@
+# test_matching_policy.py
+import itertools
+import numpy as np
+from environment import *
+from matching_policy import *
+
+
+def test_linear_sum_assignment():
+    print("-" * 60)
+    print("Min-cost assignment test")
+    print("-" * 60)
+
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        n, m = (int(x) for x in rng.integers(1, 5, 2))
+        cost = rng.integers(-5, 20, (n, m)).astype(float)
+        rows, cols = linearSumAssignment(cost)
+
+        if n <= m:
+            best = min(sum(cost[i, p[i]] for i in range(n)) for p in itertools.permutations(range(m), n))
+        else:
+            best = min(sum(cost[p[j], j] for j in range(m)) for p in itertools.permutations(range(n), m))
+        assert len(rows) == min(n, m)
+        assert abs(cost[rows, cols].sum() - best) < 1e-9
+
+
+def test_matching_policy():
+    print("\n" + "-" * 60)
+    print("Matching policy test")
+    print("-" * 60)
+
+    env = Environment(grid_size=10, num_taxis=2, request_rate=0)
+    taxis = [Taxi(0, (0, 0)), Taxi(1, (9, 9))]
+    requests = [Request(0, (8, 9), (0, 0), arrival_time=0),
+                Request(1, (1, 0), (5, 5), arrival_time=0),
+                Request(2, (5, 5), (0, 9), arrival_time=0)]
+    state = State(taxis, requests, time=0)
+
+    cfg = MatchingConfiguration()
+    cfg.useScipy = False
+    actions = MatchingPolicy(cfg, env).selectAction(state)
+    print(f"  Actions: {actions}")
+    assert actions[0].target is requests[1]
+    assert actions[1].target is requests[0]
+
+    # nothing within the radius: both taxis stay idle
+    cfg.maxRadius = 0
+    actions = MatchingPolicy(cfg, env).selectAction(state)
+    assert [a.action_type for a in actions] == ["idle", "idle"]
+
+
+if __name__ == "__main__":
+    test_linear_sum_assignment()
+    test_matching_policy()
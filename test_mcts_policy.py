@@ -0,0 +1,459 @@
+# test_mcts_policy.py
+from environment import *
+from mcts_policy import *
+
+
+def make_state():
+    taxis = [Taxi(0, (0, 0)), Taxi(1, (4, 4))]
+    requests = [Request(0, (1, 1), (3, 3), arrival_time=0),
+                Request(1, (4, 3), (0, 0), arrival_time=0)]
+    return State(taxis, requests, time=0)
+
+
+class PickleCountingEnvironment(Environment):
+    # counts how often the environment is pickled for the worker pool
+    pickles = 0
+
+    def __getstate__(self):
+        PickleCountingEnvironment.pickles += 1
+        return self.__dict__.copy()
+
+
+def test_root_parallel():
+    print("-" * 60)
+    print("Root-parallel MCTS test")
+    print("-" * 60)
+
+    env = Environment(grid_size=5, num_taxis=2, request_rate=0.5)
+    state = make_state()
+
+    # keys survive a round trip and resolve to the live request objects
+    joint = [Action(0, "assign", target=state.requests[1]), Action(1, "idle")]
+    rebuilt = action_from_key(state, action_key(joint))
+    assert rebuilt[0].target is state.requests[1]
+
+    merged = merge_statistics([{("a",): [2, 4.0]}, {("a",): [1, -1.0], ("b",): [1, 2.0]}])
+    assert merged == {("a",): [3, 3.0], ("b",): [1, 2.0]}
+    assert best_key(merged) == ("b",)
+
+    policy = MCTSPolicy(env, iterations=20, workers=2, seed=0)
+    try:
+        action = policy.selectAction(state)
+    finally:
+        policy.close()
+    print(f"  Chosen joint action: {action}")
+    assert len(action) == 2
+    for a in action:
+        assert a.target is None or a.target in state.requests
+
+    # the environment goes to each worker once, later decisions only send
+    # the state and the request counter
+    env = PickleCountingEnvironment(grid_size=5, num_taxis=2, request_rate=0.5, seed=0)
+    policy = MCTSPolicy(env, iterations=20, workers=2, seed=0)
+    state = env.create_initial_state()
+    try:
+        for _ in range(4):
+            state = env.step(state, policy.selectAction(state))
+    finally:
+        policy.close()
+    print(f"  Environment pickled {PickleCountingEnvironment.pickles} times in 4 decisions")
+    assert PickleCountingEnvironment.pickles <= 2
+
+
+def test_time_budget():
+    print("\n" + "-" * 60)
+    print("Anytime MCTS test")
+    print("-" * 60)
+
+    env = Environment(grid_size=5, num_taxis=2, request_rate=0.5)
+    policy = MCTSPolicy(env, iterations=None, time_limit=0.02)
+    action = policy.selectAction(make_state())
+    stats = policy.last_stats
+    print(f"  Stats: {stats}")
+    assert len(action) == 2
+    assert stats["iterations"] >= 1
+    assert stats["nodes"] <= stats["iterations"] + 1
+    assert stats["elapsed"] < 1.0
+
+    # iteration cap still wins when it runs out first
+    policy = MCTSPolicy(env, iterations=5, time_limit=10.0)
+    policy.selectAction(make_state())
+    assert policy.last_stats["iterations"] == 5
+
+
+def test_tree_reuse():
+    print("\n" + "-" * 60)
+    print("Tree reuse test")
+    print("-" * 60)
+
+    state = make_state()
+    node = MCTSNode(state)
+    node.visits = 7
+
+    # a state with different taxis does not match
+    other = make_state()
+    other.taxis[1].position = (3, 4)
+    assert reroot(node, other) is None
+
+    same = make_state()
+    assert reroot(node, same) is node
+    assert node.state is same and node.parent is None
+
+    # different pending requests do, the actions are listed again
+    node.untried_actions = []
+    other = make_state()
+    other.requests = other.requests[:1]
+    assert reroot(node, other) is node and node.untried_actions is None
+
+    env = Environment(grid_size=5, num_taxis=2, request_rate=0)
+    policy = MCTSPolicy(env, iterations=10, reuse_tree=True)
+    state = make_state()
+    policy.selectAction(state)
+    assert policy._kept is not None
+    assert policy.last_stats["reused_visits"] == 0
+
+    # with arrivals the real next state has other new requests than the
+    # sampled one, the kept tree is still re-rooted on it
+    random.seed(0)
+    env = Environment(grid_size=5, num_taxis=2, request_rate=2.0, seed=1)
+    policy = MCTSPolicy(env, iterations=30, reuse_tree=True, seed=0)
+    state = make_state()
+    action = policy.selectAction(state)
+    kept = policy._kept
+    state = env.step(state, action)
+    assert state_key(state) != state_key(kept.state)
+    policy.selectAction(state)
+    assert policy.last_stats["reused_visits"] > 0
+    pending = {req.id for req in state.requests}
+    for child in kept.children:
+        assert all(a.target is None or a.target.id in pending for a in child.action)
+
+
+def test_factored_actions():
+    print("\n" + "-" * 60)
+    print("Factored action space test")
+    print("-" * 60)
+
+    state = make_state()
+    options = get_taxi_options(state, max_distance=8)
+    assert [tid for tid, _ in options] == [0, 1]
+    assert all(opts[0] is None for _, opts in options)
+
+    # two taxis on the same request: the second one falls back to idle
+    picks = [options[0][1].index(state.requests[0]), options[1][1].index(state.requests[0])]
+    joint, choices = compose_joint_action(state, options, picks)
+    assert joint[0].action_type == "assign" and joint[1].action_type == "idle"
+    assert choices[1] == (1, 0)
+
+    # both taxis can be assigned in one joint action
+    picks = [options[0][1].index(state.requests[0]), options[1][1].index(state.requests[1])]
+    joint, _ = compose_joint_action(state, options, picks)
+    assert [a.action_type for a in joint] == ["assign", "assign"]
+
+    env = Environment(grid_size=5, num_taxis=2, request_rate=0.5)
+    policy = MCTSPolicy(env, iterations=30, action_space="factored")
+    action = policy.selectAction(state)
+    print(f"  Chosen joint action: {action}")
+    assert len(action) == 2
+
+
+def test_fast_rollout():
+    print("\n" + "-" * 60)
+    print("Fast rollout test")
+    print("-" * 60)
+
+    from fast_rollout import RolloutSimulator, greedy_rollout_policy
+
+    env = Environment(grid_size=5, num_taxis=2, request_rate=0)
+    cfg = env.reward_config
+
+    # taxi 0 is about to drop off, nothing else can happen
+    taxi = Taxi(0, (2, 2))
+    taxi.status = "occupied"
+    taxi.assigned_request = Request(7, (0, 0), (2, 2), arrival_time=0)
+    taxi.destination = (2, 2)
+    state = State([taxi, Taxi(1, (4, 4))], [], time=0)
+
+    sim = RolloutSimulator(env)
+    reward, steps = sim.run(state, greedy_rollout_policy, depth=3)
+    expected = cfg.profitPerRide - 6 * cfg.idlePenaltyPerStep
+    assert steps == 3
+    assert abs(reward - expected) < 1e-9
+    # the state itself is left alone
+    assert state.taxis[0].status == "occupied"
+
+    policy = MCTSPolicy(env, iterations=20, rollout_policy="greedy")
+    action = policy.selectAction(make_state())
+    assert len(action) == 2
+    assert policy.last_stats["rollout_steps"] == 15 * policy.last_stats["rollouts"]
+
+
+def test_profiling():
+    print("-" * 60)
+    print("Profiling test")
+    import json
+    import os
+    import tempfile
+    import profiling
+    from experiments import runMany
+    from greedy_policy import GreedyPolicy, GreedyConfiguration
+
+    # disabled, every phase is the shared no-op
+    assert profiling.PROFILER is None
+    assert profiling.laps("env") is profiling._no_lap
+
+    env = Environment(grid_size=5, num_taxis=2, request_rate=0.5, seed=1)
+    profiler = profiling.enable()
+    try:
+        state = env.create_initial_state()
+        for _ in range(4):
+            state = env.step(state, [Action(0, "idle"), Action(1, "idle")])
+        policy = MCTSPolicy(env, iterations=10, seed=1)
+        policy.selectAction(make_state())
+    finally:
+        summary = profiling.disable()
+    assert profiling.PROFILER is None
+
+    phases, counters = summary["phases"], summary["counters"]
+    # expansion steps the environment too, for every child it creates
+    assert phases["env.copy_state"]["calls"] > 4 + counters["mcts.rollout_steps"]
+    assert phases["mcts.rollout"]["calls"] == phases["mcts.backpropagate"]["calls"] == 10
+    assert counters["mcts.nodes"] == policy.last_stats["nodes"]
+    assert counters["mcts.rollout_steps"] == policy.last_stats["rollout_steps"]
+    assert all(entry["total_ns"] >= 0 for entry in phases.values())
+    print(f"  {len(phases)} phases, {counters}")
+
+    # runMany writes its summary as json
+    path = os.path.join(tempfile.mkdtemp(), "profile.json")
+    runMany(lambda: Environment(grid_size=5, num_taxis=2, request_rate=0.5),
+            lambda e: GreedyPolicy(GreedyConfiguration(), e), 2, 10, profilePath=path)
+    with open(path) as f:
+        written = json.load(f)
+    assert written["phases"]["env.update_requests"]["calls"] == 20
+    assert profiling.PROFILER is None
+
+
+def test_flat_tree():
+    print("-" * 60)
+    print("Flat tree test")
+    from mcts_tree import FlatTree, StateCache, ROOT, NO_TAXI
+
+    # vectorized UCB picks what ucb_score picks over MCTSNode children
+    tree = FlatTree(capacity=2)
+    first = tree.expand(ROOT, [(NO_TAXI, -1), (0, 1), (1, 0)], [1, 2, 3])
+    assert len(tree) == 4 and list(tree.children(ROOT)) == [1, 2, 3]
+    tree.backpropagate([ROOT, first], 1.0)
+    assert tree.ucb_child(ROOT) == 2  # unvisited first
+    tree.backpropagate([ROOT, 2], 5.0)
+    tree.backpropagate([ROOT, 3], 2.0)
+    parent = MCTSNode(None)
+    parent.visits = 3
+    nodes = []
+    for i in tree.children(ROOT):
+        node = MCTSNode(None)
+        node.visits, node.value = int(tree.visits[i]), float(tree.value[i])
+        nodes.append(node)
+    expected = max(range(3), key=lambda k: ucb_score(parent, nodes[k]))
+    assert tree.ucb_child(ROOT) == first + expected
+    assert tree.best_child() == 2
+
+    cache = StateCache(2)
+    for node in (1, 2, 3):
+        cache.put(node, node * 10)
+    assert cache.get(1) is None and cache.get(3) == 30
+
+    # without a cache every node is re-simulated, and comes out the same
+    env = Environment(grid_size=5, num_taxis=2, request_rate=0.5, seed=3)
+    state = make_state()
+    random.seed(0)
+    tree = search(state, env, 60, tree="flat", state_cache=0)
+    node = int(np.argmax(tree.counter))
+    path = []
+    while node != ROOT:
+        path.append(node)
+        node = int(tree.parent[node])
+    replays = []
+    for _ in range(2):
+        current = state
+        for node in reversed(path):
+            current = flat_child_state(tree, StateCache(0), env, node, current)
+        replays.append(([(t.position, t.status) for t in current.taxis],
+                        [(r.id, r.origin, r.waiting_time) for r in current.requests]))
+    assert len(path) > 1 and replays[0] == replays[1]
+    print(f"  {len(tree)} nodes in {tree.nbytes()} bytes, depth {len(path)}")
+
+    policy = MCTSPolicy(env, iterations=40, tree="flat", seed=0)
+    action = policy.selectAction(state)
+    assert len(action) == 2 and policy.last_stats["iterations"] == 40
+    for a in action:
+        assert a.target is None or a.target in state.requests
+
+    policy = MCTSPolicy(env, iterations=20, workers=2, seed=0, tree="flat")
+    try:
+        action = policy.selectAction(state)
+    finally:
+        policy.close()
+    assert all(a.target is None or a.target in state.requests for a in action)
+
+
+def test_transpositions():
+    print("-" * 60)
+    print("Transposition table test")
+    print("-" * 60)
+    from zobrist import ZobristHasher, TranspositionTable
+
+    # the hash carried through step matches hashing the state from scratch
+    env = Environment(grid_size=6, num_taxis=3, request_rate=1.0, cancellation_prob=0.1, seed=1)
+    state = env.create_initial_state()
+    env.state_hash(state)
+    for t in range(40):
+        actions = [Action(i, "idle") for i in range(3)]
+        if state.requests:
+            actions[t % 3] = Action(t % 3, "assign", state.requests[0])
+        state = env.step(state, actions)
+        assert state.zobrist == env.state_hasher.state_hash(state)
+
+    # which taxi is where does not matter, what is where does
+    hasher = ZobristHasher()
+    a = make_state()
+    b = State([Taxi(0, (4, 4)), Taxi(1, (0, 0))], list(a.requests), time=0)
+    c = State([Taxi(0, (4, 4)), Taxi(1, (4, 4))], list(a.requests), time=0)
+    assert hasher.state_hash(a) == hasher.state_hash(b) != hasher.state_hash(c)
+
+    # traffic and travel times shape the future, so they are part of the state
+    d = make_state()
+    d.traffic_level = 1.5
+    e = make_state()
+    e.taxis[0].remaining_travel_time = 3
+    assert len({hasher.state_hash(s) for s in (a, d, e)}) == 3
+
+    table = TranspositionTable(capacity=2)
+    table.entry(1)[0] += 1
+    table.entry(2)
+    table.get(1)
+    table.entry(3)
+    assert len(table) == 2 and table.get(2) is None and table.get(1) == [1, 0.0]
+
+    # with no new requests many joint actions lead to the same state
+    env = Environment(grid_size=8, num_taxis=4, request_rate=0.0, seed=3)
+    state = State([Taxi(i, (i, 0)) for i in range(4)],
+                  [Request(i, (i, i), (0, 7), arrival_time=0) for i in range(4)], time=0)
+    stats = new_search_stats()
+    random.seed(0)
+    tree = search(state, env, 200, stats=stats, tree="flat", transpositions=1000)
+    assert stats["transpositions"] > 0
+    assert stats["rollouts"] + stats["transpositions"] == stats["iterations"]
+    print(f"  {stats['transpositions']} of {stats['iterations']} iterations hit a known state")
+
+    policy = MCTSPolicy(env, iterations=30, seed=0, transpositions=1000)
+    action = policy.selectAction(state)
+    assert len(action) == 4 and policy.last_stats["iterations"] == 30
+
+
+def test_progressive_widening():
+    print("-" * 60)
+    print("Progressive widening test")
+    print("-" * 60)
+
+    # closest, longest waiting requests first, the all-idle action last
+    state = State([Taxi(0, (0, 0)), Taxi(1, (4, 4))],
+                  [Request(0, (2, 2), (3, 3), arrival_time=0), Request(1, (1, 0), (0, 4), arrival_time=0),
+                   Request(2, (3, 4), (0, 0), arrival_time=0)], time=3)
+    state.requests[0].waiting_time = 3
+    ranked = [(taxi.id, req.id) for taxi, req in ranked_assignments(state, max_distance=8)]
+    assert ranked == [(0, 0), (0, 1), (1, 0), (1, 2), (0, 2), (1, 1)]  # ties in legal order
+    actions = ranked_legal_actions(state, max_distance=8, max_children=3)
+    assert len(actions) == 3 and all(a.action_type == "idle" for a in actions[-1])
+    assert actions[0][0].target.id == 0 and actions[0][1].action_type == "idle"
+
+    assert [widening_limit(n, 0.5) for n in (0, 1, 3, 4, 9)] == [1, 2, 2, 3, 4]
+
+    # a surge: many assignments, children admitted as visits grow
+    env = Environment(grid_size=10, num_taxis=6, request_rate=8.0, seed=2)
+    state = env.create_initial_state()
+    for _ in range(3):
+        state = env.step(state, [Action(i, "idle") for i in range(6)])
+    random.seed(0)
+    root = search(state, env, 100, widening=0.5, max_children=10)
+    assert 1 < len(root.children) <= widening_limit(root.visits, 0.5)
+    assert len(root.children) + len(root.untried_actions) <= 10
+    print(f"  root: {len(root.children)} children after {root.visits} visits")
+
+    random.seed(0)
+    tree = search(state, env, 100, tree="flat", widening=0.5, max_children=10)
+    visited = [i for i in tree.children(0) if tree.visits[i] > 0]
+    assert tree.num_children[0] == 10 and visited == list(range(1, len(visited) + 1))
+    assert len(visited) <= widening_limit(tree.visits[0], 0.5)
+
+    try:
+        search(state, env, 10, action_space="factored", widening=0.5)
+        assert False, "factored search accepted widening"
+    except ValueError:
+        pass
+
+    policy = MCTSPolicy(env, iterations=30, seed=0, widening=0.5, max_children=8)
+    action = policy.selectAction(state)
+    assert len(action) == 6
+    assert all(a.target is None or a.target in state.requests for a in action)
+
+
+def test_leaf_parallel_rollouts():
+    print("-" * 60)
+    print("Leaf-parallel rollout test")
+    print("-" * 60)
+    from batch_rollout import BatchRollout, BATCH_ROLLOUT_POLICIES
+    from fast_rollout import RolloutSimulator, ROLLOUT_POLICIES
+
+    env = Environment(grid_size=10, num_taxis=4, request_rate=1.0, cancellation_prob=0.05, seed=4)
+    state = env.create_initial_state()
+    for _ in range(4):
+        state = env.step(state, [Action(i, "idle") for i in range(4)])
+    state = env.step(state, [Action(0, "assign", state.requests[0])] + [Action(i, "idle") for i in range(1, 4)])
+
+    # every copy starts as the state, served requests get a slot of their own
+    batch = BatchRollout(env, 3, np.random.default_rng(0))
+    batch.load(state, extra_slots=5)
+    queued = len(state.requests)
+    assert batch.req_active.shape == (3, queued + 5 + (state.taxis[0].status == "occupied"))
+    assert batch.req_active[:, :queued].all() and not batch.req_active[:, queued:].any()
+    assert (batch.taxi_pos[2] == [t.position for t in state.taxis]).all()
+
+    # the batch rolls out like the single-state simulator, on average
+    totals = BatchRollout(env, 2000, np.random.default_rng(1)).run(state, BATCH_ROLLOUT_POLICIES["greedy"])
+    simulator = RolloutSimulator(env, np.random.default_rng(2))
+    singles = np.array([simulator.run(state, ROLLOUT_POLICIES["greedy"])[0] for _ in range(2000)])
+    error = np.sqrt(totals.var() / 2000 + singles.var() / 2000)
+    assert abs(totals.mean() - singles.mean()) < 4 * error
+    print(f"  batch mean {totals.mean():.1f}, single mean {singles.mean():.1f} +- {error:.1f}")
+
+    # each leaf counts as K visits
+    for kind in ("object", "flat"):
+        random.seed(0)
+        stats = new_search_stats()
+        tree = search(state, env, 20, stats=stats, tree=kind, leaf_rollouts=8)
+        visits = tree.visits if kind == "object" else int(tree.visits[0])
+        assert stats["rollouts"] == 160 and visits == 160 and stats["leaf_batches"] == 20
+    assert finish_search_stats(stats, 1.0)["mean_leaf_variance"] > 0
+
+    try:
+        search(state, env, 10, action_space="factored", leaf_rollouts=8)
+        assert False, "factored search accepted leaf_rollouts"
+    except ValueError:
+        pass
+
+    policy = MCTSPolicy(env, iterations=10, seed=0, leaf_rollouts=16, rollout_policy="greedy")
+    action = policy.selectAction(state)
+    assert len(action) == 4 and policy.last_stats["rollouts"] == 160
+
+
+if __name__ == "__main__":
+    test_root_parallel()
+    test_time_budget()
+    test_tree_reuse()
+    test_factored_actions()
+    test_fast_rollout()
+    test_profiling()
+    test_flat_tree()
+    test_transpositions()
+    test_progressive_widening()
+    test_leaf_parallel_rollouts()
@@ -0,0 +1,135 @@
+# traces.py
+# pre-generated or imported demand: one row per request with its arrival
+# time, origin and destination, stored column by column as .npy files that
+# are memory-mapped on load, so Environment(demand_trace=...) can stream
+# requests by time window without sampling them
+
+import os
+import numpy as np
+
+COLUMNS = ("arrival", "origin", "destination")
+DAY_STEPS = 288  # period of Environment._demand_multiplier
+
+
+class DemandTrace:
+    # rows are sorted by arrival time; origin and destination are (n, 2)
+    # saved traces are already sorted, loading them skips the check so the
+    # columns are not read in full
+    def __init__(self, arrival, origin, destination, sort=True):
+        arrival = np.asanyarray(arrival)
+        origin = np.asanyarray(origin).reshape(-1, 2)
+        destination = np.asanyarray(destination).reshape(-1, 2)
+        if not (len(arrival) == len(origin) == len(destination)):
+            raise ValueError("arrival, origin and destination need the same number of rows")
+        if sort and len(arrival) > 1 and (np.diff(arrival) < 0).any():
+            order = np.argsort(arrival, kind="stable")
+            arrival, origin, destination = arrival[order], origin[order], destination[order]
+        self.arrival = arrival
+        self.origin = origin
+        self.destination = destination
+        self._offsets = None
+
+    def __len__(self):
+        return len(self.arrival)
+
+    @property
+    def horizon(self):
+        # first time step without any more arrivals
+        return int(self.arrival[-1]) + 1 if len(self.arrival) else 0
+
+    def rows(self, start, stop):
+        # row range of the requests arriving in [start, stop)
+        if self._offsets is None:
+            # first row of every time step, one searchsorted for the whole trace
+            steps = np.arange(self.horizon + 1, dtype=self.arrival.dtype)
+            self._offsets = np.searchsorted(self.arrival, steps, side="left").tolist()
+        last_step = len(self._offsets) - 1
+        start = min(max(start, 0), last_step)
+        stop = min(max(stop, start), last_step)
+        return self._offsets[start], self._offsets[stop]
+
+    def trips(self, start, stop=None):
+        # [(origin, destination)] arriving in [start, stop), in file order
+        first, last = self.rows(start, start + 1 if stop is None else stop)
+        if first == last:
+            return []
+        origins = map(tuple, self.origin[first:last].tolist())
+        destinations = map(tuple, self.destination[first:last].tolist())
+        return list(zip(origins, destinations))
+
+    def save(self, path):
+        # one <column>.npy per column in the directory path
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "arrival.npy"), np.ascontiguousarray(self.arrival))
+        np.save(os.path.join(path, "origin.npy"), np.ascontiguousarray(self.origin))
+        np.save(os.path.join(path, "destination.npy"), np.ascontiguousarray(self.destination))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        # columns stay on disk and are paged in as windows are read
+        mode = "r" if mmap else None
+        columns = [np.load(os.path.join(path, name + ".npy"), mmap_mode=mode) for name in COLUMNS]
+        return cls(*columns, sort=False)
+
+
+def generate_demand(env, horizon, seed=None):
+    # the arrival process of Environment._new_trips for horizon steps, drawn
+    # in bulk: poisson counts per step, uniform cells, and origin == destination
+    # redrawn like the rejection loop does
+    rng = np.random.default_rng(seed)
+    day = np.array([env.request_rate * env._demand_multiplier(t) for t in range(DAY_STEPS)])
+    rates = np.resize(day, horizon)
+    counts = rng.poisson(rates)
+    total = int(counts.sum())
+
+    dtype = _cell_dtype(env.grid_size)
+    arrival = np.repeat(np.arange(horizon, dtype=np.int32), counts)
+    origin = rng.integers(0, env.grid_size, (total, 2), dtype=dtype)
+    destination = rng.integers(0, env.grid_size, (total, 2), dtype=dtype)
+    same = (origin == destination).all(axis=1)
+    while same.any():
+        destination[same] = rng.integers(0, env.grid_size, (int(same.sum()), 2), dtype=dtype)
+        same = (origin == destination).all(axis=1)
+    return DemandTrace(arrival, origin, destination)
+
+
+def import_trip_log(path, grid_size, delimiter=","):
+    # csv trip log with a header and the columns
+    #   arrival_time, origin_x, origin_y, destination_x, destination_y
+    # in time steps and grid cells; trips off the grid or with
+    # origin == destination are dropped
+    data = np.loadtxt(path, delimiter=delimiter, skiprows=1, dtype=np.int64, ndmin=2)
+    arrival = data[:, 0]
+    origin = data[:, 1:3]
+    destination = data[:, 3:5]
+    keep = (((origin >= 0) & (origin < grid_size)).all(axis=1)
+            & ((destination >= 0) & (destination < grid_size)).all(axis=1)
+            & (origin != destination).any(axis=1) & (arrival >= 0))
+    dtype = _cell_dtype(grid_size)
+    return DemandTrace(arrival[keep].astype(np.int32), origin[keep].astype(dtype), destination[keep].astype(dtype))
+
+
+def _cell_dtype(grid_size):
+    return np.int16 if grid_size <= np.iinfo(np.int16).max else np.int32
+
+
+if __name__ == "__main__":
+    import argparse
+    from environment import Environment
+    from settings import GRID_SIZE, NUM_TAXIS, REQUEST_RATE, CANCELLATION_PROB
+
+    parser = argparse.ArgumentParser(description="write a demand trace directory")
+    parser.add_argument("path")
+    parser.add_argument("--horizon", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trip-log", help="import this csv trip log instead of generating")
+    args = parser.parse_args()
+
+    if args.trip_log:
+        trace = import_trip_log(args.trip_log, GRID_SIZE)
+    else:
+        env = Environment(grid_size=GRID_SIZE, num_taxis=NUM_TAXIS, request_rate=REQUEST_RATE,
+                          cancellation_prob=CANCELLATION_PROB)
+        trace = generate_demand(env, args.horizon, args.seed)
+    trace.save(args.path)
+    print(f"{len(trace)} requests over {trace.horizon} steps written to {args.path}")
@@ -0,0 +1,98 @@
+# zobrist.py
+# Zobrist-style state hash: the sum (mod 2^64) of one 64 bit key per
+# component of the state, so Environment.step can update it by taking out
+# the keys of what changed and adding the keys of what replaced it instead
+# of rehashing every taxi and request
+# components are what mcts_policy.state_key compares (taxi position, status
+# and assigned request, the pending request ids) plus what drives delays and
+# drop-off times: each taxi's remaining travel time, and the time step with
+# the traffic level rounded to TRAFFIC_RESOLUTION; taxi keys leave out the taxi id, so fleets that only differ by which taxi is
+# where hash alike (they have the same future), and summing rather than
+# XOR-ing keeps two identical taxis from cancelling out
+# keys come from a mixing function rather than tables since ids are
+# unbounded, and the salt is fixed so hashes agree across processes
+
+from collections import OrderedDict
+
+MASK = (1 << 64) - 1
+STATUS_CODES = {"idle": 0, "en_route_to_pickup": 1, "occupied": 2}
+TAXI, REQUEST, TIME = 1, 2, 3  # component kinds
+TRAFFIC_RESOLUTION = 0.05  # traffic levels closer than this hash alike (delay odds differ by < 0.5%)
+
+
+def mix(x):
+    # splitmix64 finalizer
+    x = (x + 0x9E3779B97F4A7C15) & MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK
+    return x ^ (x >> 31)
+
+
+class ZobristHasher:
+    def __init__(self, salt=0x5EED):
+        self.salt = salt
+
+    def key(self, *values):
+        h = self.salt
+        for value in values:
+            h = mix(h ^ (value & MASK))
+        return h
+
+    def taxi_key(self, taxi):
+        assigned = -1 if taxi.assigned_request is None else taxi.assigned_request.id
+        x, y = taxi.position
+        return self.key(TAXI, x, y, STATUS_CODES.get(taxi.status, 3), assigned, taxi.remaining_travel_time)
+
+    def request_key(self, request_id):
+        return self.key(REQUEST, request_id)
+
+    def clock_key(self, time, traffic_level):
+        return self.key(TIME, time, round(traffic_level / TRAFFIC_RESOLUTION))
+
+    def state_hash(self, state):
+        h = self.clock_key(state.time, state.traffic_level)
+        for taxi in state.taxis:
+            h += self.taxi_key(taxi)
+        for request in state.requests:
+            h += self.request_key(request.id)
+        return h & MASK
+
+    def update(self, h, old_taxis, new_taxis, removed_ids, added_ids, old_clock, new_clock):
+        # hash after replacing old_taxis by new_taxis, dropping removed_ids and
+        # adding added_ids to the pending requests, and moving the clock from
+        # old_clock to new_clock, (time, traffic_level) pairs
+        for taxi in old_taxis:
+            h -= self.taxi_key(taxi)
+        for taxi in new_taxis:
+            h += self.taxi_key(taxi)
+        for request_id in removed_ids:
+            h -= self.request_key(request_id)
+        for request_id in added_ids:
+            h += self.request_key(request_id)
+        return (h - self.clock_key(*old_clock) + self.clock_key(*new_clock)) & MASK
+
+
+class TranspositionTable:
+    # state hash -> [visits, value] shared by every tree node with that hash,
+    # the least recently used entry goes once capacity is exceeded
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def entry(self, key):
+        # existing entry or a fresh [0, 0.0]
+        entry = self.get(key)
+        if entry is None:
+            entry = self.entries[key] = [0, 0.0]
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        return entry